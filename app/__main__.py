@@ -470,24 +470,34 @@ def install_ollama_linux():
 
 def wait_for_server():
     """Wait for the server to be ready by checking the health endpoint"""
-    max_attempts = 30  # Wait up to 30 seconds
+    max_attempts = 30  # Wait up to 30 seconds for the socket
+    max_ready_attempts = 900  # Model download + warm-up can take a while on first run
     attempt = 0
+    server_up = False
     
     print("🔍 Checking if server is ready...")
     
-    while attempt < max_attempts:
+    while attempt < max_ready_attempts:
         try:
             response = requests.get(HEALTH_URL, timeout=1)
             if response.status_code == 200:
+                server_up = True
                 data = response.json()
-                print(f"✅ Server is ready! {data.get('status', '')}")
-                return True
+                asr = data.get("asr") or {}
+                if asr.get("ready", True) or asr.get("state") == "error":
+                    if asr.get("state") == "error":
+                        print(f"⚠️  ASR warm-up failed: {asr.get('error')}")
+                    print(f"✅ Server is ready! {data.get('status', '')}")
+                    return True
+                if attempt % 5 == 0:
+                    print(f"⏳ Server is up, ASR model is {asr.get('state', 'loading')}... ({attempt}s)")
         except (requests.exceptions.RequestException, requests.exceptions.Timeout):
-            pass
+            if attempt >= max_attempts:
+                break
         
         attempt += 1
         time.sleep(1)
-        if attempt % 5 == 0:  # Show progress every 5 seconds
+        if attempt % 5 == 0 and not server_up:  # Show progress every 5 seconds
             print(f"⏳ Waiting for server to start... ({attempt}s)")
     
     print("⚠️  Server startup timeout - browser will open anyway")
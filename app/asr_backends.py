@@ -0,0 +1,338 @@
+# app/asr_backends.py
+from __future__ import annotations
+
+import zlib
+from dataclasses import dataclass, field, replace
+from typing import List, Optional, Tuple
+
+import numpy as np
+import torch
+from transformers import LogitsProcessor, LogitsProcessorList, WhisperProcessor, WhisperForConditionalGeneration
+
+from .config import settings
+from .fast_decode import FastDecoder
+
+try:
+    from faster_whisper import WhisperModel as CT2WhisperModel
+except ImportError:
+    CT2WhisperModel = None
+
+SR = 16000
+PRECISIONS = ("fp32", "fp16", "bf16", "int8")
+
+
+@dataclass
+class DecodeOptions:
+    language: str
+    task: str = "transcribe"
+    num_beams: int = 1
+    timestamps: bool = False
+    # Øvre grense for nye tokens (None = modellens standard)
+    max_new_tokens: Optional[int] = None
+    # Bruk kompilert statisk dekoding hvis backenden har det (live-vinduer)
+    fast: bool = False
+    # Adaptiv beam search: dekod grådig først, og bare vinduer med lav
+    # gjennomsnittlig log-sannsynlighet eller høy kompresjonsrate på nytt med num_beams
+    adaptive: bool = False
+    logprob_threshold: float = -1.0
+    compression_threshold: float = 2.4
+
+
+@dataclass
+class Transcript:
+    text: str
+    # Tidsstemplede deler: {"text", "start", "end"} i sekunder fra starten av lyden
+    segments: List[dict] = field(default_factory=list)
+    # Konfidens (bare der backenden kan regne den ut)
+    avg_logprob: Optional[float] = None
+    compression_ratio: Optional[float] = None
+    # True når vinduet ble dekodet på nytt med beam search (adaptiv modus)
+    escalated: bool = False
+
+
+def compression_ratio(text: str) -> float:
+    """Som i Whisper: høy verdi betyr repeterende tekst (typisk hallusinasjon)."""
+    data = text.encode("utf-8")
+    return len(data) / len(zlib.compress(data)) if data else 0.0
+
+
+class _LogprobRecorder(LogitsProcessor):
+    """Summerer log-sannsynligheten til tokenet grådig dekoding velger, per rad."""
+
+    def __init__(self, eos_token_id: int):
+        self.eos_token_id = eos_token_id
+        self.total = None
+        self.count = None
+
+    def __call__(self, input_ids, scores):
+        if self.total is None:
+            self.total = torch.zeros(scores.shape[0], dtype=torch.float64, device=scores.device)
+            self.count = torch.zeros_like(self.total)
+        # Rader som allerede er ferdige fylles med eos og skal ikke telle med
+        active = (input_ids[:, -1] != self.eos_token_id).to(self.total.dtype)
+        best = torch.log_softmax(scores.float(), dim=-1).max(dim=-1).values
+        self.total += best.to(self.total.dtype) * active
+        self.count += active
+        return scores
+
+    def averages(self, n: int) -> List[Optional[float]]:
+        if self.total is None:
+            return [None] * n
+        return [(t / c) if c else None for t, c in zip(self.total.tolist(), self.count.tolist())]
+
+
+class ASRBackend:
+    """
+    Felles grensesnitt for ASR-motorer. En backend lastes én gang (via
+    modellregisteret) og transkriberer deretter lister av 16 kHz float32-arrays.
+    """
+
+    name = "base"
+
+    def __init__(self, model_id: str, device: str, precision: str):
+        self.model_id = model_id
+        self.device = device
+        self.precision = precision
+
+    @classmethod
+    def resolve_model_id(cls, model_id: str) -> str:
+        return model_id
+
+    @classmethod
+    def resolve_device(cls, device: str) -> str:
+        return device
+
+    @classmethod
+    def resolve_precision(cls, mode: Optional[str], device: str) -> str:
+        return "fp32"
+
+    def load(self) -> None:
+        raise NotImplementedError
+
+    def transcribe(self, audio: List[np.ndarray], options: DecodeOptions) -> List[Transcript]:
+        raise NotImplementedError
+
+    @property
+    def fast_decode_active(self) -> bool:
+        return False
+
+    @staticmethod
+    def needs_beam(result: Transcript, options: DecodeOptions) -> bool:
+        if not result.text:
+            return False
+        if result.avg_logprob is not None and result.avg_logprob < options.logprob_threshold:
+            return True
+        ratio = result.compression_ratio if result.compression_ratio is not None else compression_ratio(result.text)
+        return ratio > options.compression_threshold
+
+
+def adaptive_passes(options: DecodeOptions) -> Tuple[DecodeOptions, Optional[DecodeOptions]]:
+    """
+    Adaptiv beam search i to pass: (grådig pass, beam-pass). Bare vinduene
+    der ASRBackend.needs_beam() slår til etter første pass, dekodes på nytt
+    med options.num_beams. Uten adaptiv modus er det bare ett pass (None).
+    """
+    if not options.adaptive or options.num_beams <= 1:
+        return options, None
+    return replace(options, num_beams=1), replace(options, adaptive=False)
+
+
+class TransformersBackend(ASRBackend):
+    """Hugging Face transformers (WhisperForConditionalGeneration)."""
+
+    name = "transformers"
+    _TORCH_DTYPES = {"fp32": torch.float32, "fp16": torch.float16, "bf16": torch.bfloat16}
+
+    def __init__(self, model_id: str, device: str, precision: str):
+        super().__init__(model_id, device, precision)
+        self.processor = None
+        self.model = None
+        self._fast: Optional[FastDecoder] = None
+
+    @classmethod
+    def resolve_precision(cls, mode: Optional[str], device: str) -> str:
+        """
+        Oversetter ønsket presisjon til det enheten faktisk støtter.
+        fp16/bf16 brukes på GPU (bf16 også på CPU), int8 (dynamisk kvantisering
+        av lineærlagene) kun på CPU. Ikke-støttede valg faller tilbake med en advarsel.
+        """
+        mode = (mode or "fp32").strip().lower()
+        kind = device.split(":")[0]
+        if mode == "auto":
+            return {"cuda": "fp16", "mps": "fp16"}.get(kind, "int8")
+        if mode not in PRECISIONS:
+            print(f"[models] Ukjent presisjon '{mode}', bruker fp32.")
+            return "fp32"
+        if mode == "int8" and kind != "cpu":
+            fallback = "fp16" if kind in {"cuda", "mps"} else "fp32"
+            print(f"[models] int8 støttes bare på CPU, bruker {fallback} på '{device}'.")
+            return fallback
+        if mode == "fp16" and kind == "cpu":
+            print("[models] fp16 er tregt/ufullstendig på CPU, bruker bf16.")
+            return "bf16"
+        if mode == "bf16" and kind == "cuda" and not torch.cuda.is_bf16_supported():
+            print("[models] GPU-en støtter ikke bf16, bruker fp16.")
+            return "fp16"
+        return mode
+
+    def load(self) -> None:
+        self.processor = WhisperProcessor.from_pretrained(self.model_id)
+        if self.precision == "int8":
+            model = WhisperForConditionalGeneration.from_pretrained(self.model_id)
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        else:
+            model = WhisperForConditionalGeneration.from_pretrained(
+                self.model_id, torch_dtype=self._TORCH_DTYPES[self.precision]
+            ).to(self.device)
+        model.config.forced_decoder_ids = None  # Anbefalt for ren transkribering
+        model.eval()
+        self.model = model
+
+    def enable_fast_decode(self, max_new_tokens: int) -> None:
+        """Slår på kompilert dekoding (se fast_decode.py). Kompileringen skjer ved første kall."""
+        if self._fast is None or self._fast.max_new_tokens != max_new_tokens:
+            self._fast = FastDecoder(self.model, max_new_tokens)
+
+    @property
+    def fast_decode_active(self) -> bool:
+        return bool(self._fast and self._fast.enabled)
+
+    def transcribe(self, audio: List[np.ndarray], options: DecodeOptions) -> List[Transcript]:
+        input_features = self.processor(
+            list(audio), sampling_rate=SR, return_tensors="pt"
+        ).input_features.to(self.device, dtype=self.model.dtype)
+
+        gen_args = {"language": options.language, "task": options.task}
+        if options.num_beams > 1:
+            gen_args["num_beams"] = options.num_beams
+        if options.timestamps:
+            gen_args["return_timestamps"] = True
+        use_fast = options.fast and self._fast is not None
+        if options.max_new_tokens and not use_fast:
+            gen_args["max_new_tokens"] = options.max_new_tokens
+        generate = self._fast.generate if use_fast else self.model.generate
+        recorder = None
+        if options.adaptive and options.num_beams <= 1 and not use_fast:
+            # Konfidensen til grådig dekoding avgjør om vinduet må dekodes med beam search
+            eos = self.model.generation_config.eos_token_id
+            recorder = _LogprobRecorder(eos[0] if isinstance(eos, (list, tuple)) else eos)
+            gen_args["logits_processor"] = LogitsProcessorList([recorder])
+
+        with torch.inference_mode():
+            predicted_ids = generate(input_features, **gen_args)
+
+        logprobs = recorder.averages(len(predicted_ids)) if recorder else [None] * len(predicted_ids)
+        if not options.timestamps:
+            texts = self.processor.batch_decode(predicted_ids, skip_special_tokens=True)
+            return [
+                Transcript(text=t.strip(), avg_logprob=lp, compression_ratio=compression_ratio(t.strip()))
+                for t, lp in zip(texts, logprobs)
+            ]
+
+        out: List[Transcript] = []
+        for ids, lp in zip(predicted_ids, logprobs):
+            dec = self.processor.tokenizer.decode(ids, skip_special_tokens=True, output_offsets=True)
+            segments = [
+                {"text": o["text"].strip(), "start": o["timestamp"][0], "end": o["timestamp"][1]}
+                for o in dec["offsets"]
+            ]
+            text = dec["text"].strip()
+            out.append(Transcript(text=text, segments=segments, avg_logprob=lp,
+                                  compression_ratio=compression_ratio(text)))
+        return out
+
+
+class CTranslate2Backend(ASRBackend):
+    """
+    CTranslate2 via faster-whisper. Krever en CTranslate2-konvertert modell
+    (ASR_CT2_MODEL, se ct2-transformers-converter). int8 på CPU er flere ganger
+    raskere enn transformers i fp32.
+    """
+
+    name = "ctranslate2"
+    _COMPUTE_TYPES = {"fp32": "float32", "fp16": "float16", "bf16": "bfloat16", "int8": "int8"}
+
+    def __init__(self, model_id: str, device: str, precision: str):
+        super().__init__(model_id, device, precision)
+        self.model = None
+
+    @classmethod
+    def resolve_model_id(cls, model_id: str) -> str:
+        # Transformers-vekter kan ikke leses direkte; bruk den konverterte modellen hvis den er satt
+        return settings.ct2_model or model_id
+
+    @classmethod
+    def resolve_device(cls, device: str) -> str:
+        if device.startswith("mps"):
+            print("[models] CTranslate2 støtter ikke MPS, bruker CPU.")
+            return "cpu"
+        return device
+
+    @classmethod
+    def resolve_precision(cls, mode: Optional[str], device: str) -> str:
+        mode = (mode or "fp32").strip().lower()
+        on_gpu = device.startswith("cuda")
+        if mode == "auto":
+            return "fp16" if on_gpu else "int8"
+        if mode not in PRECISIONS:
+            print(f"[models] Ukjent presisjon '{mode}', bruker fp32.")
+            return "fp32"
+        if mode == "fp16" and not on_gpu:
+            print("[models] fp16 støttes ikke av CTranslate2 på CPU, bruker int8.")
+            return "int8"
+        return mode
+
+    def load(self) -> None:
+        if CT2WhisperModel is None:
+            raise RuntimeError("'faster-whisper' er ikke installert. Kjør: pip install faster-whisper")
+        kind, _, index = self.device.partition(":")
+        compute_type = self._COMPUTE_TYPES[self.precision]
+        if self.precision == "int8" and kind == "cuda":
+            compute_type = "int8_float16"
+        self.model = CT2WhisperModel(
+            self.model_id,
+            device=kind,
+            device_index=int(index or 0),
+            compute_type=compute_type,
+        )
+
+    def transcribe(self, audio: List[np.ndarray], options: DecodeOptions) -> List[Transcript]:
+        out: List[Transcript] = []
+        for arr in audio:
+            segments, _info = self.model.transcribe(
+                np.ascontiguousarray(arr, dtype=np.float32),
+                language=options.language,
+                task=options.task,
+                beam_size=max(1, options.num_beams),
+                without_timestamps=not options.timestamps,
+                condition_on_previous_text=False,
+                vad_filter=False,
+            )
+            segments = list(segments)
+            parts = [{"text": s.text.strip(), "start": s.start, "end": s.end} for s in segments]
+            text = " ".join(p["text"] for p in parts).strip()
+            # Snitt over segmentene, vektet med antall tokens
+            n_tokens = sum(len(s.tokens) for s in segments)
+            avg_logprob = (
+                sum(s.avg_logprob * len(s.tokens) for s in segments) / n_tokens if n_tokens else None
+            )
+            out.append(Transcript(
+                text=text,
+                segments=parts if options.timestamps else [],
+                avg_logprob=avg_logprob,
+                compression_ratio=compression_ratio(text),
+            ))
+        return out
+
+
+BACKENDS = {b.name: b for b in (TransformersBackend, CTranslate2Backend)}
+
+
+def backend_class(name: Optional[str]):
+    key = (name or "transformers").strip().lower()
+    if key in {"ct2", "faster-whisper", "faster_whisper"}:
+        key = "ctranslate2"
+    if key not in BACKENDS:
+        print(f"[models] Ukjent ASR-backend '{name}', bruker transformers.")
+        key = "transformers"
+    return BACKENDS[key]
@@ -0,0 +1,248 @@
+# app/asr_process.py
+"""
+Live-ASR i en egen prosess (LIVE_ASR_PROCESS=1).
+
+Lyd-callbacken, storfilskriveren og websocket-kringkastingen deler ellers
+GIL med tokenizer og generate(), og lange Python-seksjoner der gir hakk i
+lydinnsamlingen. Her skriver serverprosessen lyden inn i ringbufferen som
+før, men lagring og tellere ligger i delt minne, og en LiveDecoder i en
+barneprosess leser vinduene derfra. Resultatene kommer tilbake over en pipe.
+
+Ringens lesepeker flyttes først når et vindu er dekodet. Dør ASR-prosessen
+(eller startes den på nytt med restart()), fortsetter den nye prosessen fra
+samme sted, og lyd som kom inn i mellomtiden ligger i ringen og venter. Det
+gjelder så lenge omstarten (modell-lasting) tar kortere tid enn ringen
+rommer (ASR_PROCESS_RING_SECONDS); ellers mister live-teksten den eldste
+lyden, som ved et vanlig overløp. Bare ASR-prosessen, som er konsumenten,
+flytter lesepekeren; serverprosessen leser fyllingen med fill().
+"""
+from __future__ import annotations
+
+import multiprocessing as mp
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Optional
+
+import numpy as np
+
+from .config import settings
+from .live_decoder import LiveResult
+from .ring_buffer import AudioRingBuffer, N_COUNTERS
+from .scheduler import add_live_source, remove_live_source
+from .thread_budget import parse_cpus, pin
+
+# Hvor ofte ASR-prosessen sender dekodingsstatistikk sammen med resultatene
+STATS_INTERVAL = 1.0
+# Hvor ofte ASR-prosessen ser etter ny lyd i ringen
+POLL_INTERVAL = 0.01
+# Så mange ganger på rad kan prosessen dø før modellen er klar, før vi gir opp
+MAX_FAILED_STARTS = 3
+
+
+def _ring_arrays(storage_buf, counters_buf, capacity: int):
+    storage = np.ndarray((2 * capacity,), dtype=np.float32, buffer=storage_buf)
+    counters = np.ndarray((N_COUNTERS,), dtype=np.int64, buffer=counters_buf)
+    return storage, counters
+
+
+class _StopFlag:
+    """
+    Stoppsignal i delt minne med samme grensesnitt som threading.Event. En
+    multiprocessing.Event bruker låser, og dør barnet mens det holder en av
+    dem, ville set() hengt i serverprosessen.
+    """
+
+    def __init__(self, ctx):
+        self._value = ctx.RawValue("b", 0)
+
+    def set(self):
+        self._value.value = 1
+
+    def is_set(self) -> bool:
+        return bool(self._value.value)
+
+
+class _PipeOut:
+    """Står i stedet for out_q i ASR-prosessen og sender resultatene over pipen."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.decoder = None
+        self._last_stats = 0.0
+
+    def put(self, result: LiveResult):
+        self.conn.send(("result", result.text, result.is_final, result.segment_id))
+        now = time.monotonic()
+        if self.decoder is not None and now - self._last_stats > STATS_INTERVAL:
+            self.conn.send(("stats", self.decoder.stats()))
+            self._last_stats = now
+
+
+def _child_main(storage_name: str, counters_name: str, capacity: int, stop_event, live_clock,
+                conn, lang_code: str, session_id: str, first_segment_id: int):
+    from .live_decoder import LiveDecoder
+    from .warmup import warm_backend
+
+    # Serverprosessen kjører offline-arbeid; live-kjernene er ASR-prosessens
+    pin(parse_cpus(settings.live_cpus), "ASR-prosessen")
+
+    # Barnet deler resource_tracker med serverprosessen, som eier minnet og fjerner det i stop()
+    shms = [shared_memory.SharedMemory(name=name) for name in (storage_name, counters_name)]
+    storage, counters = _ring_arrays(shms[0].buf, shms[1].buf, capacity)
+    ring = AudioRingBuffer(capacity, storage, counters, poll_interval=POLL_INTERVAL)
+    out = _PipeOut(conn)
+    decoder = LiveDecoder(lang_code, session_id, ring, out, first_segment_id, stop_event, live_clock)
+    out.decoder = decoder
+    # Oppvarmingen gjøres her og ikke i serverprosessen, som ikke har live-modellen
+    warm_backend(decoder.backend, lang_code)
+    conn.send(("ready",))
+    try:
+        decoder.run()
+        conn.send(("stats", decoder.stats()))
+    finally:
+        decoder.release()
+        conn.close()
+
+
+class ASRProcess:
+    def __init__(self, lang_code: str, session_id: str, capacity: int, out_q):
+        self.lang_code = lang_code
+        self.session_id = session_id
+        self.capacity = capacity
+        self._ctx = mp.get_context("spawn")
+        self._storage_shm = shared_memory.SharedMemory(create=True, size=2 * capacity * 4)
+        self._counters_shm = shared_memory.SharedMemory(create=True, size=N_COUNTERS * 8)
+        storage, counters = _ring_arrays(self._storage_shm.buf, self._counters_shm.buf, capacity)
+        storage[:] = 0
+        counters[:] = 0
+        self.ring = AudioRingBuffer(capacity, storage, counters)
+        self.out_q = out_q
+
+        self._lock = threading.Lock()
+        self._proc = None
+        self._stop_event = None
+        self._reader: Optional[threading.Thread] = None
+        self._stopping = False
+        self._next_segment_id = 0
+        self._child_stats: dict = {}
+        self.ready = False
+        self.restarts = 0
+        self._failed_starts = 0
+        # Siste live-dekoding i barnet (time.monotonic()); inferenskøen her viker for den
+        self._live_at = self._ctx.RawValue("d", 0.0)
+        self._live_source = lambda: self._live_at.value
+
+    def start(self):
+        add_live_source(self._live_source)
+        with self._lock:
+            self._spawn()
+
+    def _spawn(self):
+        recv, send = self._ctx.Pipe(duplex=False)
+        self._stop_event = _StopFlag(self._ctx)
+        self._proc = self._ctx.Process(
+            target=_child_main, daemon=True, name="live-asr",
+            args=(self._storage_shm.name, self._counters_shm.name, self.capacity, self._stop_event,
+                  self._live_at, send, self.lang_code, self.session_id, self._next_segment_id),
+        )
+        self.ready = False
+        self._proc.start()
+        # Vår kopi av skriveenden lukkes, så vi får EOF når barnet avslutter
+        send.close()
+        self._reader = threading.Thread(target=self._read, args=(recv, self._proc), daemon=True)
+        self._reader.start()
+        print(f"[asr_process] ASR-prosess startet (pid {self._proc.pid})")
+
+    def _read(self, conn, proc):
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                break
+            kind = msg[0]
+            if kind == "result":
+                _, text, is_final, segment_id = msg
+                self.out_q.put(LiveResult(text=text, is_final=is_final, segment_id=segment_id))
+                if is_final:
+                    self._next_segment_id = max(self._next_segment_id, segment_id + 1)
+            elif kind == "stats":
+                self._child_stats = msg[1]
+            elif kind == "ready":
+                self.ready = True
+                self._failed_starts = 0
+                print("[asr_process] Modellen er klar i ASR-prosessen")
+        conn.close()
+        proc.join(timeout=1)
+        with self._lock:
+            if self._stopping or proc is not self._proc:
+                return
+            if not self.ready:
+                self._failed_starts += 1
+                if self._failed_starts >= MAX_FAILED_STARTS:
+                    print(f"[asr_process] ASR-prosessen startet ikke {MAX_FAILED_STARTS} ganger på rad; gir opp. "
+                          "Opptaket fortsetter.")
+                    return
+            print(f"[asr_process] ASR-prosessen stoppet uventet (exit {proc.exitcode}); starter på nytt")
+            self.restarts += 1
+            self._spawn()
+
+    def restart(self):
+        """Avslutter ASR-prosessen pent og starter en ny som fortsetter fra ringens lesepeker."""
+        with self._lock:
+            if self._stopping or self._proc is None:
+                return
+            proc, reader, stop_event = self._proc, self._reader, self._stop_event
+            self._proc = None  # leseren til den gamle prosessen skal ikke starte en erstatning selv
+        stop_event.set()
+        proc.join(10)
+        if proc.is_alive():
+            proc.terminate()
+            proc.join(1)
+        reader.join(timeout=2)
+        with self._lock:
+            if self._stopping:
+                return
+            self.restarts += 1
+            self._spawn()
+
+    def stop(self):
+        remove_live_source(self._live_source)
+        with self._lock:
+            self._stopping = True
+        if self._proc is not None:
+            self._stop_event.set()
+            self._proc.join(5)
+            if self._proc.is_alive():
+                self._proc.terminate()
+                self._proc.join(1)
+        if self._reader is not None:
+            self._reader.join(timeout=2)
+        # Ringens arrays er views inn i minnet; motoren beholder ringen (stats), men i privat minne
+        self.ring.detach()
+        for shm in (self._storage_shm, self._counters_shm):
+            try:
+                shm.close()
+            except BufferError:
+                pass  # noen holder fortsatt et view (f.eks. stats() midt i et kall); GC rydder
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        ring = self.ring.stats()
+        ring["fill_seconds"] = round(ring["fill"] / settings.sample_rate, 2)
+        ring["capacity_seconds"] = round(ring["capacity"] / settings.sample_rate, 2)
+        child = {k: v for k, v in self._child_stats.items() if k != "ring"}
+        proc = self._proc
+        return {
+            "ring": ring,
+            **child,
+            "asr_process": {
+                "pid": proc.pid if proc is not None else None,
+                "alive": proc.is_alive() if proc is not None else False,
+                "ready": self.ready,
+                "restarts": self.restarts,
+            },
+        }
@@ -0,0 +1,169 @@
+# app/audio_io.py
+from __future__ import annotations
+
+import math
+import queue
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, Iterator, TypeVar
+
+import numpy as np
+import soundfile as sf
+import torch
+import torchaudio
+
+SR = 16000
+BLOCK_SECONDS = 10.0  # blokklengden filer leses i
+T = TypeVar("T")
+
+
+@lru_cache(maxsize=8)
+def _resampler(orig_sr: int, new_sr: int) -> torchaudio.transforms.Resample:
+    # Filterkjernen regnes ut én gang per samplingsrate-par og gjenbrukes
+    return torchaudio.transforms.Resample(orig_sr, new_sr)
+
+
+class StreamResampler:
+    """
+    Resampler en lydstrøm blokk for blokk uten skjøter.
+
+    Hver blokk resamples med litt kontekst på begge sider, og bare den
+    midterste delen beholdes, så resultatet blir det samme som om hele
+    filen var resamplet på én gang. Kontekst og steg er hele perioder av
+    forholdet mellom ratene, så utsnittene alltid treffer hele samples.
+    """
+
+    def __init__(self, orig_sr: int, new_sr: int = SR):
+        g = math.gcd(orig_sr, new_sr)
+        self.period_in = orig_sr // g
+        self.period_out = new_sr // g
+        self.context = self.period_in * math.ceil(64 / self.period_in)
+        self._resample = _resampler(orig_sr, new_sr)
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._left = 0  # samples med venstrekontekst først i _pending
+
+    def _run(self, samples: np.ndarray) -> np.ndarray:
+        with torch.inference_mode():
+            return self._resample(torch.from_numpy(samples)).numpy()
+
+    def _out(self, n_in: int) -> int:
+        return n_in // self.period_in * self.period_out
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        self._pending = np.concatenate((self._pending, block))
+        ready = len(self._pending) - self._left - self.context
+        ready -= ready % self.period_in
+        if ready <= 0 or self._left + ready < self.context:
+            return np.zeros(0, dtype=np.float32)
+        out = self._run(self._pending[: self._left + ready + self.context])
+        out = out[self._out(self._left): self._out(self._left + ready)]
+        self._pending = self._pending[self._left + ready - self.context:]
+        self._left = self.context
+        return out
+
+    def flush(self) -> np.ndarray:
+        if len(self._pending) <= self._left:
+            return np.zeros(0, dtype=np.float32)
+        out = self._run(self._pending)[self._out(self._left):]
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._left = 0
+        return out
+
+
+class AudioReader:
+    """
+    Leser en lydfil blokkvis som 16 kHz mono float32.
+
+    Bare én blokk av filen er i minnet om gangen, så minnebruken er
+    uavhengig av opptakets lengde.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        info = sf.info(str(self.path))
+        self.sample_rate = info.samplerate
+        self.frames = info.frames
+        self.channels = info.channels
+
+    @property
+    def duration(self) -> float:
+        return self.frames / self.sample_rate if self.sample_rate else 0.0
+
+    def blocks(self, block_seconds: float = BLOCK_SECONDS) -> Iterator[np.ndarray]:
+        blocksize = max(1, int(self.sample_rate * block_seconds))
+        resampler = StreamResampler(self.sample_rate) if self.sample_rate != SR else None
+        with sf.SoundFile(str(self.path)) as f:
+            for block in f.blocks(blocksize=blocksize, dtype="float32", always_2d=True):
+                mono = block[:, 0] if block.shape[1] == 1 else block.mean(axis=1, dtype=np.float32)
+                if resampler is not None:
+                    mono = resampler.process(np.ascontiguousarray(mono))
+                if len(mono):
+                    yield mono
+        if resampler is not None:
+            tail = resampler.flush()
+            if len(tail):
+                yield tail
+
+    def read(self, max_seconds: float) -> np.ndarray:
+        """Leser inntil `max_seconds` fra starten av filen (16 kHz mono)."""
+        parts, total = [], 0
+        limit = int(max_seconds * SR)
+        for block in self.blocks():
+            parts.append(block)
+            total += len(block)
+            if total >= limit:
+                break
+        audio = np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32)
+        return audio[:limit]
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_END = object()
+
+
+def prefetch(items: Iterable[T], depth: int = 2) -> Iterator[T]:
+    """
+    Henter elementer fra `items` i en egen tråd, inntil `depth` i forveien.
+
+    Disklesing og forbehandling overlapper da med dekodingen hos den som
+    itererer. Feil i produsenten kastes videre hos forbrukeren. Lukkes
+    generatoren tidlig, stopper produsenten ved neste element.
+    """
+    q: "queue.Queue" = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put(item):
+                    return
+        except BaseException as e:
+            put(_Failure(e))
+            return
+        put(_END)
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = q.get()
+            if item is _END:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
@@ -0,0 +1,129 @@
+# app/benchmark.py
+"""
+Måler sanntidsfaktor (RTF) og minnebruk for ASR-presisjonene på denne maskinen.
+
+    python -m app.benchmark --audio data/recordings/<økt>/session.wav
+    python -m app.benchmark --modes fp32,int8 --device cpu --seconds 120
+    python -m app.benchmark --backend ctranslate2 --modes int8,fp32
+
+Hver presisjon kjøres i en egen prosess, slik at minnetallene ikke blandes.
+RTF < 1.0 betyr raskere enn sanntid.
+"""
+from __future__ import annotations
+
+import argparse
+import multiprocessing as mp
+import sys
+import time
+from typing import Optional
+
+import numpy as np
+
+from .config import settings
+
+SR = 16000
+
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / 1e6
+        except Exception:
+            return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux rapporterer KiB, macOS bytes
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1024
+
+
+def _load_audio(path: Optional[str], seconds: float) -> np.ndarray:
+    if not path:
+        print("[benchmark] Ingen --audio gitt, bruker syntetisk støy (RTF blir bare veiledende).")
+        rng = np.random.default_rng(0)
+        return (rng.standard_normal(int(SR * seconds)) * 0.05).astype(np.float32)
+    from .audio_io import AudioReader
+    return AudioReader(path).read(seconds)
+
+
+def _run_mode(mode: str, device: str, model_id: str, audio_path: Optional[str],
+              seconds: float, chunk_seconds: float, lang: str, backend: str) -> dict:
+    import torch
+    from .model_registry import registry
+    from .asr_backends import DecodeOptions
+
+    t0 = time.perf_counter()
+    lease = registry.acquire(model_id, device, mode, backend)
+    load_s = time.perf_counter() - t0
+    options = DecodeOptions(lang)
+
+    audio = _load_audio(audio_path, seconds)
+    chunk_len = int(SR * chunk_seconds)
+    chunks = [audio[i:i + chunk_len] for i in range(0, len(audio), chunk_len)]
+
+    def decode(chunk):
+        lease.backend.transcribe([chunk], options)
+
+    decode(chunks[0])  # oppvarming, telles ikke med
+    t0 = time.perf_counter()
+    for chunk in chunks:
+        decode(chunk)
+    decode_s = time.perf_counter() - t0
+    audio_s = len(audio) / SR
+
+    cuda_peak = None
+    if lease.device.startswith("cuda"):
+        cuda_peak = torch.cuda.max_memory_allocated() / 1e6
+    return {
+        "backend": lease.key.backend,
+        "mode": lease.key.dtype,
+        "requested": mode,
+        "load_s": load_s,
+        "decode_s": decode_s,
+        "audio_s": audio_s,
+        "rtf": decode_s / audio_s if audio_s else float("nan"),
+        "peak_rss_mb": _peak_rss_mb(),
+        "cuda_peak_mb": cuda_peak,
+    }
+
+
+def main(argv=None):
+    from .model_registry import pick_device
+
+    ap = argparse.ArgumentParser(prog="python -m app.benchmark", description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--modes", default="fp32,fp16,bf16,int8", help="kommaseparert liste over presisjoner")
+    ap.add_argument("--device", default=settings.asr_device, help="auto | cpu | mps | cuda")
+    ap.add_argument("--backend", default=settings.asr_backend, help="transformers | ctranslate2")
+    ap.add_argument("--model", default=settings.asr_model)
+    ap.add_argument("--audio", default=None, help="lydfil med tale (anbefalt)")
+    ap.add_argument("--seconds", type=float, default=60.0, help="hvor mye lyd som dekodes per modus")
+    ap.add_argument("--chunk-seconds", type=float, default=settings.chunk_seconds)
+    ap.add_argument("--lang", default=settings.default_lang)
+    args = ap.parse_args(argv)
+
+    device = pick_device(args.device)
+    lang = "no" if args.lang == "nb" else args.lang
+    ctx = mp.get_context("spawn")
+    rows = []
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        print(f"[benchmark] Kjører {mode} på {device} ({args.backend})...")
+        try:
+            with ctx.Pool(1) as pool:
+                rows.append(pool.apply(_run_mode, (mode, device, args.model, args.audio,
+                                                   args.seconds, args.chunk_seconds, lang, args.backend)))
+        except Exception as e:
+            print(f"[benchmark] {mode} feilet: {e}")
+
+    print()
+    print(f"{'modus':<12}{'lasting s':>10}{'RTF':>8}{'topp RSS MB':>13}{'topp GPU MB':>13}")
+    for r in rows:
+        label = r["mode"] if r["mode"] == r["requested"] else f"{r['requested']}->{r['mode']}"
+        rss = f"{r['peak_rss_mb']:.0f}" if r["peak_rss_mb"] is not None else "-"
+        gpu = f"{r['cuda_peak_mb']:.0f}" if r["cuda_peak_mb"] is not None else "-"
+        print(f"{label:<12}{r['load_s']:>10.1f}{r['rtf']:>8.2f}{rss:>13}{gpu:>13}")
+
+
+if __name__ == "__main__":
+    main()
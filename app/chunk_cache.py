@@ -0,0 +1,164 @@
+# app/chunk_cache.py
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from .asr_backends import ASRBackend, DecodeOptions, Transcript, adaptive_passes
+from .config import settings
+from .utils import BASE
+
+CACHE_PATH = BASE / "cache" / "chunks.sqlite3"
+
+
+class ChunkCache:
+    """
+    Varig cache for offline-resultater per vindu, lagret i SQLite.
+
+    Nøkkelen er en hash av selve lyden i vinduet pluss modell og
+    dekodingsparametre (språk, beams, tidsstempler). En ny kjøring på samme
+    opptak hopper derfor over vinduer som allerede er dekodet, og en avbrutt
+    jobb fortsetter der den stoppet. I adaptiv modus caches hvert pass for
+    seg (se decode_cached()): det grådige under num_beams=1 og beam-passet
+    under OFFLINE_NUM_BEAMS, og ingen av nøklene inneholder tersklene. De kan
+    derfor justeres, og OFFLINE_NUM_BEAMS endres, uten at de grådige
+    vinduene dekodes på nytt. Når cachen blir større enn `max_mb`, kastes de
+    minst nylig brukte oppføringene først.
+    """
+
+    def __init__(self, path: Path, max_mb: float):
+        self.path = Path(path)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._total = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.path.as_posix(), check_same_thread=False)
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " key TEXT PRIMARY KEY, result TEXT NOT NULL,"
+                " size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS chunks_last_used ON chunks(last_used)")
+            self._total = db.execute("SELECT COALESCE(SUM(size), 0) FROM chunks").fetchone()[0]
+            self._db = db
+        return self._db
+
+    @staticmethod
+    def key(audio: np.ndarray, model: str, options: DecodeOptions) -> str:
+        # Tersklene avgjør bare hvilke vinduer som får et beam-pass, ikke resultatet av et pass
+        skip = {"fast", "logprob_threshold", "compression_threshold"}
+        params = {k: v for k, v in asdict(options).items() if k not in skip}
+        h = hashlib.blake2b(digest_size=20)
+        h.update(np.ascontiguousarray(audio, dtype=np.float32).tobytes())
+        h.update(json.dumps({"model": model, **params}, sort_keys=True).encode("utf-8"))
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[Transcript]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            db = self._conn()
+            row = db.execute("SELECT result FROM chunks WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            db.execute("UPDATE chunks SET last_used = ? WHERE key = ?", (time.time(), key))
+            db.commit()
+            self.hits += 1
+        return Transcript(**json.loads(row[0]))
+
+    def put(self, key: str, result: Transcript):
+        if not self.enabled:
+            return
+        payload = json.dumps(asdict(result), ensure_ascii=False)
+        size = len(payload.encode("utf-8"))
+        with self._lock:
+            db = self._conn()
+            old = db.execute("SELECT size FROM chunks WHERE key = ?", (key,)).fetchone()
+            db.execute(
+                "INSERT OR REPLACE INTO chunks (key, result, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, payload, size, time.time()),
+            )
+            self._total += size - (old[0] if old else 0)
+            if self._total > self.max_bytes:
+                self._evict_locked(db)
+            db.commit()
+
+    def _evict_locked(self, db: sqlite3.Connection):
+        # Rydd ned til 90 % av grensen, så vi ikke kaster én oppføring per innsetting
+        target = int(self.max_bytes * 0.9)
+        rows = db.execute("SELECT key, size FROM chunks ORDER BY last_used").fetchall()
+        for key, size in rows:
+            if self._total <= target:
+                break
+            db.execute("DELETE FROM chunks WHERE key = ?", (key,))
+            self._total -= size
+            self.evicted += 1
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "size_mb": round(self._total / 1024 / 1024, 2),
+            "max_mb": round(self.max_bytes / 1024 / 1024, 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted": self.evicted,
+        }
+
+
+def _decode_pass(decode: Callable[[List[np.ndarray], DecodeOptions], List[Transcript]],
+                 audio: List[np.ndarray], model: str, options: DecodeOptions) -> Tuple[List[Transcript], List[bool]]:
+    """Ett dekodingspass gjennom cachen. Returnerer (resultater, treff per vindu)."""
+    keys = [chunk_cache.key(a, model, options) for a in audio] if chunk_cache.enabled else []
+    results: List[Optional[Transcript]] = [chunk_cache.get(k) for k in keys] or [None] * len(audio)
+    hits = [r is not None for r in results]
+    missing = [i for i, r in enumerate(results) if r is None]
+    if missing:
+        for i, result in zip(missing, decode([audio[i] for i in missing], options)):
+            results[i] = result
+            if keys:
+                chunk_cache.put(keys[i], result)
+    return results, hits
+
+
+def decode_cached(decode: Callable[[List[np.ndarray], DecodeOptions], List[Transcript]],
+                  audio: List[np.ndarray], model: str, options: DecodeOptions) -> Tuple[List[Transcript], int]:
+    """
+    Dekoder en batch, men henter ferdige vinduer fra cachen. Bare vinduene
+    som mangler sendes til `decode(lyd, options)`. I adaptiv modus kjøres
+    passene fra adaptive_passes() hver for seg, og hvilke vinduer som får
+    beam search avgjøres på nytt fra det grådige resultatet.
+    Returnerer (resultater, antall vinduer hentet helt fra cachen).
+    """
+    first, beam = adaptive_passes(options)
+    results, hits = _decode_pass(decode, audio, model, first)
+    low = [i for i, r in enumerate(results) if beam is not None and ASRBackend.needs_beam(r, options)]
+    if low:
+        beams, beam_hits = _decode_pass(decode, [audio[i] for i in low], model, beam)
+        for i, result, hit in zip(low, beams, beam_hits):
+            result.escalated = True
+            results[i] = result
+            hits[i] = hits[i] and hit
+    return results, sum(hits)
+
+
+chunk_cache = ChunkCache(CACHE_PATH, settings.offline_cache_mb)
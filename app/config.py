@@ -11,11 +11,84 @@ class Settings:
     default_lang: str = os.getenv("APP_DEFAULT_LANG", "no")
     asr_model: str = os.getenv("ASR_MODEL", "NbAiLab/nb-whisper-large")
     asr_device: str = os.getenv("ASR_DEVICE", "auto")
+    # Presisjon: fp32 | fp16 | bf16 | int8 (dynamisk kvantisering, kun CPU) | auto
+    asr_precision: str = os.getenv("ASR_PRECISION", "fp32")
+    # ASR-motor: transformers | ctranslate2 (faster-whisper, krever konvertert modell)
+    asr_backend: str = os.getenv("ASR_BACKEND", "transformers")
+    # Sti eller HF-id til CTranslate2-konvertert modell; tomt = ASR_MODEL
+    ct2_model: str = os.getenv("ASR_CT2_MODEL", "")
+    # Offline-transkribering kan bruke egen modell/enhet; tomt = samme som live
+    offline_asr_model: str = os.getenv("OFFLINE_ASR_MODEL") or os.getenv("ASR_MODEL", "NbAiLab/nb-whisper-large")
+    offline_device: str = os.getenv("OFFLINE_DEVICE") or os.getenv("ASR_DEVICE", "auto")
+    offline_precision: str = os.getenv("OFFLINE_PRECISION") or os.getenv("ASR_PRECISION", "fp32")
+    offline_backend: str = os.getenv("OFFLINE_BACKEND") or os.getenv("ASR_BACKEND", "transformers")
+    # Parallell offline-transkribering på CPU: antall prosesser (0/1 = av) og tråder per prosess (0 = fordel OFFLINE_THREADS)
+    offline_workers: int = int(os.getenv("OFFLINE_WORKERS", "0"))
+    offline_worker_threads: int = int(os.getenv("OFFLINE_WORKER_THREADS", "0"))
+    # Adaptiv beam search offline: grådig først, beam search bare for vinduer med lav konfidens
+    offline_adaptive_beams: bool = os.getenv("OFFLINE_ADAPTIVE_BEAMS", "0").strip().lower() in {"1", "true", "yes"}
+    offline_logprob_threshold: float = float(os.getenv("OFFLINE_LOGPROB_THRESHOLD", "-1.0"))
+    offline_compression_threshold: float = float(os.getenv("OFFLINE_COMPRESSION_THRESHOLD", "2.4"))
+    # Offline hoppes bare over vinduer som er helt stille: lavere terskel og kortere minstetale enn live-VAD
+    offline_vad_threshold_db: float = float(os.getenv("OFFLINE_VAD_THRESHOLD_DB", "-60"))
+    offline_vad_min_speech_ms: int = int(os.getenv("OFFLINE_VAD_MIN_SPEECH_MS", "60"))
+    # Varig cache for ferdig dekodede offline-vinduer (data/cache); 0 = av
+    offline_cache_mb: float = float(os.getenv("OFFLINE_CACHE_MB", "200"))
+    # Trådbudsjett (0 = auto: live alle kjerner minus én, offline halve maskinen) og valgfri kjernelåsing ("0-3,6")
+    live_threads: int = int(os.getenv("LIVE_THREADS", "0"))
+    offline_threads: int = int(os.getenv("OFFLINE_THREADS", "0"))
+    live_cpus: str = os.getenv("LIVE_CPUS", "")
+    offline_cpus: str = os.getenv("OFFLINE_CPUS", "")
+    # Felles inferenskø per enhet: maks antall vinduer som slås sammen til én batch
+    infer_max_batch: int = int(os.getenv("INFER_MAX_BATCH", "8"))
+    # Bakgrunnsjobber (/after, /summarize): samtidige jobber, maks antall i kø, vent mens live-økt pågår
+    jobs_concurrency: int = int(os.getenv("JOBS_CONCURRENCY", "1"))
+    jobs_max_queued: int = int(os.getenv("JOBS_MAX_QUEUED", "32"))
+    jobs_yield_to_live: bool = os.getenv("JOBS_YIELD_TO_LIVE", "1").strip().lower() in {"1", "true", "yes"}
+    # Modellregister: ubrukte modeller lastes ut etter TTL (0 = aldri), maks antall i minnet samtidig
+    asr_model_idle_ttl: float = float(os.getenv("ASR_MODEL_IDLE_TTL", "600"))
+    asr_max_loaded_models: int = int(os.getenv("ASR_MAX_LOADED_MODELS", "1"))
+    # Last og varm opp live-modellen når serveren starter
+    asr_preload: bool = os.getenv("ASR_PRELOAD", "1").strip().lower() in {"1", "true", "yes"}
 
     # Audio Innstillinger
     sample_rate: int = int(os.getenv("SAMPLE_RATE", "16000"))
     chunk_seconds: float = float(os.getenv("CHUNK_SECONDS", "4"))
     overlap_seconds: float = float(os.getenv("OVERLAP_SECONDS", "0.5"))
+    # Hvor mye lyd live-ringbufferen holder før ASR-en regnes som hengende etter
+    live_ring_seconds: float = float(os.getenv("LIVE_RING_SECONDS", "30"))
+
+    # Taledeteksjon (VAD) for live-ASR: hopper over stillhet og kutter i pauser
+    vad_enabled: bool = os.getenv("VAD_ENABLED", "1").strip().lower() in {"1", "true", "yes"}
+    vad_threshold_db: float = float(os.getenv("VAD_THRESHOLD_DB", "-50"))
+    vad_margin_db: float = float(os.getenv("VAD_MARGIN_DB", "8"))
+    vad_min_silence_ms: int = int(os.getenv("VAD_MIN_SILENCE_MS", "300"))
+    vad_min_speech_ms: int = int(os.getenv("VAD_MIN_SPEECH_MS", "200"))
+    vad_max_chunk_seconds: float = float(os.getenv("VAD_MAX_CHUNK_SECONDS", "10"))
+
+    # Strømmende live-tekst: foreløpige hypoteser (is_final=False) omtrent hvert STREAM_STEP_SECONDS
+    live_streaming: bool = os.getenv("LIVE_STREAMING", "0").strip().lower() in {"1", "true", "yes"}
+    stream_step_seconds: float = float(os.getenv("STREAM_STEP_SECONDS", "1.0"))
+
+    # Kjør live-ASR i en egen prosess som leser lyden fra delt minne (skjermer lydinnsamlingen mot GIL)
+    live_asr_process: bool = os.getenv("LIVE_ASR_PROCESS", "0").strip().lower() in {"1", "true", "yes"}
+    # Ringbufferen i prosessmodus holder minst så mye lyd, så en omstart (modellen lastes på nytt) ikke mister lyd
+    asr_process_ring_seconds: float = float(os.getenv("ASR_PROCESS_RING_SECONDS", "120"))
+
+    # Live-journal: segmentene skrives løpende til live_segments.jsonl; fsync samles per intervall
+    journal_fsync_seconds: float = float(os.getenv("JOURNAL_FSYNC_SECONDS", "1.0"))
+    journal_tail_segments: int = int(os.getenv("JOURNAL_TAIL_SEGMENTS", "200"))
+
+    # WebSocket-utsending: utkø per klient og tidsgrense per sending (se ws_fanout.py)
+    ws_queue_max: int = int(os.getenv("WS_QUEUE_MAX", "64"))
+    ws_send_timeout: float = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+
+    # Bakgrunnsraffinering: dekod ferdige 30 s-vinduer med offline-innstillingene mens økten pågår
+    live_refiner: bool = os.getenv("LIVE_REFINER", "0").strip().lower() in {"1", "true", "yes"}
+    refiner_max_lag_seconds: float = float(os.getenv("REFINER_MAX_LAG_SECONDS", "600"))
+
+    # Kompilert live-dekoding med statisk KV-cache (torch.compile); faller tilbake automatisk
+    live_fast_decode: bool = os.getenv("LIVE_FAST_DECODE", "0").strip().lower() in {"1", "true", "yes"}
 
     # --- LLM Innstillinger ---
     ollama_base_url: str | None = os.getenv("OLLAMA_BASE_URL")
@@ -0,0 +1,61 @@
+# app/fast_decode.py
+from __future__ import annotations
+
+import copy
+import math
+
+import torch
+
+from .config import settings
+
+# Grovt anslag for hvor mange tokens Whisper trenger per sekund tale, med margin
+TOKENS_PER_SECOND = 8
+_MAX_TARGET_POSITIONS = 440  # Whisper-dekoderen har 448 posisjoner, inkludert prompt
+
+
+def live_token_budget() -> int:
+    """Fast tokenbudsjett for live-dekoding, avledet av lengste mulige live-vindu."""
+    seconds = settings.chunk_seconds
+    if settings.vad_enabled:
+        seconds = max(seconds, settings.vad_max_chunk_seconds)
+    return min(_MAX_TARGET_POSITIONS, int(math.ceil(seconds * TOKENS_PER_SECOND)) + 8)
+
+
+class FastDecoder:
+    """
+    Kompilert dekoding med statisk KV-cache for korte live-vinduer.
+
+    Modellen deles med resten av prosessen (registeret), så den endres ikke:
+    vi lager en grunn kopi som deler alle vekter, og gir bare kopien en
+    kompilert forward(). Med fast `max_new_tokens` får den statiske cachen
+    samme form hver gang, og kompileringen gjenbrukes. Feiler kompilering
+    eller kjøring, faller vi tilbake til vanlig generate() for godt.
+    """
+
+    def __init__(self, model, max_new_tokens: int):
+        self.model = model
+        self.max_new_tokens = max_new_tokens
+        self.enabled = False
+        self._proxy = None
+        try:
+            proxy = copy.copy(model)
+            proxy.forward = torch.compile(model.forward, mode="reduce-overhead")
+            self._proxy = proxy
+            self.enabled = True
+        except Exception as e:
+            print(f"[fast_decode] Kunne ikke kompilere dekoderen, bruker vanlig generate(): {e}")
+
+    def generate(self, input_features, **kwargs):
+        if self.enabled:
+            try:
+                return self._proxy.generate(
+                    input_features,
+                    cache_implementation="static",
+                    max_new_tokens=self.max_new_tokens,
+                    **kwargs,
+                )
+            except Exception as e:
+                print(f"[fast_decode] Kompilert dekoding feilet, faller tilbake til vanlig generate(): {e}")
+                self.enabled = False
+                self._proxy = None
+        return self.model.generate(input_features, **kwargs)
@@ -0,0 +1,231 @@
+# app/jobs.py
+"""
+Bakgrunnsjobber for /after og /summarize.
+
+En innsendt jobb får en id med én gang og legges i en begrenset kø. Et fast
+antall arbeidere (JOBS_CONCURRENCY) tar jobbene i tur og orden, så to klikk
+eller en hel dags økter aldri dekoder i konkurranse om samme modell. Samme
+type jobb for samme økt legges ikke inn to ganger; den som allerede venter
+eller kjører returneres i stedet.
+
+Jobben rapporterer fremdrift som sekunder lyd behandlet, og ETA regnes ut
+fra tiden brukt så langt. Avbrytelse og hensynet til live-tekstingen skjer i
+checkpoint(), som kalles mellom hver bit: en avbrutt jobb stopper der, og
+mens en live-økt pågår venter jobben (JOBS_YIELD_TO_LIVE).
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .config import settings
+
+
+class JobCancelled(Exception):
+    """Kastes fra Job.checkpoint() når jobben er avbrutt."""
+
+
+class JobQueueFull(Exception):
+    """Køen er full; prøv igjen senere."""
+
+
+ACTIVE_STATES = {"queued", "running", "paused"}
+
+
+@dataclass
+class Job:
+    kind: str
+    session_id: str
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    state: str = "queued"  # queued | running | paused | done | error | cancelled
+    message: str = ""
+    done_seconds: float = 0.0
+    total_seconds: float = 0.0
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    paused_for: Callable[[], bool] = field(default=lambda: False, repr=False)
+    _cancel: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def active(self) -> bool:
+        return self.state in ACTIVE_STATES
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def checkpoint(self):
+        """Kalles mellom bitene. Kaster JobCancelled, og venter mens live-tekstingen pågår."""
+        if self.paused_for() and not self.cancelled:
+            self.state = "paused"
+            while self.paused_for() and not self.cancelled:
+                time.sleep(0.5)
+            self.state = "running"
+        if self.cancelled:
+            raise JobCancelled()
+
+    def advance(self, done_seconds: float, total_seconds: Optional[float] = None):
+        if total_seconds is not None:
+            self.total_seconds = total_seconds
+        self.done_seconds = done_seconds
+
+    @property
+    def progress(self) -> float:
+        if self.state == "done":
+            return 1.0
+        if self.total_seconds <= 0:
+            return 0.0
+        return min(1.0, self.done_seconds / self.total_seconds)
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        # For tidlig å si noe før et par prosent er gjort
+        if self.state != "running" or self.started is None or self.progress < 0.02:
+            return None
+        elapsed = time.time() - self.started
+        return elapsed * (1.0 - self.progress) / self.progress
+
+    def as_dict(self) -> dict:
+        eta = self.eta_seconds
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "session": self.session_id,
+            "state": self.state,
+            "message": self.message,
+            "progress": round(self.progress, 3),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+JobRunner = Callable[[Job], Awaitable[Dict[str, Any]]]
+
+
+class JobManager:
+    def __init__(self, concurrency: int, max_queued: int, keep_finished: int = 100):
+        self.concurrency = max(1, concurrency)
+        self.max_queued = max(1, max_queued)
+        self.keep_finished = keep_finished
+        # Settes av main: True mens en live-økt kjører
+        self.live_active: Callable[[], bool] = lambda: False
+        # Settes av main: kalles når siste jobb i køen er ferdig
+        self.on_idle: Callable[[], None] = lambda: None
+        self.yield_to_live = True
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    def start(self):
+        # Ubegrenset: avbrutte jobber blir liggende til en arbeider tar dem, så kapasiteten telles i submit()
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for job in self.jobs.values():
+            if job.active:
+                job.cancel()
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, kind: str, session_id: str, run: JobRunner) -> Job:
+        for job in self.jobs.values():
+            if job.kind == kind and job.session_id == session_id and job.active:
+                return job
+        if self._queue is None or self.queued() >= self.max_queued:
+            raise JobQueueFull()
+        job = Job(kind, session_id, message="Venter i kø...")
+        job.paused_for = lambda: self.yield_to_live and self.live_active()
+        self.jobs[job.id] = job
+        self._queue.put_nowait((job, run))
+        self._prune()
+        return job
+
+    def queued(self) -> int:
+        """Jobber som venter på en arbeider; avbrutte jobber i køen teller ikke."""
+        return sum(1 for job in self.jobs.values() if job.state == "queued")
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self.jobs.get(job_id)
+        if job is not None and job.active:
+            job.cancel()
+            if job.state == "queued":
+                # Ferdig med en gang: ellers står den som aktiv (og blokkerer ny innsending) til en arbeider tar den
+                job.state = "cancelled"
+                job.message = "Avbrutt før start."
+                job.finished = time.time()
+        return job
+
+    def _prune(self):
+        finished = [j.id for j in self.jobs.values() if not j.active]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self.jobs[job_id]
+
+    async def _worker(self):
+        while True:
+            job, run = await self._queue.get()
+            try:
+                await self._run(job, run)
+            finally:
+                self._queue.task_done()
+            if self._queue.empty() and not any(j.state == "running" for j in self.jobs.values()):
+                self.on_idle()
+
+    async def _run(self, job: Job, run: JobRunner):
+        if job.state == "cancelled":
+            return  # avbrutt mens den lå i køen
+        try:
+            # Ikke start nye jobber mens live-tekstingen pågår
+            await asyncio.to_thread(job.checkpoint)
+            job.state = "running"
+            job.started = time.time()
+            print(f"[jobs] Starter {job.kind} for {job.session_id} ({job.id})")
+            job.result = await run(job)
+            job.state = "done"
+            job.message = job.message or "Ferdig."
+        except JobCancelled:
+            job.state = "cancelled"
+            job.message = "Avbrutt."
+            print(f"[jobs] {job.kind} for {job.session_id} avbrutt ({job.id})")
+        except Exception as e:
+            job.state = "error"
+            job.error = str(e)
+            job.message = f"Feil: {e}"
+            print(f"[jobs] {job.kind} for {job.session_id} feilet: {e}")
+        finally:
+            job.finished = time.time()
+
+    def stats(self) -> dict:
+        states: Dict[str, int] = {}
+        for job in self.jobs.values():
+            states[job.state] = states.get(job.state, 0) + 1
+        return {
+            "concurrency": self.concurrency,
+            "max_queued": self.max_queued,
+            "queued": self.queued(),
+            "states": states,
+        }
+
+
+jobs = JobManager(settings.jobs_concurrency, settings.jobs_max_queued)
+jobs.yield_to_live = settings.jobs_yield_to_live
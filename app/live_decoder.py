@@ -0,0 +1,279 @@
+# app/live_decoder.py
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+import numpy as np
+from scipy.io.wavfile import write as wav_write
+
+from .config import settings
+from .model_registry import registry, pick_device
+from .fast_decode import live_token_budget
+from .asr_backends import DecodeOptions
+from .scheduler import Priority, scheduler_for
+from .ring_buffer import AudioRingBuffer
+from .vad import EnergyVAD, VadCut
+from .streaming import LocalAgreement
+from .stitching import TranscriptStitcher, max_overlap_words
+from .utils import session_paths
+
+SAVE_SEGMENTS = os.getenv("SAVE_SEGMENTS", "0").strip().lower() in {"1", "true", "yes"}
+
+
+@dataclass
+class LiveResult:
+    text: str
+    is_final: bool
+    segment_id: int
+
+
+class LiveDecoder:
+    """
+    Dekodingsdelen av live-motoren: henter vinduer fra ringbufferen, dekoder
+    dem og legger LiveResult i `out_q`. Lesepekeren i ringen flyttes først
+    når et vindu er ferdig dekodet, så en ny dekoder (f.eks. etter omstart av
+    ASR-prosessen) fortsetter der den forrige slapp.
+    """
+
+    def __init__(self, lang_code: str, session_id: str, ring: AudioRingBuffer, out_q,
+                 first_segment_id: int = 0, stop_event=None, live_clock=None):
+        self.lang_code = lang_code
+        self.rec_dir, _ = session_paths(session_id)
+        self.sample_rate = settings.sample_rate
+        self.chunk_seconds = settings.chunk_seconds
+        self.overlap_seconds = settings.overlap_seconds
+        self.vad = EnergyVAD(self.sample_rate) if settings.vad_enabled else None
+        self.ring = ring
+        self.out_q = out_q
+        self.first_segment_id = first_segment_id
+        self.skipped_silence_seconds = 0.0
+        self._seen_overruns = ring.overruns
+        # Fjerner ord som ble hørt to ganger i overlappet mellom to vinduer
+        self.stitcher = TranscriptStitcher(max_overlap_words(self.overlap_seconds))
+        self._stop = stop_event if stop_event is not None else threading.Event()
+        # I ASR-prosessen: delt verdi der tidspunktet for hver live-dekoding meldes til serverprosessen
+        self.live_clock = live_clock
+
+        # Modellen lånes fra det felles registeret, så offline-ASR kan bruke samme kopi
+        self._lease = registry.acquire(settings.asr_model, pick_device(), settings.asr_precision, settings.asr_backend)
+        self.device = self._lease.device
+        self.backend = self._lease.backend
+        # Live går foran offline-arbeid som deler enheten
+        self._scheduler = scheduler_for(self.device)
+        if settings.live_fast_decode and hasattr(self.backend, "enable_fast_decode"):
+            self.backend.enable_fast_decode(live_token_budget())
+        self._decode_ms: deque[float] = deque(maxlen=50)
+
+    def stop(self):
+        self._stop.set()
+
+    def release(self):
+        self._lease.release()
+
+    def _window_lengths(self):
+        chunk_len = int(self.sample_rate * self.chunk_seconds)
+        overlap_len = int(self.sample_rate * self.overlap_seconds)
+        if overlap_len >= chunk_len:
+            overlap_len = max(0, chunk_len // 4)
+        max_len = chunk_len
+        if self.vad:
+            max_len = max(chunk_len, int(self.sample_rate * settings.vad_max_chunk_seconds))
+        return chunk_len, overlap_len, max_len
+
+    def _check_overruns(self):
+        if self.ring.overruns != self._seen_overruns:
+            self._seen_overruns = self.ring.overruns
+            print(f"[live_engine] ASR henger etter opptaket – {self._seen_overruns} overløp i ringbufferen")
+
+    def _transcribe(self, segment: np.ndarray, timestamps: bool = False):
+        """Dekoder ett segment. Returnerer (tekst, tidsstemplede deler)."""
+        options = DecodeOptions(self.lang_code, timestamps=timestamps, fast=settings.live_fast_decode)
+        if self.live_clock is not None:
+            self.live_clock.value = time.monotonic()
+        t0 = time.perf_counter()
+        result = self._scheduler.run(self.backend, [segment], options, Priority.LIVE)[0]
+        self._decode_ms.append((time.perf_counter() - t0) * 1000.0)
+        return result.text, result.segments
+
+    def _save_segment(self, segment: np.ndarray, segment_id: int):
+        wav_path = self.rec_dir / f"seg_{segment_id:06d}.wav"
+        pcm16 = np.clip(segment * 32767.0, -32768, 32767).astype(np.int16)
+        wav_write(wav_path.as_posix(), self.sample_rate, pcm16)
+
+    def _advance(self, n: int):
+        """Flytter lesepekeren forbi `n` samples; de teller da med i VAD-ens støygulv."""
+        if self.vad and n > 0:
+            self.vad.commit(self.ring.peek(n))
+        self.ring.advance(n)
+
+    def _skip_silence(self, n: int, segment_id: int) -> int:
+        self.skipped_silence_seconds += n / self.sample_rate
+        self._advance(n)
+        # Ord som ble holdt tilbake ved et hardt kutt skal ikke vente gjennom stillheten
+        held = self.stitcher.flush()
+        if held:
+            self.out_q.put(LiveResult(text=held, is_final=True, segment_id=segment_id))
+            segment_id += 1
+        return segment_id
+
+    def run(self):
+        if settings.live_streaming:
+            segment_id = self._run_streaming()
+        else:
+            segment_id = self._run_chunked()
+        held = self.stitcher.flush()
+        if held:
+            self.out_q.put(LiveResult(text=held, is_final=True, segment_id=segment_id))
+
+    def _run_chunked(self):
+        """Faste (eller pausestyrte) vinduer, ett endelig resultat per vindu."""
+        chunk_len, overlap_len, max_len = self._window_lengths()
+        segment_id = self.first_segment_id
+        need = chunk_len
+        overlapped = False
+
+        while not self._stop.is_set():
+            if not self.ring.wait(need, timeout=0.2):
+                continue
+            self._check_overruns()
+
+            # View inn i ringbufferen; gyldig helt til vi flytter lesepekeren
+            window = self.ring.peek(min(self.ring.available(), max_len))
+            if self.vad:
+                cut = self.vad.plan(window, chunk_len, max_len)
+                if cut is None:
+                    # Ingen pause ennå – vent på neste lydblokk
+                    need = len(window) + 1
+                    continue
+            else:
+                cut = VadCut(end=chunk_len, speech=True, at_pause=False)
+            need = chunk_len
+
+            segment = window[:cut.end]
+            # Kutt i en pause trenger ikke overlapp; harde kutt beholder OVERLAP_SECONDS
+            advance = cut.end if cut.at_pause else max(1, cut.end - overlap_len)
+
+            if not cut.speech:
+                segment_id = self._skip_silence(advance, segment_id)
+                overlapped = False
+                continue
+
+            if SAVE_SEGMENTS:
+                self._save_segment(segment, segment_id)
+
+            text = ""
+            try:
+                text, _ = self._transcribe(segment)
+            except Exception as e:
+                print(f"[asr] feilet segment {segment_id}: {e}")
+
+            text = self.stitcher.stitch(text, overlapped=overlapped, hard_cut=not cut.at_pause)
+            overlapped = not cut.at_pause
+            self._advance(advance)
+            self.out_q.put(LiveResult(text=text, is_final=True, segment_id=segment_id))
+            segment_id += 1
+        return segment_id
+
+    def _run_streaming(self):
+        """
+        Strømmende modus: dekoder et voksende vindu omtrent hvert
+        STREAM_STEP_SECONDS og sender foreløpig tekst (is_final=False).
+        Ord som to påfølgende hypoteser er enige om, bekreftes. Vinduet
+        avsluttes i en pause (VAD), eller – når det når maks lengde – ved
+        slutten av siste tidsstemplede del som er helt bekreftet.
+        """
+        chunk_len, overlap_len, max_len = self._window_lengths()
+        step = max(1, int(self.sample_rate * settings.stream_step_seconds))
+        agreement = LocalAgreement()
+        segment_id = self.first_segment_id
+        decoded_len = 0
+        last_text = ""
+        overlapped = False
+
+        def finish(text: str, advance: int, hard_cut: bool = False):
+            nonlocal segment_id, decoded_len, last_text, overlapped
+            text = self.stitcher.stitch(text, overlapped=overlapped, hard_cut=hard_cut)
+            overlapped = hard_cut
+            self._advance(advance)
+            self.out_q.put(LiveResult(text=text, is_final=True, segment_id=segment_id))
+            segment_id += 1
+            agreement.reset()
+            decoded_len = 0
+            last_text = ""
+
+        while not self._stop.is_set():
+            if not self.ring.wait(decoded_len + step, timeout=0.2):
+                continue
+            self._check_overruns()
+
+            window = self.ring.peek(min(self.ring.available(), max_len))
+            try:
+                cut = self.vad.plan(window, chunk_len, max_len) if self.vad else None
+                if cut is not None and not cut.speech:
+                    if last_text:
+                        # Foreløpig tekst som aldri ble til tale – lukk den tomt
+                        finish("", 0)
+                    segment_id = self._skip_silence(cut.end, segment_id)
+                    overlapped = False
+                    continue
+                if cut is not None and cut.at_pause:
+                    segment = window[:cut.end]
+                    if SAVE_SEGMENTS:
+                        self._save_segment(segment, segment_id)
+                    text, _ = self._transcribe(segment)
+                    finish(text, cut.end)
+                    continue
+
+                if self.vad and not self.vad.has_speech(self.vad.speech_mask(window)):
+                    # Ingen tale i vinduet ennå – ikke kast bort en dekoding på stillhet
+                    decoded_len = len(window)
+                    continue
+
+                text, segments = self._transcribe(window, timestamps=True)
+                agreement.update(text.split())
+
+                if len(window) >= max_len:
+                    if SAVE_SEGMENTS:
+                        self._save_segment(window, segment_id)
+                    # Trim ved slutten av siste tidsstemplede del som er bekreftet
+                    words_done, trim_end, kept = 0, 0.0, []
+                    for seg in segments:
+                        n = len(seg["text"].split())
+                        end = seg["end"]
+                        if end is None or words_done + n > len(agreement.committed):
+                            break
+                        words_done += n
+                        trim_end = end
+                        kept.append(seg["text"])
+                    advance = int(trim_end * self.sample_rate)
+                    if kept and 0 < advance < len(window):
+                        finish(" ".join(kept), advance)
+                    else:
+                        finish(text, max(1, len(window) - overlap_len), hard_cut=True)
+                    continue
+
+                decoded_len = len(window)
+                interim = self.stitcher.preview(agreement.text(), overlapped)
+                if interim and interim != last_text:
+                    last_text = interim
+                    self.out_q.put(LiveResult(text=interim, is_final=False, segment_id=segment_id))
+            except Exception as e:
+                print(f"[asr] feilet segment {segment_id}: {e}")
+                finish(agreement.text(), max(1, len(window) - overlap_len), hard_cut=True)
+        return segment_id
+
+    def stats(self) -> dict:
+        ring = self.ring.stats()
+        ring["fill_seconds"] = round(ring["fill"] / self.sample_rate, 2)
+        ring["capacity_seconds"] = round(ring["capacity"] / self.sample_rate, 2)
+        decode = {
+            "backend": self._lease.key.backend,
+            "fast_decode": self.backend.fast_decode_active,
+            "last_ms": round(self._decode_ms[-1], 1) if self._decode_ms else None,
+            "avg_ms": round(sum(self._decode_ms) / len(self._decode_ms), 1) if self._decode_ms else None,
+        }
+        return {"ring": ring, "decode": decode, "skipped_silence_seconds": round(self.skipped_silence_seconds, 1)}
\ No newline at end of file
@@ -3,6 +3,7 @@ from __future__ import annotations
 import os
 import asyncio
 import json
+from functools import partial
 from pathlib import Path
 from typing import Optional
 
@@ -13,9 +14,19 @@ from fastapi.templating import Jinja2Templates
 
 from .config import settings
 from .transcription_worker import TranscriptionSession
-from .utils import session_stamp, session_paths
+from .transcript_journal import JOURNAL_NAME, write_live_text
+from .ws_fanout import WSFanout
+from .utils import recording_files, session_stamp, session_paths
 from .summary_llm import summarize_to_markdown
 from .offline_asr import transcribe_many_with_progress
+from .offline_pool import shutdown_pool
+from .model_registry import registry
+from .chunk_cache import chunk_cache
+from .warmup import ensure_warm, warmup_state, run_warmup
+from .refiner import refiner_for
+from .jobs import Job, JobQueueFull, jobs
+from .scheduler import scheduler_stats
+from .thread_budget import parse_cpus, pin, summary as thread_summary
 
 app = FastAPI(
     title="Tekstemaskin",
@@ -31,48 +42,55 @@ async def startup_event():
     print(f"📁 Base directory: {BASE_DIR}")
     print(f"🌐 Server will be available at: http://localhost:8000")
     print(f"🎛️  Control panel: http://localhost:8000/control")
+    # Lås serverprosessen før torch og lydtrådene starter sine tråder. Med ASR-prosessen er
+    # live-kjernene dens, og serverprosessen dekoder bare offline-arbeid.
+    if settings.live_asr_process:
+        pin(parse_cpus(settings.offline_cpus), "serverprosessen")
+    else:
+        pin(parse_cpus(settings.live_cpus), "serverprosessen")
+    # Last og varm opp ASR-modellen i bakgrunnen, så første /start ikke må vente
+    app.state.warmup_task = asyncio.create_task(asyncio.to_thread(run_warmup))
+    jobs.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Log when the application shuts down"""
     print("👋 Tekstemaskin server shutting down...")
+    if BROADCASTER is not None:
+        BROADCASTER.cancel()
+    await jobs.stop()
+    shutdown_pool()
 
 app.mount("/static", StaticFiles(directory=BASE_DIR / "static"), name="static")
 templates = Jinja2Templates(directory=BASE_DIR / "templates")
 
 SESSION: Optional[TranscriptionSession] = None
+BROADCASTER: Optional[asyncio.Task] = None
 # ENDRET LINJE: Bruker det korrekte navnet 'default_lang' fra config.py
 LANG = settings.default_lang
+# Bakgrunnsjobber venter mens en live-økt pågår
+jobs.live_active = lambda: SESSION is not None
+# Live-modellen kan ha blitt kastet for å gi plass til offline-modellen; varm den opp igjen
+jobs.on_idle = ensure_warm
 
 
-class WSManager:
-    def __init__(self):
-        self.active: set[WebSocket] = set()
-    async def connect(self, ws: WebSocket):
-        await ws.accept()
-        self.active.add(ws)
-    def disconnect(self, ws: WebSocket):
-        self.active.discard(ws)
-    async def broadcast_text(self, text: str):
-        stale: list[WebSocket] = []
-        for ws in list(self.active):
-            try:
-                await ws.send_text(text)
-            except Exception:
-                stale.append(ws)
-        for ws in stale:
-            self.disconnect(ws)
-
-manager = WSManager()
+manager = WSFanout(settings.ws_queue_max, settings.ws_send_timeout)
 
 
 @app.get("/health")
 def health():
     """Health check endpoint to verify server is ready"""
+    ensure_warm()
+    asr = warmup_state.as_dict()
+    proc = SESSION.engine.asr_process if SESSION is not None and SESSION.engine is not None else None
+    if proc is not None:
+        # Live-modellen ligger i ASR-prosessen; klar først når den har lastet og varmet opp
+        asr.update(state="ready" if proc.ready else "loading", ready=proc.ready)
     return {
         "status": "healthy", 
         "service": "tekstemaskin",
         "version": "1.0.0",
+        "asr": asr,
         "endpoints": {
             "control": "/control",
             "live": "/live", 
@@ -80,6 +98,15 @@ def health():
         }
     }
 
+@app.get("/stats")
+def stats():
+    """Driftsmetrikk for den aktive økten (ringbuffer-fylling, overløp osv.)"""
+    shared = {"models": registry.stats(), "chunk_cache": chunk_cache.stats(), "jobs": jobs.stats(),
+              "scheduler": scheduler_stats(), "threads": thread_summary(), "websockets": manager.stats()}
+    if SESSION is None:
+        return {"status": "idle", **shared}
+    return {"status": "running", "session": SESSION.session_id, **SESSION.stats(), **shared}
+
 @app.get("/")
 def root():
     return RedirectResponse(url="/control")
@@ -97,85 +124,184 @@ def set_language(lang: str = Form(...)):
     return RedirectResponse(url="/control", status_code=303)
 
 
+async def _broadcast_segments(session_id: str, results):
+    payload = {"type": "segments", "session": session_id, "items": [
+        {"id": r.segment_id, "text": r.text, "final": r.is_final} for r in results
+    ]}
+    # Rene foreløpige hypoteser kan slås sammen for klienter som henger etter; endelige segmenter aldri
+    interim = not any(r.is_final for r in results)
+    await manager.broadcast_text(json.dumps(payload), coalesce="interim" if interim else None)
+
+
 @app.post("/start")
 async def start(device: Optional[int] = Form(None)):
-    global SESSION
+    global SESSION, BROADCASTER
     if SESSION is not None:
         return {"status": "already_running"}
     sid = session_stamp()
     SESSION = TranscriptionSession(lang=LANG, session_id=sid)
-    SESSION.start(device=device)
-    async def broadcaster_async():
-        while SESSION is not None:
-            results = SESSION.poll()
-            if results:
-                payload = {"type": "segments", "items": [{"id": r.segment_id, "text": r.text} for r in results]}
-                await manager.broadcast_text(json.dumps(payload))
-            await asyncio.sleep(0.1)
-    asyncio.create_task(broadcaster_async())
+    # Modell-lån kan vente på en pågående oppvarming; ikke blokker event-loopen imens
+    await asyncio.to_thread(SESSION.start, asyncio.get_running_loop(), device)
+    # Resultatene skyves inn i event-loopen fra motoren; ingen polling
+    BROADCASTER = asyncio.create_task(SESSION.stream_results(partial(_broadcast_segments, sid)))
     return {"status": "started", "session": sid}
 
 
 @app.post("/stop")
-def stop():
-    global SESSION
+async def stop():
+    global SESSION, BROADCASTER
     if SESSION is None:
         return {"status": "not_running"}
-    SESSION.stop()
-    sid = SESSION.session_id
-    SESSION = None
-    return {"status": "stopped", "session": sid}
+    session, SESSION = SESSION, None
+    broadcaster, BROADCASTER = BROADCASTER, None
+    try:
+        await asyncio.to_thread(session.stop)
+    finally:
+        if broadcaster is not None:
+            # Kringkasteren sender de siste resultatene og avslutter av seg selv
+            try:
+                await asyncio.wait_for(broadcaster, timeout=5)
+            except asyncio.TimeoutError:
+                print("[ws] Kringkasteren ble ikke ferdig; avbryter den")
+            except Exception as e:
+                print(f"[ws] Kringkasteren feilet: {e}")
+    return {"status": "stopped", "session": session.session_id}
 
 
-@app.post("/after")
-async def after():
-    if SESSION is not None:
-        return {"status": "busy", "message": "Stopp live-teksting først."}
+def _resolve_session(session: Optional[str]) -> Optional[str]:
+    """Gitt økt hvis den finnes, ellers den nyeste."""
     base = Path("data/transcripts")
+    if session:
+        # Bare rene katalognavn, ingen stier
+        return session if Path(session).name == session and (base / session).is_dir() else None
     all_sessions = sorted([p for p in base.iterdir() if p.is_dir()], key=os.path.getmtime, reverse=True)
-    if not all_sessions:
-        return {"status": "no_session", "message": "Ingen tidligere økter funnet."}
-    latest_sid = all_sessions[0].name
-    rec_dir, txt_dir = session_paths(latest_sid)
-    audio_files = []
-    if (rec_dir / "session.wav").exists():
-        audio_files = [rec_dir / "session.wav"]
-    else:
-        audio_files = sorted(rec_dir.glob("part_*.wav"))
+    return all_sessions[0].name if all_sessions else None
+
+
+async def _status(job: Job, text: str):
+    job.message = text
+    await manager.broadcast_text(json.dumps({"type": "status", "text": text}), coalesce="status")
+
+
+async def _after_job(job: Job, lang: str) -> dict:
+    rec_dir, txt_dir = session_paths(job.session_id)
+    refiner = refiner_for(job.session_id)
+    if refiner is not None:
+        # Bakgrunnsraffineringen har gjort det meste; vent på de siste vinduene
+        await _status(job, "Venter på de siste vinduene...")
+        while not await asyncio.to_thread(refiner.wait, 1.0):
+            await asyncio.to_thread(job.checkpoint)
+        if refiner.complete:
+            await _status(job, "Ferdig! Resultatet er klart.")
+            return {"final": str(refiner.final_path)}
+    audio_files = recording_files(rec_dir)
     if not audio_files:
-        return {"status": "no_audio"}
-    texts = await transcribe_many_with_progress([str(p) for p in audio_files], lang=LANG, ws_manager=manager)
+        raise RuntimeError("Fant ingen lydfiler for økten.")
+    texts = await transcribe_many_with_progress([str(p) for p in audio_files], lang=lang, ws_manager=manager, job=job)
     final_path = txt_dir / "final.txt"
     final_path.write_text("\n".join(texts).strip(), encoding="utf-8")
-    await manager.broadcast_text(json.dumps({"type": "status", "text": "Ferdig! Resultatet er klart."}))
-    return {"status": "ok", "final": str(final_path)}
+    await _status(job, "Ferdig! Resultatet er klart.")
+    return {"final": str(final_path)}
+
+
+async def _summarize_job(job: Job, lang: str) -> dict:
+    final_path = Path("data/transcripts") / job.session_id / "final.txt"
+    if not final_path.exists():
+        raise RuntimeError("Fant ingen transkripsjon for økten.")
+    await _status(job, "Fant transkripsjon. Sender til Ollama for oppsummering...")
+    md = await asyncio.to_thread(summarize_to_markdown, final_path, lang=lang)
+    if md is None:
+        await _status(job, "Feil under oppsummering.")
+        raise RuntimeError("Feil under oppsummering.")
+    await _status(job, "Referat generert!")
+    return {"md": str(md)}
+
+
+def _submit(kind: str, sid: str, run) -> dict:
+    try:
+        job = jobs.submit(kind, sid, run)
+    except JobQueueFull:
+        return {"status": "queue_full", "message": "Jobbkøen er full, prøv igjen senere."}
+    return {"status": "queued", "job": job.as_dict()}
+
+
+@app.post("/asr/restart")
+async def asr_restart():
+    """Starter live-ASR-prosessen på nytt (LIVE_ASR_PROCESS=1). Lyden venter i ringbufferen imens."""
+    if SESSION is None:
+        return {"status": "not_running"}
+    if not await asyncio.to_thread(SESSION.restart_asr):
+        return {"status": "not_supported", "message": "Live-ASR kjører ikke i egen prosess."}
+    return {"status": "restarted"}
+
+
+@app.post("/after")
+async def after(session: Optional[str] = Form(None)):
+    """Legger transkribering av en økt (standard: den nyeste) i jobbkøen."""
+    sid = _resolve_session(session)
+    if sid is None:
+        return {"status": "no_session", "message": "Ingen tidligere økter funnet."}
+    if SESSION is not None and SESSION.session_id == sid:
+        return {"status": "busy", "message": "Stopp live-teksting først."}
+    lang = LANG
+    return _submit("after", sid, lambda job: _after_job(job, lang))
 
 
 @app.post("/summarize")
-async def summarize():
-    if SESSION is not None:
-        return {"status": "busy"}
-    latest = sorted((Path("data/transcripts").glob("*/final.txt")), reverse=True)
-    if not latest:
+async def summarize(session: Optional[str] = Form(None)):
+    """Legger oppsummering av en økt (standard: den nyeste med final.txt) i jobbkøen."""
+    if session:
+        sid = _resolve_session(session)
+    else:
+        latest = sorted((Path("data/transcripts").glob("*/final.txt")), reverse=True)
+        sid = latest[0].parent.name if latest else None
+    if sid is None:
         return {"status": "no_transcript"}
-    final_path = latest[0]
-    await manager.broadcast_text(json.dumps({"type": "status", "text": "Fant transkripsjon. Sender til Ollama for oppsummering..."}))
-    md = await asyncio.to_thread(summarize_to_markdown, final_path, lang=LANG)
-    if md is None:
-        await manager.broadcast_text(json.dumps({"type": "status", "text": "Feil under oppsummering."}))
-        return {"status": "error"}
-    await manager.broadcast_text(json.dumps({"type": "status", "text": "Referat generert!"}))
-    return {"status": "ok", "md": str(md)}
+    pending_after = any(j.kind == "after" and j.session_id == sid and j.active for j in jobs.jobs.values())
+    if not (Path("data/transcripts") / sid / "final.txt").exists() and not pending_after:
+        return {"status": "no_transcript"}
+    lang = LANG
+    return _submit("summarize", sid, lambda job: _summarize_job(job, lang))
+
+
+@app.get("/jobs")
+def list_jobs():
+    return {"jobs": [j.as_dict() for j in reversed(jobs.jobs.values())], **jobs.stats()}
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        return {"status": "not_found"}
+    return {"status": "ok", "job": job.as_dict()}
+
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    job = jobs.cancel(job_id)
+    if job is None:
+        return {"status": "not_found"}
+    return {"status": "ok", "job": job.as_dict()}
 
 
 @app.get("/download/{kind}")
-def download(kind: str):
+def download(kind: str, session: Optional[str] = None):
     base = Path("data/transcripts")
     if kind not in {"live", "final", "md"}:
         return {"status": "unknown"}
     mapping = {"live": "live.txt", "final": "final.txt", "md": "final.md"}
     media_types = {"live": "text/plain", "final": "text/plain", "md": "text/markdown"}
-    latest_files = sorted((base.glob(f"*/{mapping[kind]}")), reverse=True)
+    if session and Path(session).name != session:
+        return {"status": "not_found"}
+    if kind == "live":
+        active = SESSION.session_id if SESSION is not None else None
+        target = session or active
+        if target and (target == active or not (base / target / "live.txt").exists()):
+            # Økten pågår eller krasjet; bygg live.txt fra journalen
+            write_live_text(base / target / JOURNAL_NAME, base / target / "live.txt")
+            session = target
+    latest_files = sorted((base.glob(f"{session or '*'}/{mapping[kind]}")), reverse=True)
     if not latest_files:
         return {"status": "not_found"}
     latest_path = latest_files[0]
@@ -195,8 +321,19 @@ def chroma(request: Request):
 
 
 @app.websocket("/ws")
-async def ws(ws: WebSocket):
+async def ws(ws: WebSocket, session: Optional[str] = None, after: int = -1):
     await manager.connect(ws)
+    if SESSION is not None:
+        # Seere som kobler seg på underveis får de siste segmentene; ved gjenoppkobling bare de nyere.
+        # Klienten hopper uansett over id-er den allerede viser (et segment kan både være
+        # journalført og på vei ut i kringkastingen).
+        tail = SESSION.journal.tail()
+        if session == SESSION.session_id:
+            tail = [s for s in tail if s["id"] > after]
+        if tail:
+            manager.send(ws, json.dumps({"type": "segments", "session": SESSION.session_id, "items": [
+                {"id": s["id"], "text": s["text"], "final": True} for s in tail
+            ]}))
     try:
         while True:
             await ws.receive_text()
@@ -0,0 +1,225 @@
+# app/model_registry.py
+from __future__ import annotations
+
+import gc
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+import torch
+from .asr_backends import ASRBackend, backend_class
+from .config import settings
+
+
+def pick_device(preference: Optional[str] = None):
+    pref = (preference or settings.asr_device or "auto").lower()
+    if pref != "auto":
+        if pref == "cuda" and torch.cuda.is_available():
+            return "cuda:0"
+        return pref
+    try:
+        if getattr(torch.backends, "mps", None) and torch.backends.mps.is_available():
+            return "mps"
+    except Exception:
+        pass
+    if torch.cuda.is_available():
+        return "cuda:0"
+    return "cpu"
+
+
+@dataclass(frozen=True)
+class ModelKey:
+    backend: str
+    model_id: str
+    device: str
+    dtype: str = "fp32"
+
+    @property
+    def ident(self) -> str:
+        """Identifiserer modellens resultater (uavhengig av enhet), f.eks. for resultatcachen."""
+        return f"{self.backend}:{self.model_id}:{self.dtype}"
+
+
+class _Entry:
+    def __init__(self, key: ModelKey):
+        self.key = key
+        self.backend: Optional[ASRBackend] = None
+        self.refs = 0
+        self.last_used = time.monotonic()
+        self.load_lock = threading.Lock()
+
+
+class ModelLease:
+    """Lån av en lastet ASR-backend. Må frigis med release() (eller brukes i with)."""
+
+    def __init__(self, registry: "ModelRegistry", entry: _Entry):
+        self._registry = registry
+        self._entry = entry
+        self.key = entry.key
+        self.backend = entry.backend
+        self.device = entry.key.device
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._registry._release(self._entry)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class ModelRegistry:
+    """
+    Felles register for ASR-modeller i hele prosessen.
+
+    Oppføringene er nøklet på (backend, modell, enhet, presisjon). Live- og
+    offline-ASR låner modeller herfra i stedet for å laste hver sin
+    kopi. Modeller med aktive lån lastes aldri ut. Ubrukte modeller lastes ut
+    etter `idle_ttl` sekunder, og er det flere enn `max_models` i minnet,
+    kastes de minst nylig brukte ubrukte modellene først (LRU). Modeller
+    merket med keep_warm() (den forhåndslastede live-modellen) unntas fra
+    TTL-en, men kan fortsatt kastes ved LRU.
+    """
+
+    def __init__(self, idle_ttl: float, max_models: int):
+        self.idle_ttl = idle_ttl
+        self.max_models = max(1, max_models)
+        self._entries: "OrderedDict[ModelKey, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._janitor: Optional[threading.Thread] = None
+        self._keep_warm: set = set()
+
+    @staticmethod
+    def resolve_key(model_id: Optional[str] = None, device: Optional[str] = None,
+                    dtype: Optional[str] = None, backend: Optional[str] = None) -> ModelKey:
+        cls = backend_class(backend or settings.asr_backend)
+        device = cls.resolve_device(device or pick_device())
+        model_id = cls.resolve_model_id(model_id or settings.asr_model)
+        return ModelKey(cls.name, model_id, device, cls.resolve_precision(dtype, device))
+
+    def acquire(self, model_id: Optional[str] = None, device: Optional[str] = None,
+                dtype: Optional[str] = None, backend: Optional[str] = None) -> ModelLease:
+        key = self.resolve_key(model_id, device, dtype, backend)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _Entry(key)
+                self._entries[key] = entry
+            entry.refs += 1
+            self._entries.move_to_end(key)
+            if entry.backend is None:
+                # Gjør plass før lasting, så to store modeller ikke ligger i minnet samtidig
+                self._evict_locked(reserve=1)
+        try:
+            with entry.load_lock:
+                if entry.backend is None:
+                    entry.backend = self._load(key)
+        except Exception:
+            with self._lock:
+                entry.refs -= 1
+                if entry.backend is None and entry.refs == 0:
+                    self._entries.pop(key, None)
+            raise
+        with self._lock:
+            entry.last_used = time.monotonic()
+            self._evict_locked()
+        self._ensure_janitor()
+        return ModelLease(self, entry)
+
+    def keep_warm(self, key: ModelKey):
+        """Unntar modellen fra idle-TTL-en."""
+        with self._lock:
+            self._keep_warm.add(key)
+
+    def loaded(self, key: ModelKey) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry.backend is not None
+
+    def in_use(self) -> bool:
+        """True når en lastet modell har aktive lån."""
+        with self._lock:
+            return any(e.backend is not None and e.refs > 0 for e in self._entries.values())
+
+    def _load(self, key: ModelKey) -> ASRBackend:
+        print(f"[models] Laster modell '{key.model_id}' til enhet '{key.device}' ({key.backend}, {key.dtype})...")
+        t0 = time.perf_counter()
+        backend = backend_class(key.backend)(key.model_id, key.device, key.dtype)
+        backend.load()
+        print(f"[models] Modell lastet på {time.perf_counter() - t0:.1f} s.")
+        return backend
+
+    def _release(self, entry: _Entry):
+        with self._lock:
+            entry.refs = max(0, entry.refs - 1)
+            entry.last_used = time.monotonic()
+            self._evict_locked()
+
+    def _evict_locked(self, reserve: int = 0):
+        loaded = [e for e in self._entries.values() if e.backend is not None]
+        excess = len(loaded) + reserve - self.max_models
+        for entry in loaded:  # eldste først
+            if excess <= 0:
+                break
+            if entry.refs == 0:
+                self._unload_locked(entry, "LRU")
+                excess -= 1
+        if excess > 0 and not reserve:
+            print(f"[models] {len(loaded)} modeller i bruk samtidig (maks {self.max_models}).")
+
+    def _unload_locked(self, entry: _Entry, reason: str):
+        print(f"[models] Laster ut '{entry.key.model_id}' på '{entry.key.device}' ({reason}).")
+        self._entries.pop(entry.key, None)
+        entry.backend = None
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        try:
+            if getattr(torch.backends, "mps", None) and torch.backends.mps.is_available():
+                torch.mps.empty_cache()
+        except Exception:
+            pass
+
+    def _ensure_janitor(self):
+        if self.idle_ttl <= 0 or (self._janitor and self._janitor.is_alive()):
+            return
+        self._janitor = threading.Thread(target=self._janitor_loop, daemon=True)
+        self._janitor.start()
+
+    def _janitor_loop(self):
+        interval = max(1.0, min(30.0, self.idle_ttl / 2))
+        while True:
+            time.sleep(interval)
+            now = time.monotonic()
+            with self._lock:
+                for entry in list(self._entries.values()):
+                    if entry.key in self._keep_warm:
+                        continue
+                    if entry.backend is not None and entry.refs == 0 and now - entry.last_used > self.idle_ttl:
+                        self._unload_locked(entry, "ubrukt")
+
+    def stats(self) -> list[dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "backend": e.key.backend,
+                    "model": e.key.model_id,
+                    "device": e.key.device,
+                    "dtype": e.key.dtype,
+                    "refs": e.refs,
+                    "loaded": e.backend is not None,
+                    "keep_warm": e.key in self._keep_warm,
+                    "idle_seconds": round(now - e.last_used, 1) if e.refs == 0 else 0.0,
+                }
+                for e in self._entries.values()
+            ]
+
+
+registry = ModelRegistry(settings.asr_model_idle_ttl, settings.asr_max_loaded_models)
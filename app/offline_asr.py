@@ -2,33 +2,59 @@
 from __future__ import annotations
 import os
 from pathlib import Path
-from typing import List
-from functools import lru_cache
+from typing import Iterator, List, Optional
 import json
 import asyncio
 
-import torch
-import torchaudio
-from transformers import WhisperProcessor, WhisperForConditionalGeneration
-
 from .config import settings
-from .stt_engine import pick_device
+from .model_registry import registry, pick_device, ModelLease
+from .asr_backends import DecodeOptions
+from .audio_io import AudioReader, prefetch
+from .chunk_cache import decode_cached
+from .offline_chunking import SR, Window, WindowJoiner, escalation_summary, format_mmss, iter_windows
+from .offline_pool import pool_workers, transcribe_parallel
+from .scheduler import Priority, scheduler_for
+from .jobs import Job, JobCancelled
 
 # Anbefalinger for offline-transkribering
 OFFLINE_NUM_BEAMS = int(os.getenv("OFFLINE_NUM_BEAMS", "5") or 5)
+# Antall 30 s-vinduer som dekodes i samme generate()-kall
+OFFLINE_BATCH_SIZE = max(1, int(os.getenv("OFFLINE_BATCH_SIZE", "8") or 8))
+
+
+def offline_options(lang: str) -> DecodeOptions:
+    # Tidsstempler trengs for å rydde opp i overlappen der det ikke fantes en pause
+    return DecodeOptions(
+        lang,
+        num_beams=OFFLINE_NUM_BEAMS,
+        timestamps=True,
+        adaptive=settings.offline_adaptive_beams,
+        logprob_threshold=settings.offline_logprob_threshold,
+        compression_threshold=settings.offline_compression_threshold,
+    )
+
+
+def _window_batches(reader: AudioReader, size: int) -> Iterator[List[Window]]:
+    """Leser filen blokkvis og gir vinduer i batcher på `size`."""
+    batch: List[Window] = []
+    covered = 0.0
+    for window in iter_windows(reader.blocks()):
+        covered += window.seconds - window.overlap_prev / SR
+        batch.append(window)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+    skipped = reader.duration - covered
+    if skipped > 1.0:
+        print(f"[offline_asr] {reader.path.name}: hoppet over ~{skipped:.0f} s stillhet")
+
+
+def _decode(lease: ModelLease, audio: List, options: DecodeOptions):
+    # Gjennom inferenskøen, så en live-økt på samme enhet alltid går foran
+    return scheduler_for(lease.device).run(lease.backend, audio, options, Priority.OFFLINE)
 
-@lru_cache(maxsize=1)
-def _build_asr_components():
-    """Bygger og gjenbruker ASR-modell og prosessor."""
-    device = pick_device()
-    print(f"[offline_asr] Laster modell '{settings.asr_model}' til enhet '{device}'...")
-    
-    processor = WhisperProcessor.from_pretrained(settings.asr_model)
-    model = WhisperForConditionalGeneration.from_pretrained(settings.asr_model).to(device)
-    model.config.forced_decoder_ids = None
-        
-    print("[offline_asr] Modell lastet.")
-    return model, processor, device
 
 # Denne funksjonen beholdes som en fallback, i tilfelle den trengs et annet sted
 def transcribe_many(paths: List[str], lang: str) -> List[str]:
@@ -38,38 +64,58 @@ def transcribe_many(paths: List[str], lang: str) -> List[str]:
     if lang == "nb":
         lang = "no"
 
-    model, processor, device = _build_asr_components()
+    workers = pool_workers()
+    if workers:
+        return transcribe_parallel(paths, offline_options(lang), workers)
+
+    device = pick_device(settings.offline_device)
+    with registry.acquire(settings.offline_asr_model, device, settings.offline_precision,
+                          settings.offline_backend) as lease:
+        return _transcribe_paths(paths, lang, lease)
+
+
+def _transcribe_paths(paths: List[str], lang: str, lease: ModelLease) -> List[str]:
     texts: List[str] = []
-    
+    options = offline_options(lang)
+    decoded = escalated = 0
+
     for p_str in paths:
-        # Denne enklere versjonen splitter også filen manuelt for robusthet
-        waveform, sample_rate = torchaudio.load(p_str)
-        if sample_rate != 16000:
-            resampler = torchaudio.transforms.Resample(sample_rate, 16000)
-            waveform = resampler(waveform)
-        
-        chunk_size_frames = 30 * 16000
-        num_chunks = torch.ceil(torch.tensor(waveform.shape[1] / chunk_size_frames)).int().item()
-        
-        full_transcription = []
-        for chunk_idx in range(num_chunks):
-            start_frame = chunk_idx * chunk_size_frames
-            end_frame = start_frame + chunk_size_frames
-            chunk_waveform = waveform[:, start_frame:end_frame]
-            
-            input_features = processor(chunk_waveform.squeeze().numpy(), sampling_rate=16000, return_tensors="pt").input_features.to(device)
-            generate_args = {"language": lang, "task": "transcribe", "num_beams": OFFLINE_NUM_BEAMS}
-            predicted_ids = model.generate(input_features, **generate_args)
-            result_text = processor.batch_decode(predicted_ids, skip_special_tokens=True)[0]
-            full_transcription.append(result_text.strip())
-            
-        texts.append(" ".join(full_transcription))
+        # Lesing og vindusplanlegging går i en egen tråd mens modellen dekoder
+        joiner = WindowJoiner()
+        for batch in prefetch(_window_batches(AudioReader(p_str), OFFLINE_BATCH_SIZE)):
+            results, _ = decode_cached(lambda audio, opts: _decode(lease, audio, opts),
+                                       [w.audio for w in batch], lease.key.ident, options)
+            decoded += len(batch)
+            escalated += sum(r.escalated for r in results)
+            for w, r in zip(batch, results):
+                joiner.add(w, r)
+        texts.append(joiner.text())
+    if options.adaptive:
+        print(f"[offline_asr] {escalation_summary(escalated, decoded)}")
     return texts
 
+def _durations(paths: List[str]) -> List[float]:
+    durations = []
+    for p in paths:
+        try:
+            durations.append(AudioReader(p).duration)
+        except Exception:
+            durations.append(0.0)
+    return durations
+
+
+async def _status(ws_manager, job: Optional[Job], text: str):
+    if job is not None:
+        job.message = text
+    await ws_manager.broadcast_text(json.dumps({"type": "status", "text": text}), coalesce="status")
+
+
 # NY async-funksjon med progress-rapportering
-async def transcribe_many_with_progress(paths: List[str], lang: str, ws_manager) -> List[str]:
+async def transcribe_many_with_progress(paths: List[str], lang: str, ws_manager,
+                                        job: Optional[Job] = None) -> List[str]:
     """
     Transkriberer filer og sender fremdriftsoppdateringer via en WebSocket-manager.
+    Med `job` oppdateres også jobbens fremdrift, og den kan avbrytes mellom bitene.
     """
     if not paths:
         return []
@@ -77,64 +123,101 @@ async def transcribe_many_with_progress(paths: List[str], lang: str, ws_manager)
     if lang == "nb":
         lang = "no"
 
-    model, processor, device = _build_asr_components()
+    workers = pool_workers()
+    if workers:
+        return await _transcribe_parallel_with_progress(paths, lang, ws_manager, workers, job)
+
+    # Lasting kan ta tid første gang, så det skjer utenfor event-loopen
+    lease = await asyncio.to_thread(registry.acquire, settings.offline_asr_model,
+                                    pick_device(settings.offline_device), settings.offline_precision,
+                                    settings.offline_backend)
+    try:
+        return await _transcribe_paths_with_progress(paths, lang, ws_manager, lease, job)
+    finally:
+        lease.release()
+
+
+async def _transcribe_parallel_with_progress(paths: List[str], lang: str, ws_manager, workers: int,
+                                             job: Optional[Job] = None) -> List[str]:
+    loop = asyncio.get_running_loop()
+    options = offline_options(lang)
+
+    def progress(text: str):
+        # Kalles fra pool-tråden; meldingen sendes fra event-loopen
+        asyncio.run_coroutine_threadsafe(_status(ws_manager, job, text), loop)
+
+    return await asyncio.to_thread(transcribe_parallel, paths, options, workers, progress, job)
+
+
+async def _transcribe_paths_with_progress(paths: List[str], lang: str, ws_manager, lease: ModelLease,
+                                          job: Optional[Job] = None) -> List[str]:
     texts: List[str] = []
-    
-    total_files = len(paths)
-    for i, p_str in enumerate(paths, start=1):
+    options = offline_options(lang)
+    decoded = escalated = 0
+
+    durations = await asyncio.to_thread(_durations, paths)
+    total = sum(durations)
+    offset = 0.0
+    if job is not None:
+        job.advance(0.0, total)
+
+    for p_str, duration in zip(paths, durations):
         path = Path(p_str)
         try:
-            info = await asyncio.to_thread(torchaudio.info, path)
-            dur = int(info.num_frames / info.sample_rate)
-            
-            await ws_manager.broadcast_text(json.dumps({
-                "type": "status", 
-                "text": f"Starter behandling av {path.name} ({dur//60:02d}:{dur%60:02d})..."
-            }))
-
-            waveform, sample_rate = await asyncio.to_thread(torchaudio.load, path)
-            if sample_rate != 16000:
-                resampler = torchaudio.transforms.Resample(sample_rate, 16000)
-                waveform = resampler(waveform)
-
-            chunk_size_frames = 30 * 16000
-            num_chunks = torch.ceil(torch.tensor(waveform.shape[1] / chunk_size_frames)).int().item()
-            
-            full_transcription = []
-            for chunk_idx in range(num_chunks):
-                # Oppdater status for hver bit
-                await ws_manager.broadcast_text(json.dumps({
-                    "type": "status", 
-                    "text": f"Behandler bit {chunk_idx + 1} av {num_chunks}..."
-                }))
-                
-                start_frame = chunk_idx * chunk_size_frames
-                end_frame = start_frame + chunk_size_frames
-                chunk_waveform = waveform[:, start_frame:end_frame]
-                
-                # Forbered input-data
-                input_features = processor(
-                    chunk_waveform.squeeze().numpy(), 
-                    sampling_rate=16000, 
-                    return_tensors="pt"
-                ).input_features.to(device)
-
-                # Definer genereringsargumenter
-                generate_args = {"language": lang, "task": "transcribe", "num_beams": OFFLINE_NUM_BEAMS}
-                
-                # Selve modellkallet er blokkerende, så vi kjører det i en egen tråd
-                predicted_ids = await asyncio.to_thread(model.generate, input_features, **generate_args)
-
-                result_text = processor.batch_decode(predicted_ids, skip_special_tokens=True)[0]
-                full_transcription.append(result_text.strip())
-
-            texts.append(" ".join(full_transcription))
-            await ws_manager.broadcast_text(json.dumps({"type": "status", "text": f"Ferdig med {path.name}."}))
+            reader = await asyncio.to_thread(AudioReader, path)
+            dur = format_mmss(reader.duration)
+
+            await _status(ws_manager, job, f"Starter behandling av {path.name} ({dur})...")
+
+            # Lesing og vindusplanlegging går i en egen tråd mens modellen dekoder;
+            # bare noen få batcher med lyd ligger i minnet samtidig
+            batches = prefetch(_window_batches(reader, OFFLINE_BATCH_SIZE))
+            joiner = WindowJoiner()
+            done = 0
+            try:
+                while True:
+                    batch = await asyncio.to_thread(next, batches, None)
+                    if batch is None:
+                        break
+                    if job is not None:
+                        # Avbryt eller vent på live-tekstingen her, mellom bitene
+                        await asyncio.to_thread(job.checkpoint)
+                    span = f"{done + 1}" if len(batch) == 1 else f"{done + 1}–{done + len(batch)}"
+                    await _status(ws_manager, job,
+                                  f"Behandler bit {span} ({format_mmss(batch[0].start / SR)} av {dur})...")
+                    # Hele batchen dekodes i ett blokkerende kall, så vi kjører det i en egen tråd.
+                    # Vinduer som er dekodet før (f.eks. i en avbrutt kjøring) hentes fra cachen.
+                    results, hits = await asyncio.to_thread(
+                        decode_cached, lambda audio, opts: _decode(lease, audio, opts),
+                        [w.audio for w in batch], lease.key.ident, options,
+                    )
+                    decoded += len(batch)
+                    escalated += sum(r.escalated for r in results)
+                    cached = " fra cache" if hits == len(batch) else ""
+                    for window, result in zip(batch, results):
+                        done += 1
+                        joiner.add(window, result)
+                        end = (window.start + len(window.audio)) / SR
+                        if job is not None:
+                            job.advance(offset + end)
+                        await _status(ws_manager, job, f"Behandlet bit {done}{cached} ({format_mmss(end)} av {dur})...")
+            finally:
+                batches.close()
 
+            texts.append(joiner.text())
+            await _status(ws_manager, job, f"Ferdig med {path.name}.")
+
+        except JobCancelled:
+            raise
         except Exception as e:
             error_msg = f"FEIL ved behandling av {path.name}: {e}"
             print(f"[offline_asr] {error_msg}")
             texts.append(error_msg)
-            await ws_manager.broadcast_text(json.dumps({"type": "status", "text": error_msg}))
-            
-    return texts
\ No newline at end of file
+            await _status(ws_manager, job, error_msg)
+        offset += duration
+
+    if options.adaptive:
+        summary = escalation_summary(escalated, decoded)
+        print(f"[offline_asr] {summary}")
+        await _status(ws_manager, job, summary)
+    return texts
@@ -0,0 +1,160 @@
+# app/offline_chunking.py
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from .asr_backends import Transcript
+from .config import settings
+from .stitching import TranscriptStitcher, max_overlap_words
+from .vad import EnergyVAD
+
+SR = 16000
+WINDOW_SECONDS = 30  # Whispers faste inputlengde
+
+# Ønsket vinduslengde; kuttet legges i pausen nærmest denne, aldri over 30 s
+OFFLINE_CHUNK_SECONDS = float(os.getenv("OFFLINE_CHUNK_SECONDS", "28") or 28)
+# Overlapp mellom vinduer når det ikke finnes noen pause å kutte i
+OFFLINE_OVERLAP_SECONDS = float(os.getenv("OFFLINE_OVERLAP_SECONDS", "1.0") or 1.0)
+
+
+@dataclass
+class Window:
+    start: int          # første sample i opptaket
+    audio: np.ndarray
+    overlap_prev: int   # samples delt med forrige vindu (0 = kuttet i pause)
+    overlap_next: int = 0
+
+    @property
+    def seconds(self) -> float:
+        return len(self.audio) / SR
+
+
+def iter_windows(blocks: Iterable[np.ndarray]) -> Iterator[Window]:
+    """
+    Deler en strøm av 16 kHz mono-blokker i vinduer på høyst 30 s for
+    offline-dekoding. Bare litt over ett vindu av lyden holdes i minnet.
+
+    Bruker samme VAD som live-motoren: kuttet legges i pausen nærmest
+    OFFLINE_CHUNK_SECONDS. Finnes ingen pause, kuttes det ved 30 s med
+    OFFLINE_OVERLAP_SECONDS overlapp, og overlappen ryddes opp av
+    WindowJoiner. Vinduer som bare er stillhet tas ikke med; her gjelder
+    OFFLINE_VAD_THRESHOLD_DB og OFFLINE_VAD_MIN_SPEECH_MS, som er
+    strengere enn live-VAD-en, så bare helt stille vinduer hoppes over.
+    """
+    vad = EnergyVAD(SR, settings.offline_vad_threshold_db, settings.offline_vad_min_speech_ms)
+    max_len = WINDOW_SECONDS * SR
+    target = min(max_len, int(OFFLINE_CHUNK_SECONDS * SR))
+    overlap = min(max_len // 4, int(OFFLINE_OVERLAP_SECONDS * SR))
+
+    source = iter(blocks)
+    exhausted = False
+    buf = np.zeros(0, dtype=np.float32)
+    base = 0     # posisjonen i opptaket til buf[0]
+    pos = 0      # starten på neste vindu
+    carried = 0  # overlapp inn i neste vindu
+    # Et vindu holdes tilbake til vi vet om neste vindu faktisk overlapper det
+    pending: Optional[Window] = None
+
+    while True:
+        while not exhausted and len(buf) - (pos - base) <= max_len:
+            block = next(source, None)
+            if block is None:
+                exhausted = True
+                break
+            buf = np.concatenate((buf[pos - base:], block))
+            base = pos
+        rest = buf[pos - base: pos - base + max_len]
+        if len(rest) == 0:
+            break
+        cut = vad.plan(rest, target, max_len) if len(buf) - (pos - base) > max_len else None
+        if cut is None:
+            # Siste del av opptaket får plass i ett vindu
+            if vad.has_speech(vad.speech_mask(rest)):
+                if pending is not None:
+                    yield pending
+                pending = Window(pos, rest.copy(), carried)
+            elif pending is not None:
+                pending.overlap_next = 0
+            break
+        if not cut.speech:
+            vad.commit(rest[:cut.end])
+            pos += cut.end
+            carried = 0
+            if pending is not None:
+                pending.overlap_next = 0
+                yield pending
+                pending = None
+            continue
+        ov = 0 if cut.at_pause else overlap
+        if pending is not None:
+            yield pending
+        pending = Window(pos, rest[:cut.end].copy(), carried, ov)
+        vad.commit(rest[:cut.end - ov])
+        pos += cut.end - ov
+        carried = ov
+
+    if pending is not None:
+        yield pending
+
+
+def format_mmss(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+
+def escalation_summary(escalated: int, windows: int) -> str:
+    """Oppsummering av adaptiv beam search, for logg og statusmelding."""
+    share = 100.0 * escalated / windows if windows else 0.0
+    return f"Beam search brukt på {escalated} av {windows} vinduer ({share:.0f} %)."
+
+
+def window_text(window: Window, result: Transcript, trim_prev: bool = True) -> str:
+    """
+    Teksten et vindu bidrar med. I overlappene beholdes hver tidsstemplet
+    del bare i det vinduet der midtpunktet dens ligger på riktig side av
+    midten av overlappen, så ord ikke dobles eller kuttes ved grensene.
+    Uten tidsstempler gis hele teksten; da må WindowJoiner rydde overlappen.
+    """
+    if not (window.overlap_prev or window.overlap_next) or not result.segments:
+        return result.text
+    lo = window.overlap_prev / 2 / SR if trim_prev else 0.0
+    hi = window.seconds - window.overlap_next / 2 / SR
+    parts = []
+    for seg in result.segments:
+        start = seg["start"] or 0.0
+        end = seg["end"] if seg["end"] is not None else window.seconds
+        if lo <= (start + end) / 2 < hi and seg["text"]:
+            parts.append(seg["text"])
+    return " ".join(parts)
+
+
+class WindowJoiner:
+    """
+    Setter sammen vindustekstene til én fil, i rekkefølge.
+
+    Har begge sider av et overlapp tidsstempler, deles det på midten (se
+    window_text()). Mangler én av dem tidsstempler, fjernes overlappet ord
+    for ord fra starten av det nye vinduet, som i live-skjøtingen.
+    """
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self._stitcher = TranscriptStitcher(max_overlap_words(OFFLINE_OVERLAP_SECONDS), hold_back=0)
+        self._prev_timed = True
+
+    def add(self, window: Window, result: Transcript) -> str:
+        timed = bool(result.segments)
+        text = window_text(window, result, trim_prev=self._prev_timed)
+        overlapped = bool(window.overlap_prev) and not (timed and self._prev_timed)
+        text = self._stitcher.stitch(text, overlapped=overlapped)
+        self._prev_timed = timed
+        if text:
+            self.parts.append(text)
+        return text
+
+    def text(self) -> str:
+        return " ".join(self.parts)
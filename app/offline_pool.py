@@ -0,0 +1,281 @@
+# app/offline_pool.py
+"""
+Parallell offline-transkribering på CPU med en prosesspool.
+
+Hovedprosessen leser filene blokkvis og planlegger vinduene (som i
+offline_asr), og sender hvert vindu til en ledig arbeiderprosess. Hver
+arbeider har sin egen modell (gjerne OFFLINE_PRECISION=int8) og et fast
+trådbudsjett, så N arbeidere x M tråder holder seg innenfor OFFLINE_THREADS
+uten at trådene konkurrerer (se thread_budget). Vinduene settes sammen igjen
+i opprinnelig rekkefølge, også på tvers av part_XX.wav-filer.
+
+Poolen startes først når et vindu ikke finnes i chunk-cachen, og beholdes
+mellom jobbene, så arbeiderne ikke laster modellen på nytt hver gang. Den
+stoppes når den har stått ubrukt i ASR_MODEL_IDLE_TTL, som modellene i
+hovedprosessen.
+"""
+from __future__ import annotations
+
+import multiprocessing as mp
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from .asr_backends import ASRBackend, DecodeOptions, Transcript, adaptive_passes
+from .audio_io import AudioReader, prefetch
+from .config import settings
+from .chunk_cache import chunk_cache
+from .model_registry import ModelLease, registry, pick_device
+from .thread_budget import offline_threads, parse_cpus, pin
+from .offline_chunking import SR, Window, WindowJoiner, escalation_summary, format_mmss, iter_windows
+
+# Lånet til arbeiderprosessens egen modell, satt av _init_worker
+_worker_lease: Optional[ModelLease] = None
+
+# Poolen som deles av jobbene, og hvor mange jobber som bruker den nå
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_users = 0
+_pool_last_used = 0.0
+_pool_lock = threading.Lock()
+_janitor: Optional[threading.Thread] = None
+
+
+def pool_workers() -> int:
+    """Antall arbeidere som skal brukes, eller 0 når parallell modus er av."""
+    workers = settings.offline_workers
+    if workers <= 1:
+        return 0
+    device = pick_device(settings.offline_device)
+    if not device.startswith("cpu"):
+        print(f"[offline_pool] OFFLINE_WORKERS gjelder bare CPU, kjører på '{device}' i én prosess.")
+        return 0
+    return workers
+
+
+def worker_threads(workers: int) -> int:
+    if settings.offline_worker_threads > 0:
+        return settings.offline_worker_threads
+    return max(1, offline_threads() // workers)
+
+
+def _init_worker(threads: int, model_id: str, precision: str, backend: str):
+    global _worker_lease
+    import torch
+    from .model_registry import registry
+
+    # Låses før torch starter trådene sine, så de arver kjernene
+    pin(parse_cpus(settings.offline_cpus), "offline-arbeider")
+    torch.set_num_threads(threads)
+    _worker_lease = registry.acquire(model_id, "cpu", precision, backend)
+
+
+def _decode(audio, options: DecodeOptions, greedy: Optional[Transcript]) -> Tuple[Transcript, Transcript]:
+    """
+    Dekoder ett vindu i arbeideren, med passene fra adaptive_passes().
+    `greedy` er første pass hentet fra cachen, eller None. Gir (første pass,
+    endelig resultat), så hovedprosessen kan cache hvert pass for seg.
+    """
+    backend = _worker_lease.backend
+    first, beam = adaptive_passes(options)
+    if greedy is None:
+        greedy = backend.transcribe([audio], first)[0]
+    if beam is None or not backend.needs_beam(greedy, options):
+        return greedy, greedy
+    result = backend.transcribe([audio], beam)[0]
+    result.escalated = True
+    return greedy, result
+
+
+def _cached_passes(audio, model: str, options: DecodeOptions):
+    """
+    Slår opp vinduet i cachen, pass for pass (som decode_cached()).
+    Returnerer (første pass eller None, endelig resultat eller None, nøkler eller None).
+    """
+    if not chunk_cache.enabled:
+        return None, None, None
+    first, beam = adaptive_passes(options)
+    keys = (chunk_cache.key(audio, model, first), chunk_cache.key(audio, model, beam) if beam else None)
+    greedy = chunk_cache.get(keys[0])
+    if greedy is None or beam is None or not ASRBackend.needs_beam(greedy, options):
+        return greedy, greedy, keys
+    result = chunk_cache.get(keys[1])
+    if result is not None:
+        result.escalated = True
+    return greedy, result, keys
+
+
+def _acquire_pool(workers: int, threads: int) -> ProcessPoolExecutor:
+    global _pool, _pool_users, _janitor
+    with _pool_lock:
+        if _pool is None:
+            print(f"[offline_pool] Starter {workers} arbeidere x {threads} tråder")
+            _pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=mp.get_context("spawn"), initializer=_init_worker,
+                initargs=(threads, settings.offline_asr_model, settings.offline_precision,
+                          settings.offline_backend),
+            )
+        _pool_users += 1
+        if settings.asr_model_idle_ttl > 0 and not (_janitor and _janitor.is_alive()):
+            _janitor = threading.Thread(target=_janitor_loop, daemon=True, name="offline-pool-janitor")
+            _janitor.start()
+        return _pool
+
+
+def _release_pool():
+    global _pool_users, _pool_last_used
+    with _pool_lock:
+        _pool_users = max(0, _pool_users - 1)
+        _pool_last_used = time.monotonic()
+
+
+def _discard_pool(pool: ProcessPoolExecutor, reason: str):
+    """Tar poolen ut av bruk; neste jobb starter en ny."""
+    global _pool
+    with _pool_lock:
+        if _pool is not pool:
+            return
+        _pool = None
+    print(f"[offline_pool] Stopper arbeiderne ({reason}).")
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _janitor_loop():
+    ttl = settings.asr_model_idle_ttl
+    while True:
+        time.sleep(max(1.0, min(30.0, ttl / 2)))
+        with _pool_lock:
+            pool = _pool if _pool_users == 0 and time.monotonic() - _pool_last_used > ttl else None
+        if pool is not None:
+            _discard_pool(pool, "ubrukt")
+
+
+def shutdown_pool():
+    """Stopper arbeiderne, f.eks. når serveren avsluttes."""
+    pool = _pool
+    if pool is not None:
+        _discard_pool(pool, "avslutter")
+
+
+def _windows(paths: List[str]) -> Iterator[Tuple[int, Optional[Window], Optional[str]]]:
+    """Gir (filnummer, vindu, feil) for alle filene; vindu=None markerer slutten på en fil."""
+    for idx, p_str in enumerate(paths):
+        try:
+            for window in iter_windows(AudioReader(p_str).blocks()):
+                yield idx, window, None
+        except Exception as e:
+            yield idx, None, f"FEIL ved behandling av {Path(p_str).name}: {e}"
+            continue
+        yield idx, None, None
+
+
+def transcribe_parallel(paths: List[str], options: DecodeOptions, workers: int,
+                        progress: Optional[Callable[[str], None]] = None, job=None) -> List[str]:
+    """
+    Transkriberer filene med `workers` prosesser. Blokkerer til alt er ferdig.
+    Med `job` (se jobs.Job) oppdateres fremdriften, og jobben kan avbrytes
+    før hvert nye vindu sendes til poolen.
+    """
+    report = progress or (lambda text: None)
+    threads = worker_threads(workers)
+    report(f"Starter parallell behandling av {len(paths)} fil(er) med {workers} prosesser...")
+
+    names = [Path(p).name for p in paths]
+    seconds = []
+    for p in paths:
+        try:
+            seconds.append(AudioReader(p).duration)
+        except Exception:
+            seconds.append(0.0)
+    durations = [format_mmss(s) if s else "--:--" for s in seconds]
+    offsets = [sum(seconds[:i]) for i in range(len(paths))]
+    if job is not None:
+        job.advance(0.0, sum(seconds))
+
+    joiners = [WindowJoiner() for _ in paths]
+    texts: List[str] = ["" for _ in paths]
+    done = [0 for _ in paths]
+    escalated = 0
+    errors: List[Optional[str]] = [None for _ in paths]
+    model = registry.resolve_key(settings.offline_asr_model, "cpu", settings.offline_precision,
+                                 settings.offline_backend).ident
+    # Hver arbeider har ett vindu i arbeid og ett i kø; mer lyd enn det ligger ikke i minnet
+    max_inflight = workers * 2
+    inflight: deque = deque()
+    pool: Optional[ProcessPoolExecutor] = None
+
+    def drain_one():
+        nonlocal escalated
+        idx, window, payload, keys = inflight.popleft()
+        if window is None:
+            # Slutten på en fil; alle vinduene foran er allerede satt sammen
+            error = payload or errors[idx]
+            texts[idx] = error or joiners[idx].text()
+            if error:
+                print(f"[offline_pool] {error}")
+            report(error or f"Ferdig med {names[idx]}.")
+            return
+        try:
+            greedy, result = payload.result()
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                _discard_pool(pool, "en arbeider døde")
+            errors[idx] = errors[idx] or f"FEIL ved behandling av {names[idx]}: {e}"
+            return
+        if keys:
+            chunk_cache.put(keys[0], greedy)
+            if result is not greedy:
+                chunk_cache.put(keys[1], result)
+        escalated += result.escalated
+        joiners[idx].add(window, result)
+        done[idx] += 1
+        end = (window.start + len(window.audio)) / SR
+        if job is not None:
+            job.advance(offsets[idx] + end)
+        report(f"{names[idx]}: behandlet bit {done[idx]} ({format_mmss(end)} av {durations[idx]})...")
+
+    source = prefetch(_windows(paths), depth=max_inflight)
+    try:
+        for idx, window, error in source:
+            if window is None:
+                inflight.append((idx, None, error, None))
+                continue
+            if job is not None:
+                job.checkpoint()
+            greedy, cached, keys = _cached_passes(window.audio, model, options)
+            if cached is not None:
+                # Ferdig fra før; legges i køen så rekkefølgen beholdes
+                done_future: Future = Future()
+                done_future.set_result((greedy, cached))
+                inflight.append((idx, window, done_future, None))
+            else:
+                if pool is None:
+                    # Først her: er alt i cachen, startes ingen arbeidere
+                    pool = _acquire_pool(workers, threads)
+                future = pool.submit(_decode, window.audio, options, greedy)
+                inflight.append((idx, window, future, keys))
+            while sum(1 for item in inflight if item[1] is not None) >= max_inflight:
+                drain_one()
+        while inflight:
+            drain_one()
+    except BaseException as e:
+        # Avbrutt: vinduer som ennå ikke er startet, dekodes ikke. Poolen lever videre
+        # for neste jobb; de som allerede dekodes, gjør seg bare ferdige.
+        for _, window, payload, _ in inflight:
+            if window is not None:
+                payload.cancel()
+        if isinstance(e, BrokenProcessPool) and pool is not None:
+            _discard_pool(pool, "en arbeider døde")
+        raise
+    finally:
+        source.close()
+        if pool is not None:
+            _release_pool()
+    if options.adaptive:
+        summary = escalation_summary(escalated, sum(done))
+        print(f"[offline_pool] {summary}")
+        report(summary)
+    return texts
@@ -0,0 +1,207 @@
+# app/refiner.py
+"""
+Bakgrunnsraffinering av opptaket mens økten pågår.
+
+Refineren får de samme PCM16-blokkene som skrives til opptaksfilen
+(session.* / part_XX.*), planlegger vinduer på samme måte som offline-ASR og dekoder ferdige vinduer
+med offline-innstillingene. Resultatene havner i chunk-cachen, og fordi
+vinduene og lyden er identiske med det offline-ASR senere leser fra fil, er
+/after for det meste cache-treff (med BIGFILE_FORMAT=opus er lyden i filen
+ikke lenger identisk, men final.txt fra refineren brukes uansett). Ved /stop gjenstår bare de siste vinduene,
+og final.txt skrives like etter.
+
+Live-ASR har forrang: vinduene dekodes med raffineringsprioritet i
+inferenskøen (scheduler), refineren venter så lenge live-motoren har mer enn
+ett vindu liggende i ringbufferen, og tråden kjører med lavere prioritet der
+operativsystemet støtter det.
+"""
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .audio_io import BLOCK_SECONDS, SR, StreamResampler
+from .chunk_cache import decode_cached
+from .config import settings
+from .model_registry import registry, pick_device, ModelLease
+from .offline_asr import offline_options
+from .offline_chunking import WindowJoiner, iter_windows
+from .scheduler import Priority, scheduler_for
+
+# Refinere som fortsatt gjør ferdig etter /stop, slik at /after kan vente på dem
+_active: Dict[str, "SessionRefiner"] = {}
+
+
+def refiner_for(session_id: str) -> Optional["SessionRefiner"]:
+    return _active.get(session_id)
+
+
+class SessionRefiner:
+    def __init__(self, session_id: str, lang: str, txt_dir: Path, sample_rate: int,
+                 live_busy: Callable[[], bool]):
+        self.session_id = session_id
+        self.lang = "no" if lang == "nb" else lang
+        self.txt_dir = Path(txt_dir)
+        self.sample_rate = sample_rate
+        self.live_busy = live_busy
+        self.options = offline_options(self.lang)
+        self.max_lag = int(settings.refiner_max_lag_seconds * sample_rate)
+
+        self._q: "queue.Queue[Optional[Tuple[str, np.ndarray]]]" = queue.Queue()
+        self._queued = 0          # samples som venter i køen
+        self._queued_lock = threading.Lock()
+        self._finishing = threading.Event()
+        self._done = threading.Event()
+        self._thr: Optional[threading.Thread] = None
+        self._lease: Optional[ModelLease] = None
+
+        self.parts: List[Tuple[str, WindowJoiner]] = []  # (filnavn, vindustekstene)
+        self.windows_done = 0
+        self.audio_seconds_done = 0.0
+        self.complete = False
+        self.abandoned: Optional[str] = None
+        self.final_path: Optional[Path] = None
+
+    def start(self):
+        _active.clear()  # bare den siste økten er interessant for /after
+        self._lease = registry.acquire(settings.offline_asr_model, pick_device(settings.offline_device),
+                                       settings.offline_precision, settings.offline_backend)
+        _active[self.session_id] = self
+        self._thr = threading.Thread(target=self._run, daemon=True, name="refiner")
+        self._thr.start()
+
+    def feed(self, name: str, pcm16: np.ndarray):
+        """Kalles av opptaksskriveren med blokkene slik de skrives til `name`."""
+        if self.abandoned or self._finishing.is_set():
+            return
+        with self._queued_lock:
+            if self._queued + len(pcm16) > self.max_lag:
+                # Lyden som mangler ville gitt andre vinduer enn filen; /after tar resten
+                self._abandon(f"henger mer enn {settings.refiner_max_lag_seconds:.0f} s etter")
+                return
+            self._queued += len(pcm16)
+        self._q.put((name, pcm16))
+
+    def finish(self):
+        """Økten er stoppet: gjør ferdig de siste vinduene og skriv final.txt i bakgrunnen."""
+        self._finishing.set()
+        self._q.put(None)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def _abandon(self, reason: str):
+        if not self.abandoned:
+            self.abandoned = reason
+            print(f"[refiner] Gir opp bakgrunnsraffinering ({reason}); /after transkriberer resten.")
+
+    def _take(self) -> Optional[Tuple[str, np.ndarray]]:
+        item = self._q.get()
+        if item is not None:
+            with self._queued_lock:
+                self._queued -= len(item[1])
+        return item
+
+    def _lower_priority(self):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+        except (AttributeError, OSError):
+            pass  # Ikke Linux, eller ikke lov; ventingen på live-ASR holder uansett
+
+    def _part_blocks(self, name: str, first: np.ndarray, carry: list) -> Iterator[np.ndarray]:
+        """Blokkene til én fil. Stopper ved neste fil (lagt i `carry`) eller ved slutten."""
+        resampler = StreamResampler(self.sample_rate) if self.sample_rate != SR else None
+        # Samme blokkinndeling som AudioReader, så resamplingen gir bit for bit samme lyd
+        blocksize = int(self.sample_rate * BLOCK_SECONDS)
+        pending: List[np.ndarray] = []
+        size = 0
+
+        def convert(pcm16: np.ndarray) -> np.ndarray:
+            # Samme skalering som soundfile bruker når offline-ASR leser PCM16 fra fil
+            f32 = pcm16.astype(np.float32) / 32768.0
+            return resampler.process(f32) if resampler is not None else f32
+
+        item: Optional[Tuple[str, np.ndarray]] = (name, first)
+        while item is not None:
+            if item[0] != name:
+                carry.append(item)
+                break
+            pending.append(item[1])
+            size += len(item[1])
+            if size >= blocksize:
+                buf = np.concatenate(pending)
+                for i in range(0, len(buf) - blocksize + 1, blocksize):
+                    yield convert(buf[i:i + blocksize])
+                rest = buf[len(buf) - len(buf) % blocksize:]
+                pending, size = [rest], len(rest)
+            item = self._take()
+        if size:
+            yield convert(np.concatenate(pending))
+        if resampler is not None:
+            tail = resampler.flush()
+            if len(tail):
+                yield tail
+
+    def _decode(self, audio: np.ndarray):
+        sched = scheduler_for(self._lease.device)
+        return decode_cached(
+            lambda batch, opts: sched.run(self._lease.backend, batch, opts, Priority.REFINE),
+            [audio], self._lease.key.ident, self.options,
+        )[0][0]
+
+    def _run(self):
+        self._lower_priority()
+        carry: list = []
+        try:
+            while not self.abandoned:
+                item = carry.pop() if carry else self._take()
+                if item is None:
+                    break
+                name, first = item
+                joiner = WindowJoiner()
+                self.parts.append((name, joiner))
+                # Vindusposisjonene regnes fra starten av hver fil
+                offset = self.audio_seconds_done
+                for window in iter_windows(self._part_blocks(name, first, carry)):
+                    if self.abandoned:
+                        break
+                    # Live-ASR først: vent mens live-motoren har kø (men ikke etter /stop)
+                    while self.live_busy() and not self._finishing.is_set():
+                        time.sleep(0.2)
+                    joiner.add(window, self._decode(window.audio))
+                    self.windows_done += 1
+                    self.audio_seconds_done = offset + (window.start + len(window.audio)) / SR
+                if self._finishing.is_set() and not carry and self._q.empty():
+                    break
+            if not self.abandoned:
+                self._write_final()
+        except Exception as e:
+            self._abandon(f"feil: {e}")
+        finally:
+            if self._lease:
+                self._lease.release()
+            self._done.set()
+
+    def _write_final(self):
+        # Samme format som /after: én linje per lydfil
+        text = "\n".join(joiner.text() for _, joiner in self.parts).strip()
+        self.final_path = self.txt_dir / "final.txt"
+        self.final_path.write_text(text, encoding="utf-8")
+        self.complete = True
+        print(f"[refiner] final.txt skrevet ({self.windows_done} vinduer).")
+
+    def stats(self) -> dict:
+        return {
+            "state": "abandoned" if self.abandoned else ("done" if self.complete else
+                                                         ("finishing" if self._finishing.is_set() else "running")),
+            "windows_done": self.windows_done,
+            "audio_seconds_done": round(self.audio_seconds_done, 1),
+            "lag_seconds": round(self._queued / self.sample_rate, 1),
+            "abandoned": self.abandoned,
+        }
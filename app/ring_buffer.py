@@ -0,0 +1,178 @@
+# app/ring_buffer.py
+from __future__ import annotations
+
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+# Indekser i teller-arrayen. Tellerne ligger i en egen int64-array (og ikke som
+# Python-attributter) slik at både lagring og tellere kan legges i delt minne.
+_W_POS = 0        # totalt antall samples skrevet (absolutt posisjon)
+_R_POS = 1        # totalt antall samples konsumert (absolutt posisjon)
+_OVERRUNS = 2     # antall skrivinger som overskrev ulest lyd
+_DROPPED = 3      # antall samples som ble overskrevet før de ble lest
+_HIGH_WATER = 4   # høyeste fyllingsgrad (samples) sett av skriveren
+N_COUNTERS = 5
+
+
+class AudioRingBuffer:
+    """
+    Forhåndsallokert float32-ringbuffer for live-lyd.
+
+    Én produsent (lyd-callbacken) skriver blokker inn, én konsument
+    (ASR-arbeideren) henter vinduer ut som views – uten allokering per blokk.
+    Lagringen er speilet (hvert sample ligger to ganger, med `capacity` i
+    avstand), slik at ethvert vindu på inntil `capacity` samples alltid er
+    sammenhengende i minnet.
+
+    Med `storage` og `counters` i delt minne kan produsent og konsument
+    ligge i hver sin prosess. Konsumenten bruker da `poll_interval`: wait()
+    leser tellerne jevnlig i stedet for å vente på en Event, så produsenten
+    (lyd-callbacken) aldri kan bli blokkert av den andre prosessen.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        storage: Optional[np.ndarray] = None,
+        counters: Optional[np.ndarray] = None,
+        poll_interval: Optional[float] = None,
+    ):
+        capacity = int(capacity)
+        if capacity <= 0:
+            raise ValueError("capacity må være større enn 0")
+        if storage is None:
+            storage = np.zeros(2 * capacity, dtype=np.float32)
+        if storage.dtype != np.float32 or storage.shape != (2 * capacity,):
+            raise ValueError("storage må være float32 med lengde 2 * capacity")
+        if counters is None:
+            counters = np.zeros(N_COUNTERS, dtype=np.int64)
+        self.capacity = capacity
+        self._buf = storage
+        self._ctr = counters
+        self._data_ready = threading.Event()
+        self._poll = poll_interval
+
+    # --- Produsent -----------------------------------------------------------
+
+    def write(self, block: np.ndarray) -> None:
+        """Skriver en blokk inn i ringen. Kalles fra lyd-callbacken."""
+        n = len(block)
+        if n == 0:
+            return
+        cap = self.capacity
+        w = int(self._ctr[_W_POS])
+        lag = w - int(self._ctr[_R_POS])
+        overflow = lag + n - cap
+        if overflow > 0:
+            self._ctr[_OVERRUNS] += 1
+            self._ctr[_DROPPED] += min(n, overflow)
+        if n > cap:
+            # Kun de siste `capacity` samplene får plass
+            w += n - cap
+            block = block[n - cap:]
+            n = cap
+
+        pos = w % cap
+        first = min(n, cap - pos)
+        self._buf[pos:pos + first] = block[:first]
+        self._buf[pos + cap:pos + cap + first] = block[:first]
+        rest = n - first
+        if rest:
+            self._buf[:rest] = block[first:]
+            self._buf[cap:cap + rest] = block[first:]
+
+        # Posisjonen flyttes først når dataene ligger på plass
+        self._ctr[_W_POS] = w + n
+        fill = min(cap, lag + n)
+        if fill > self._ctr[_HIGH_WATER]:
+            self._ctr[_HIGH_WATER] = fill
+        self._data_ready.set()
+
+    # --- Konsument -----------------------------------------------------------
+
+    def available(self) -> int:
+        """
+        Antall uleste samples. Hopper over lyd som allerede er overskrevet.
+        Bare konsumenten skal kalle denne: den kan flytte lesepekeren. Andre
+        (statistikk, bakgrunnsarbeid, serverprosessen) bruker fill().
+        """
+        w = int(self._ctr[_W_POS])
+        r = int(self._ctr[_R_POS])
+        if w - r > self.capacity:
+            r = w - self.capacity
+            self._ctr[_R_POS] = r
+        return w - r
+
+    def peek(self, length: int, offset: int = 0) -> np.ndarray:
+        """
+        Returnerer et view av `length` uleste samples fra lesepekeren (+ offset).
+        Viewet er gyldig til skriveren har gått en hel runde rundt ringen.
+        """
+        if offset < 0 or length < 0 or offset + length > self.available():
+            raise ValueError("ber om flere samples enn det som er tilgjengelig")
+        start = (int(self._ctr[_R_POS]) + offset) % self.capacity
+        return self._buf[start:start + length]
+
+    def advance(self, n: int) -> None:
+        """Markerer `n` samples som konsumert."""
+        n = max(0, min(int(n), self.available()))
+        self._ctr[_R_POS] += n
+
+    def wait(self, min_samples: int, timeout: float) -> bool:
+        """Venter til minst `min_samples` er tilgjengelige, eller til timeout."""
+        if self.available() >= min_samples:
+            return True
+        if self._poll is not None:
+            deadline = time.monotonic() + timeout
+            while self.available() < min_samples:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                time.sleep(min(self._poll, remaining))
+            return True
+        self._data_ready.clear()
+        if self.available() >= min_samples:
+            return True
+        self._data_ready.wait(timeout)
+        return self.available() >= min_samples
+
+    def detach(self) -> None:
+        """Kopierer lagring og tellere til privat minne, så delt minne kan lukkes."""
+        self._buf = self._buf.copy()
+        self._ctr = self._ctr.copy()
+
+    # --- Metrikk ---------------------------------------------------------------
+
+    def fill(self) -> int:
+        """Antall uleste samples, uten å røre lesepekeren. Trygt fra andre tråder og prosesser."""
+        return min(self.capacity, int(self._ctr[_W_POS]) - int(self._ctr[_R_POS]))
+
+    @property
+    def read_position(self) -> int:
+        return int(self._ctr[_R_POS])
+
+    @property
+    def write_position(self) -> int:
+        return int(self._ctr[_W_POS])
+
+    @property
+    def fill_level(self) -> float:
+        return self.fill() / self.capacity
+
+    @property
+    def overruns(self) -> int:
+        return int(self._ctr[_OVERRUNS])
+
+    def stats(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "fill": self.fill(),
+            "fill_level": round(self.fill_level, 3),
+            "high_water": int(self._ctr[_HIGH_WATER]),
+            "written": self.write_position,
+            "overruns": self.overruns,
+            "dropped_samples": int(self._ctr[_DROPPED]),
+        }
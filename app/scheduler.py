@@ -0,0 +1,199 @@
+# app/scheduler.py
+"""
+Felles inferenskø per enhet.
+
+All dekoding i serverprosessen (live-ASR, bakgrunnsraffinering og
+offline-jobber) går gjennom én utfører per enhet, i stedet for at hver tråd
+kaller modellen direkte og konkurrerer om GPU/CPU. Forespørslene ligger i
+en prioritetskø: live går alltid foran raffinering, som går foran offline.
+Et vindu som allerede dekodes, avbrytes ikke, men en live-bit trenger aldri
+å vente på offline-vinduer som ligger i kø.
+
+Forespørsler med samme prioritet, samme modell og samme dekodingsvalg slås
+sammen til én batch (inntil INFER_MAX_BATCH vinduer). Mens live-tekstingen
+er aktiv dekodes lavere prioriteter ett vindu om gangen, så live aldri må
+vente på mer enn ett offline-vindu.
+
+Prosesspoolen i offline_pool har egne modeller i egne prosesser og går ikke
+gjennom denne køen. Det gjør heller ikke ASR-prosessen (LIVE_ASR_PROCESS=1),
+men den melder fra om live-dekodingen sin (add_live_source), så offline og
+raffinering viker for den som for live her.
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Callable, Dict, List, Set
+
+import numpy as np
+
+from .asr_backends import ASRBackend, DecodeOptions, Transcript
+from .config import settings
+from .thread_budget import inprocess_offline_threads, live_threads, use_threads
+
+# Så lenge etter siste live-forespørsel regnes live-tekstingen som aktiv
+LIVE_GRACE_SECONDS = 5.0
+
+# Live-dekoding som ikke går gjennom køen her (ASR-prosessen, LIVE_ASR_PROCESS=1): funksjoner som
+# gir time.monotonic() for siste live-dekoding der. Lavere prioriteter viker for dem på samme måte.
+_live_sources: Set[Callable[[], float]] = set()
+
+
+def add_live_source(source: Callable[[], float]):
+    _live_sources.add(source)
+
+
+def remove_live_source(source: Callable[[], float]):
+    _live_sources.discard(source)
+
+
+class Priority(IntEnum):
+    LIVE = 0
+    REFINE = 1
+    OFFLINE = 2
+
+
+@dataclass(order=True)
+class _Request:
+    priority: int
+    seq: int
+    backend: ASRBackend = field(compare=False)
+    audio: List[np.ndarray] = field(compare=False)
+    options: DecodeOptions = field(compare=False)
+    future: Future = field(compare=False)
+    submitted: float = field(compare=False)
+
+    def batches_with(self, other: "_Request") -> bool:
+        return (other.priority == self.priority and other.backend is self.backend
+                and other.options == self.options)
+
+
+class InferenceScheduler:
+    def __init__(self, device: str, max_batch: int):
+        self.device = device
+        self.max_batch = max(1, max_batch)
+        self._heap: List[_Request] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._last_live = 0.0
+        self._waits: Dict[Priority, deque] = {p: deque(maxlen=200) for p in Priority}
+        self._served: Dict[Priority, int] = {p: 0 for p in Priority}
+        self._batches = 0
+        self._batched_windows = 0
+        self._thr = threading.Thread(target=self._run, daemon=True, name=f"infer-{device}")
+        self._thr.start()
+
+    def submit(self, backend: ASRBackend, audio: List[np.ndarray], options: DecodeOptions,
+               priority: Priority) -> List[Future]:
+        """
+        Legger vinduene i køen. Lavere prioriteter deles opp i ett vindu per
+        forespørsel, så live kan komme til mellom dem; de slås sammen igjen
+        til batcher når live ikke er aktiv.
+        """
+        now = time.perf_counter()
+        groups = [list(audio)] if priority == Priority.LIVE else [[a] for a in audio]
+        reqs = [_Request(int(priority), next(self._seq), backend, group, options, Future(), now)
+                for group in groups]
+        with self._cond:
+            if priority == Priority.LIVE:
+                self._last_live = time.monotonic()
+            for req in reqs:
+                heapq.heappush(self._heap, req)
+            self._cond.notify()
+        return [req.future for req in reqs]
+
+    def run(self, backend: ASRBackend, audio: List[np.ndarray], options: DecodeOptions,
+            priority: Priority) -> List[Transcript]:
+        """Som backend.transcribe(), men i tur og orden etter prioritet. Blokkerer til resultatet er klart."""
+        futures = self.submit(backend, audio, options, priority)
+        return [result for future in futures for result in future.result()]
+
+    def _live_seen(self) -> float:
+        return max([self._last_live] + [source() for source in list(_live_sources)])
+
+    def _take_batch(self) -> List[_Request]:
+        head = heapq.heappop(self._heap)
+        limit = self.max_batch
+        if head.priority > Priority.LIVE and time.monotonic() - self._live_seen() < LIVE_GRACE_SECONDS:
+            limit = 1
+        batch, size = [head], len(head.audio)
+        # Kø-rekkefølgen beholdes; bare forespørsler som kan dele generate()-kallet tas med
+        for req in sorted(r for r in self._heap if head.batches_with(r)):
+            if size + len(req.audio) > limit:
+                break
+            batch.append(req)
+            size += len(req.audio)
+        if len(batch) > 1:
+            taken = {id(r) for r in batch}
+            self._heap = [r for r in self._heap if id(r) not in taken]
+            heapq.heapify(self._heap)
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                batch = self._take_batch()
+            start = time.perf_counter()
+            for req in batch:
+                self._waits[Priority(req.priority)].append((start - req.submitted) * 1000.0)
+                self._served[Priority(req.priority)] += 1
+            self._batches += 1
+            self._batched_windows += sum(len(r.audio) for r in batch)
+            head = batch[0]
+            if self.device.startswith("cpu"):
+                use_threads(live_threads() if head.priority == Priority.LIVE else inprocess_offline_threads())
+            try:
+                results = head.backend.transcribe([a for r in batch for a in r.audio], head.options)
+            except Exception as e:
+                for req in batch:
+                    req.future.set_exception(e)
+                continue
+            pos = 0
+            for req in batch:
+                req.future.set_result(results[pos:pos + len(req.audio)])
+                pos += len(req.audio)
+
+    def stats(self) -> dict:
+        with self._cond:
+            depth = {p: 0 for p in Priority}
+            for req in self._heap:
+                depth[Priority(req.priority)] += 1
+        classes = {}
+        for p in Priority:
+            waits = list(self._waits[p])
+            classes[p.name.lower()] = {
+                "queued": depth[p],
+                "served": self._served[p],
+                "avg_wait_ms": round(sum(waits) / len(waits), 1) if waits else None,
+                "max_wait_ms": round(max(waits), 1) if waits else None,
+            }
+        return {
+            "classes": classes,
+            "batches": self._batches,
+            "avg_batch": round(self._batched_windows / self._batches, 2) if self._batches else None,
+        }
+
+
+_schedulers: Dict[str, InferenceScheduler] = {}
+_lock = threading.Lock()
+
+
+def scheduler_for(device: str) -> InferenceScheduler:
+    with _lock:
+        sched = _schedulers.get(device)
+        if sched is None:
+            sched = _schedulers[device] = InferenceScheduler(device, settings.infer_max_batch)
+        return sched
+
+
+def scheduler_stats() -> dict:
+    with _lock:
+        return {device: sched.stats() for device, sched in _schedulers.items()}
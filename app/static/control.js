@@ -7,6 +7,7 @@
   const stopBtn  = $('#btnStop');
   const afterBtn = $('#btnAfter');
   const summBtn  = $('#btnSumm');
+  const cancelBtn = $('#btnCancel');
   const liveEl   = $('#liveText');
   const chromaEl = $('#chromaText');
 
@@ -39,12 +40,63 @@
     });
   }
 
+  // Bakgrunnsjobber: /after og /summarize svarer med en jobb-id som vi følger med på
+  let currentJob = null;
+
+  function mmss(sec){
+    sec = Math.max(0, Math.round(sec));
+    return String(Math.floor(sec / 60)).padStart(2, '0') + ':' + String(sec % 60).padStart(2, '0');
+  }
+
+  function describeJob(job){
+    let text = job.message || '';
+    if(job.state === 'queued'){ text = 'Venter i jobbkøen…'; }
+    if(job.state === 'paused'){ text = 'Venter til live-tekstingen er ferdig…'; }
+    if(job.state === 'running' && job.progress > 0){
+      text += ` (${Math.round(job.progress * 100)} %`;
+      if(job.eta_seconds != null){ text += `, ca. ${mmss(job.eta_seconds)} igjen`; }
+      text += ')';
+    }
+    return text;
+  }
+
+  async function followJob(job, onDone){
+    currentJob = job.id;
+    if(cancelBtn) cancelBtn.disabled = false;
+    while(currentJob === job.id){
+      setStatus(describeJob(job));
+      if(!['queued', 'running', 'paused'].includes(job.state)) break;
+      await new Promise(r => setTimeout(r, 1000));
+      try{
+        const js = await (await fetch('/jobs/' + job.id)).json();
+        if(js.status !== 'ok') break;
+        job = js.job;
+      }catch(err){ console.error(err); }
+    }
+    if(currentJob === job.id){
+      currentJob = null;
+      if(cancelBtn) cancelBtn.disabled = true;
+    }
+    if(job.state === 'done' && onDone){ onDone(job); }
+    else if(job.state === 'error'){ setStatus('Jobben feilet: ' + (job.error || 'ukjent feil')); }
+    else if(job.state === 'cancelled'){ setStatus('Jobben ble avbrutt.'); }
+  }
+
+  async function submitJob(url, onDone){
+    const res = await fetch(url, {method:'POST'});
+    const js = await res.json();
+    if(js.status === 'queued'){
+      followJob(js.job, onDone);
+    }else{
+      setStatus(js.message || ('Kunne ikke starte (' + (js.status||'ukjent') + ')'));
+    }
+  }
+
   if(afterBtn){
     afterBtn.addEventListener('click', async () => {
       try{
         setStatus('Starter transkribering av storfil…');
-        // Vi venter ikke på svaret her, status kommer via WebSocket
-        fetch('/after', {method:'POST'});
+        await submitJob('/after', () => setStatus('Ferdig! Resultatet er klart.'));
       }catch(err){ setStatus('Feil ved transkribering'); console.error(err); }
     });
   }
@@ -53,41 +105,87 @@
     summBtn.addEventListener('click', async () => {
       try{
         setStatus('Lager møtereferat…');
-        const res = await fetch('/summarize', {method:'POST'});
-        const js = await res.json();
-        if(js.status === 'ok'){
+        await submitJob('/summarize', (job) => {
           setStatus('Referat klart. Starter nedlasting...');
           // Denne URL-en vil nå tvinge nedlasting
-          window.location.href = '/download/md';
-        }else{
-          setStatus('Kunne ikke lage referat: ' + (js.message || 'Ukjent feil'));
-        }
+          window.location.href = '/download/md?session=' + encodeURIComponent(job.session);
+        });
       }catch(err){ setStatus('Feil ved referat'); console.error(err); }
     });
   }
 
+  if(cancelBtn){
+    cancelBtn.addEventListener('click', async () => {
+      if(!currentJob) return;
+      try{
+        setStatus('Avbryter…');
+        await fetch('/jobs/' + currentJob + '/cancel', {method:'POST'});
+      }catch(err){ setStatus('Feil ved avbryting'); console.error(err); }
+    });
+  }
+
   // WebSocket for live segmenter og status
   if(liveEl || chromaEl || statusEl){
     connectWS();
   }
 
+  // Foreløpige segmenter (final=false) erstattes på plass til det endelige kommer
+  const interimDivs = new Map();
+  // Endelige segmenter som allerede vises; ved gjenoppkobling sender serveren de siste på nytt.
+  // Segment-id-ene begynner på 0 i hver økt, så settet nullstilles når økten skifter.
+  let shownSession = null;
+  let shownFinals = new Set();
+  let lastFinalId = -1;
+
+  function setSession(session){
+    if(session && session !== shownSession){
+      shownSession = session;
+      shownFinals = new Set();
+      interimDivs.clear();
+      lastFinalId = -1;
+    }
+  }
+
+  function renderSegment(it){
+    const text = (it.text || '').trim();
+    const isFinal = it.final !== false;
+    if(isFinal){
+      if(shownFinals.has(it.id)) return;
+      shownFinals.add(it.id);
+      lastFinalId = Math.max(lastFinalId, it.id);
+    }
+    if(liveEl){
+      let div = interimDivs.get(it.id);
+      if(!div && text){
+        div = document.createElement('div');
+        liveEl.appendChild(div);
+      }
+      if(div){
+        if(text){
+          div.textContent = text;
+          div.classList.toggle('interim', !isFinal);
+        }else{
+          div.remove();
+        }
+        if(isFinal){ interimDivs.delete(it.id); }else{ interimDivs.set(it.id, div); }
+      }
+      const box = liveEl.parentElement; if(box) box.scrollTop = box.scrollHeight;
+    }
+    if(chromaEl && text){ chromaEl.textContent = text; }
+  }
+
   function connectWS(){
     const proto = location.protocol === 'https:' ? 'wss' : 'ws';
-    const ws = new WebSocket(`${proto}://${location.host}/ws`);
+    // Fortell serveren hva vi har, så den bare sender nyere segmenter fra journalen
+    const seen = shownSession ? `?session=${encodeURIComponent(shownSession)}&after=${lastFinalId}` : '';
+    const ws = new WebSocket(`${proto}://${location.host}/ws${seen}`);
     ws.onmessage = (ev) => {
       try{
         const msg = JSON.parse(ev.data);
         
         if(msg.type === 'segments'){
-          const text = msg.items.map(it => it.text).filter(Boolean).join(' ').trim();
-          if(!text) return;
-          if(liveEl){
-            const div = document.createElement('div');
-            div.textContent = text;
-            liveEl.appendChild(div);
-            const box = liveEl.parentElement; if(box) box.scrollTop = box.scrollHeight;
-          }
-          if(chromaEl){ chromaEl.textContent = text; }
+          setSession(msg.session);
+          msg.items.forEach(renderSegment);
         }
 
         if(msg.type === 'status'){
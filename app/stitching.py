@@ -0,0 +1,89 @@
+# app/stitching.py
+from __future__ import annotations
+
+import math
+from collections import deque
+from difflib import SequenceMatcher
+from typing import Deque, List
+
+from .streaming import norm_word
+
+
+def _word_similarity(a: str, b: str) -> float:
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    # Et ord som ble kuttet ved vindusgrensen er et prefiks av det hele ordet
+    if min(len(a), len(b)) >= 3 and (a.startswith(b) or b.startswith(a)):
+        return 0.8
+    ratio = SequenceMatcher(None, a, b).ratio()
+    return ratio if ratio >= 0.75 else 0.0
+
+
+def max_overlap_words(overlap_seconds: float) -> int:
+    """Øvre grense for hvor mange ord et overlapp kan inneholde (~5 ord/s + slingring)."""
+    return max(4, int(math.ceil(overlap_seconds * 5)) + 2)
+
+
+class TranscriptStitcher:
+    """
+    Skjøter tekst fra påfølgende live-vinduer som deler lyd (OVERLAP_SECONDS).
+
+    Halen av det som allerede er sendt ut sammenlignes ord for ord (fuzzy)
+    med starten av det nye segmentet, og det lengste overlappet som matcher
+    godt nok fjernes fra det nye segmentet. Ved harde kutt holdes det siste
+    ordet tilbake, fordi det ofte er avkuttet; neste segment (som hører hele
+    ordet i overlappet) erstatter det da. Alt arbeid er begrenset av
+    overlappets lengde, ikke av hvor lang økten er.
+    """
+
+    def __init__(self, max_words: int, hold_back: int = 1):
+        self.max_words = max(1, max_words)
+        self.hold_back = max(0, hold_back)
+        self._tail: Deque[str] = deque(maxlen=self.max_words)
+        self._pending: List[str] = []
+
+    def _overlap_len(self, context: List[str], words: List[str]) -> int:
+        ctx = [norm_word(w) for w in context[-self.max_words:]]
+        new = [norm_word(w) for w in words[: self.max_words]]
+        for k in range(min(len(ctx), len(new)), 0, -1):
+            sims = [_word_similarity(a, b) for a, b in zip(ctx[-k:], new[:k])]
+            if sims[0] > 0 and sims[-1] > 0 and sum(sims) / k >= 0.75:
+                return k
+        return 0
+
+    def _merge(self, text: str, overlapped: bool) -> List[str]:
+        words = text.split()
+        pending = self._pending
+        if not overlapped or not words:
+            return pending + words
+        k = self._overlap_len(list(self._tail) + pending, words)
+        p = len(pending)
+        # Tilbakeholdte ord som dekkes av overlappet erstattes av den nye versjonen
+        return pending[: max(0, p - k)] + words[max(0, k - p):]
+
+    def stitch(self, text: str, overlapped: bool, hard_cut: bool = False) -> str:
+        """
+        Slår sammen et endelig segment med det som er sendt ut før.
+        `overlapped`: segmentet starter med lyd som forrige segment også hørte.
+        `hard_cut`: segmentet slutter midt i tale, så neste segment vil overlappe.
+        """
+        out = self._merge(text, overlapped)
+        self._pending = []
+        if hard_cut and self.hold_back and len(out) > self.hold_back:
+            self._pending = out[-self.hold_back:]
+            out = out[: -self.hold_back]
+        self._tail.extend(out)
+        return " ".join(out)
+
+    def preview(self, text: str, overlapped: bool) -> str:
+        """Som `stitch`, men uten å endre tilstand – for foreløpig tekst."""
+        return " ".join(self._merge(text, overlapped))
+
+    def flush(self) -> str:
+        """Sender ut eventuelle tilbakeholdte ord."""
+        out = self._pending
+        self._pending = []
+        self._tail.extend(out)
+        return " ".join(out)
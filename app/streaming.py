@@ -0,0 +1,68 @@
+# app/streaming.py
+from __future__ import annotations
+
+import re
+from typing import List
+
+_PUNCT = re.compile(r"[^\w]+", re.UNICODE)
+
+
+def norm_word(word: str) -> str:
+    """Sammenligningsform av et ord: små bokstaver uten tegnsetting."""
+    return _PUNCT.sub("", word.lower())
+
+
+def _norm(words: List[str]) -> List[str]:
+    return [norm_word(w) for w in words]
+
+
+class LocalAgreement:
+    """
+    LocalAgreement-2 for strømmende hypoteser.
+
+    Hver ny hypotese dekker hele det voksende vinduet. Ord bekreftes
+    (committes) når to påfølgende hypoteser er enige om dem, og bekreftede
+    ord trekkes aldri tilbake så lenge vinduet lever.
+    """
+
+    def __init__(self):
+        self.committed: List[str] = []
+        self._prev_tail: List[str] = []
+
+    def _tail(self, words: List[str]) -> List[str]:
+        """Delen av hypotesen som kommer etter de bekreftede ordene."""
+        n = len(self.committed)
+        if n == 0:
+            return words
+        if _norm(words[:n]) == _norm(self.committed):
+            return words[n:]
+        # Hypotesen kan ha slått sammen eller splittet ord – finn slutten på de
+        # bekreftede ordene ved å lete etter de siste av dem rundt forventet posisjon
+        m = min(3, n)
+        anchor = _norm(self.committed[-m:])
+        for delta in (0, -1, 1, -2, 2, -3, 3):
+            i = n + delta
+            if m <= i <= len(words) and _norm(words[i - m:i]) == anchor:
+                return words[i:]
+        return words[n:]
+
+    def update(self, words: List[str]) -> List[str]:
+        """Tar inn en ny hypotese og returnerer ordene som ble bekreftet nå."""
+        tail = self._tail(words)
+        k = 0
+        for a, b in zip(_norm(tail), _norm(self._prev_tail)):
+            if a != b:
+                break
+            k += 1
+        newly = tail[:k]
+        self.committed.extend(newly)
+        self._prev_tail = tail[k:]
+        return newly
+
+    def text(self) -> str:
+        """Bekreftet tekst etterfulgt av den foreløpige halen fra siste hypotese."""
+        return " ".join(self.committed + self._prev_tail).strip()
+
+    def reset(self):
+        self.committed = []
+        self._prev_tail = []
@@ -6,59 +6,176 @@ import math
 import queue
 import threading
 import time
-from dataclasses import dataclass
-from typing import Optional
+from collections import deque
+from typing import Callable, List, Optional
 
 import numpy as np
 import sounddevice as sd
-import torch
-from transformers import WhisperProcessor, WhisperForConditionalGeneration
-from scipy.io.wavfile import write as wav_write
+import soundfile as sf
 
 from .config import settings
-from .utils import session_paths
+from .live_decoder import LiveDecoder
+from .ring_buffer import AudioRingBuffer
+from .utils import RECORDING_EXTS, session_paths
 
 # Konfig
-SAVE_SEGMENTS = os.getenv("SAVE_SEGMENTS", "0").strip().lower() in {"1", "true", "yes"}
 try:
     BIGFILE_ROTATE_MIN = int(os.getenv("BIGFILE_ROTATE_MIN", "0").strip() or "0")
 except ValueError:
     BIGFILE_ROTATE_MIN = 0
+BIGFILE_FORMAT = os.getenv("BIGFILE_FORMAT", "wav").strip().lower() or "wav"
+try:
+    BIGFILE_FLUSH_SECONDS = float(os.getenv("BIGFILE_FLUSH_SECONDS", "5").strip() or "5")
+except ValueError:
+    BIGFILE_FLUSH_SECONDS = 5.0
 
-@dataclass
-class LiveResult:
-    text: str
-    is_final: bool
-    segment_id: int
-
-def pick_device():
-    if settings.asr_device and settings.asr_device.lower() != "auto":
-        d = settings.asr_device.lower()
-        if d == "cuda" and torch.cuda.is_available():
-            return "cuda:0"
-        return d
-    try:
-        if getattr(torch.backends, "mps", None) and torch.backends.mps.is_available():
-            return "mps"
-    except Exception:
-        pass
-    if torch.cuda.is_available():
-        return "cuda:0"
-    return "cpu"
+# Samplingsratene Opus støtter
+OPUS_RATES = {8000, 12000, 16000, 24000, 48000}
 
-class BigFileWriter:
-    def __init__(self, out_dir, sample_rate: int, rotate_minutes: int = 0):
+
+def _patch_flac_length(path, frames: int):
+    """
+    Skriver antall samples inn i STREAMINFO, avrundet ned til hele blokker.
+
+    libFLAC fyller ut lengden først når filen lukkes, og en FLAC uten lengde
+    kan ikke leses av libsndfile. Etter flush() ligger alle hele blokker på
+    disk, så en fil som ikke blir lukket (krasj) er lesbar frem til siste flush.
+    """
+    with open(path, "r+b") as f:
+        # "fLaC" + blokkhode (4 byte), så STREAMINFO: maks blokkstørrelse på byte 2-3
+        f.seek(10)
+        block = int.from_bytes(f.read(2), "big") or 4096
+        total = frames // block * block
+        # Totalt antall samples er 36 bit fra de fire nederste bitene i byte 21
+        f.seek(21)
+        first = f.read(1)[0]
+        f.seek(21)
+        f.write(bytes([(first & 0xF0) | ((total >> 32) & 0x0F)]) + (total & 0xFFFFFFFF).to_bytes(4, "big"))
+
+
+class _WavOut:
+    """PCM16-WAV via wave. Hodet oppdateres ved hver skriving; flush() sender dataene til disk."""
+
+    def __init__(self, path, sample_rate: int):
         from wave import open as wave_open
-        self.wave_open = wave_open
+        self._raw = open(path, "wb")
+        self._wav = wave_open(self._raw, "wb")
+        self._wav.setnchannels(1)
+        self._wav.setsampwidth(2)
+        self._wav.setframerate(sample_rate)
+
+    def write(self, pcm16: np.ndarray):
+        self._wav.writeframes(pcm16.tobytes())
+
+    def flush(self):
+        self._raw.flush()
+
+    def close(self):
+        try:
+            self._wav.close()
+        finally:
+            self._raw.close()
+
+
+class _SoundFileOut:
+    """FLAC eller Ogg/Opus via libsndfile. Kodingen skjer i skrivetråden."""
+
+    def __init__(self, path, sample_rate: int, fmt: str, subtype: str):
+        self.path = path
+        self._flac = fmt == "FLAC"
+        self._f = sf.SoundFile(str(path), "w", sample_rate, 1, format=fmt, subtype=subtype)
+        self._frames = 0
+
+    def write(self, pcm16: np.ndarray):
+        self._f.write(pcm16)
+        self._frames += len(pcm16)
+
+    def flush(self):
+        self._f.flush()
+        if self._flac:
+            _patch_flac_length(self.path, self._frames)
+
+    def close(self):
+        self._f.close()
+
+
+def _open_recording(path, sample_rate: int, fmt: str):
+    if fmt == "flac":
+        return _SoundFileOut(path, sample_rate, "FLAC", "PCM_16")
+    if fmt == "opus":
+        return _SoundFileOut(path, sample_rate, "OGG", "OPUS")
+    return _WavOut(path, sample_rate)
+
+
+class BigFileWriter:
+    """
+    Skriver opptaket (session.wav eller part_XX.wav) i en egen tråd.
+
+    Lyd-callbacken legger float-blokker i en begrenset kø. Skrivetråden tar
+    alt som ligger der, konverterer til PCM16 i en gjenbrukt buffer og
+    skriver det med ett writeframes-kall. Er køen full (disken henger),
+    går blokkene til en overløpsfil i stedet, og skrivetråden henter dem
+    derfra i riktig rekkefølge når den tar igjen. Opptaket er den
+    autoritative kopien, så lyd kastes bare hvis også overløpsfilen feiler
+    og etterslepet i minnet passerer MAX_BACKLOG_SECONDS.
+
+    Formatet velges med BIGFILE_FORMAT: wav, flac (tapsfritt, omtrent halve
+    størrelsen) eller opus (tapsbasert, en brøkdel av størrelsen). Filen
+    flushes hvert BIGFILE_FLUSH_SECONDS, så et krasj etterlater en lesbar
+    fil med lyden frem til siste flush.
+    """
+
+    QUEUE_BLOCKS = 256
+    SPILL_NAME = "overflow.pcm"
+    MAX_BACKLOG_SECONDS = 600
+
+    def __init__(self, out_dir, sample_rate: int, rotate_minutes: int = 0, fmt: str = "wav",
+                 flush_seconds: float = 5.0):
         self.out_dir = out_dir
         self.sr = sample_rate
+        if fmt not in RECORDING_EXTS:
+            print(f"[bigfile] Ukjent opptaksformat '{fmt}'; bruker wav")
+            fmt = "wav"
+        if fmt == "opus" and sample_rate not in OPUS_RATES:
+            print(f"[bigfile] Opus støtter ikke {sample_rate} Hz; bruker flac")
+            fmt = "flac"
+        self.fmt = fmt
+        self.flush_seconds = flush_seconds
+        self._last_flush = time.monotonic()
         self.rotate_frames = int(sample_rate * 60 * rotate_minutes) if rotate_minutes > 0 else None
-        self.q: "queue.Queue[np.ndarray]" = queue.Queue(maxsize=256)
+        self.q: "queue.Queue[np.ndarray]" = queue.Queue(maxsize=self.QUEUE_BLOCKS)
         self._stop = threading.Event()
         self.fh = None
         self.idx = 0
         self.frames_written = 0
         self.thr: Optional[threading.Thread] = None
+        self.name: Optional[str] = None
+        # Valgfri mottaker av (filnavn, pcm16) for hver blokk som skrives, f.eks. bakgrunnsraffinering
+        self.tap: Optional[Callable[[str, np.ndarray], None]] = None
+        self._buf = np.empty(0, dtype=np.int16)
+
+        # Overløp: mens _spilling er satt går alle nye blokker hit, så rekkefølgen holder.
+        # Blokkene ligger først i _overflow (minnet) og flyttes av spill-tråden til filen.
+        self._spill_lock = threading.Lock()
+        self._spilling = False
+        self._overflow: "deque[np.ndarray]" = deque()
+        self._overflow_samples = 0
+        self._spill_inflight = 0
+        self._spill_written = 0   # bytes i overløpsfilen
+        self._spill_read = 0      # bytes skrivetråden har hentet tilbake
+        self._spill_wake = threading.Event()
+        self._spill_thr: Optional[threading.Thread] = None
+        self._spill_path = out_dir / self.SPILL_NAME
+        self._spill_out = None
+        self._spill_in = None
+
+        self.bytes_written = 0
+        self.writes = 0
+        self.queue_high_water = 0
+        self.spill_events = 0
+        self.spilled_bytes = 0
+        self.spill_errors = 0
+        self.dropped_blocks = 0
 
     def _open_new(self):
         if self.fh:
@@ -66,93 +183,252 @@ class BigFileWriter:
                 self.fh.close()
             except Exception:
                 pass
-        name = "session.wav" if self.rotate_frames is None else f"part_{self.idx:02d}.wav"
-        path = (self.out_dir / name).as_posix()
-        self.fh = self.wave_open(path, "wb")
-        self.fh.setnchannels(1)
-        self.fh.setsampwidth(2)
-        self.fh.setframerate(self.sr)
+        ext = RECORDING_EXTS[self.fmt]
+        name = f"session{ext}" if self.rotate_frames is None else f"part_{self.idx:02d}{ext}"
+        self.name = name
+        self.fh = _open_recording(self.out_dir / name, self.sr, self.fmt)
         self.frames_written = 0
+        self._last_flush = time.monotonic()
 
     def start(self):
         self._open_new()
-        self.thr = threading.Thread(target=self._worker, daemon=True)
+        self.thr = threading.Thread(target=self._worker, daemon=True, name="bigfile")
         self.thr.start()
+        self._spill_thr = threading.Thread(target=self._spill_worker, daemon=True, name="bigfile-spill")
+        self._spill_thr.start()
 
     def stop(self):
+        # Skrivetråden tømmer køen og overløpet før den avslutter; ingenting skal gå tapt
         self._stop.set()
-        try:
-            while True:
-                f32 = self.q.get_nowait()
-                pcm16 = np.clip(f32 * 32767.0, -32768, 32767).astype(np.int16)
-                if self.fh:
-                    self.fh.writeframes(pcm16.tobytes())
-                    self.frames_written += len(pcm16)
-        except queue.Empty:
-            pass
+        self._spill_wake.set()
         if self.thr and self.thr.is_alive():
-            self.thr.join(timeout=2)
+            self.thr.join()
+        if self._spill_thr and self._spill_thr.is_alive():
+            self._spill_thr.join(timeout=2)
         if self.fh:
             try:
                 self.fh.close()
             finally:
                 self.fh = None
+        for fh in (self._spill_out, self._spill_in):
+            if fh is not None:
+                fh.close()
+        if self._spill_out is not None:
+            self._spill_path.unlink(missing_ok=True)
+        if self.spill_events or self.dropped_blocks:
+            print(f"[bigfile] Opptak ferdig: {self.spill_events} overløp, "
+                  f"{self.spilled_bytes / 2 / self.sr:.1f} s via overløpsfil, {self.dropped_blocks} blokker tapt")
 
     def enqueue_float(self, f32: np.ndarray):
-        try:
-            self.q.put_nowait(f32.copy())
-        except queue.Full:
-            pass
+        # PortAudio gjenbruker bufferen etter callbacken, så blokken må kopieres her (én gang)
+        block = f32.copy()
+        with self._spill_lock:
+            if not self._spilling:
+                try:
+                    self.q.put_nowait(block)
+                    return
+                except queue.Full:
+                    self._spilling = True
+                    self.spill_events += 1
+                    print("[bigfile] Skrivekøen er full; legger lyden i overløpsfil til skrivingen tar igjen")
+            if self._overflow_samples + len(block) > self.MAX_BACKLOG_SECONDS * self.sr:
+                # Overløpsfilen tar ikke unna heller (spill_errors); minnet må ha en grense
+                self.dropped_blocks += 1
+                return
+            self._overflow.append(block)
+            self._overflow_samples += len(block)
+        self._spill_wake.set()
 
-    def _worker(self):
-        while not self._stop.is_set():
+    def _write(self, pcm16: np.ndarray):
+        if not self.fh:
+            return
+        self.fh.write(pcm16)
+        self.frames_written += len(pcm16)
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_seconds:
+            self.fh.flush()
+            self._last_flush = now
+        self.bytes_written += pcm16.nbytes
+        self.writes += 1
+        if self.tap is not None:
             try:
-                f32 = self.q.get(timeout=0.2)
-            except queue.Empty:
-                continue
-            pcm16 = np.clip(f32 * 32767.0, -32768, 32767).astype(np.int16)
-            if self.fh:
-                self.fh.writeframes(pcm16.tobytes())
-                self.frames_written += len(pcm16)
-                if self.rotate_frames is not None and self.frames_written >= self.rotate_frames:
+                # Bufferen gjenbrukes ved neste skriving, så mottakeren får en egen kopi
+                self.tap(self.name, pcm16.copy())
+            except Exception as e:
+                print(f"[bigfile] Mottaker feilet: {e}")
+
+    def _write_rotating(self, pcm16: np.ndarray):
+        """Skriver pcm16, og deler det ved roteringsgrensen så hver del havner i riktig fil."""
+        while len(pcm16):
+            n = len(pcm16)
+            if self.rotate_frames is not None:
+                # Neste fil åpnes først når det er noe å skrive i den
+                if self.frames_written >= self.rotate_frames:
                     self.idx += 1
                     self._open_new()
+                n = min(n, self.rotate_frames - self.frames_written)
+            self._write(pcm16[:n])
+            pcm16 = pcm16[n:]
+
+    def _pcm_buffer(self, n: int) -> np.ndarray:
+        if len(self._buf) < n:
+            self._buf = np.empty(max(n, 2 * len(self._buf)), dtype=np.int16)
+        return self._buf[:n]
+
+    def _convert(self, blocks: List[np.ndarray]) -> np.ndarray:
+        out = self._pcm_buffer(sum(len(b) for b in blocks))
+        pos = 0
+        for f32 in blocks:
+            # Blokkene er våre egne kopier og kan skaleres på stedet
+            np.multiply(f32, 32767.0, out=f32)
+            np.clip(f32, -32768, 32767, out=f32)
+            out[pos:pos + len(f32)] = f32
+            pos += len(f32)
+        return out
+
+    def _drain(self, timeout: float) -> List[np.ndarray]:
+        try:
+            blocks = [self.q.get(timeout=timeout)] if timeout > 0 else [self.q.get_nowait()]
+        except queue.Empty:
+            return []
+        self.queue_high_water = max(self.queue_high_water, self.q.qsize() + 1)
+        try:
+            while True:
+                blocks.append(self.q.get_nowait())
+        except queue.Empty:
+            pass
+        return blocks
+
+    def _read_spilled(self) -> bool:
+        """Henter neste stykke lyd fra overløpet. False når overløpet er tomt og avsluttet."""
+        with self._spill_lock:
+            unread = self._spill_written - self._spill_read
+            block = None
+            if not unread and not self._spill_inflight:
+                if self._overflow:
+                    # Filen er lest opp; det som ligger i minnet er det neste i rekkefølgen
+                    block = self._overflow.popleft()
+                    self._overflow_samples -= len(block)
+                else:
+                    self._spilling = False
+                    print("[bigfile] Skrivingen har tatt igjen overløpet")
+                    return False
+        if block is not None:
+            self._write_rotating(self._convert([block]))
+            return True
+        if not unread:
+            time.sleep(0.01)  # spill-tråden er midt i en skriving
+            return True
+        if self._spill_in is None:
+            self._spill_in = open(self._spill_path, "rb", buffering=0)
+        self._spill_in.seek(self._spill_read)
+        data = self._spill_in.read(min(unread, self.sr * 2 * 10))
+        self._spill_read += len(data)
+        self._write_rotating(np.frombuffer(data, dtype=np.int16))
+        return True
+
+    def _worker(self):
+        while True:
+            # Under overløp kommer det ikke noe nytt i køen, så da ventes det ikke på den
+            blocks = self._drain(0 if self._spilling else 0.2)
+            if blocks:
+                # Alt som ligger i køen, i én skriving; køen er alltid eldre enn overløpet
+                self._write_rotating(self._convert(blocks))
+            elif self._spilling:
+                self._read_spilled()
+            elif self._stop.is_set():
+                break
+
+    def _spill_worker(self):
+        while not (self._stop.is_set() and not self.thr.is_alive()):
+            self._spill_wake.wait(timeout=0.5)
+            self._spill_wake.clear()
+            while True:
+                with self._spill_lock:
+                    if not self._overflow:
+                        break
+                    block = self._overflow.popleft()
+                    self._overflow_samples -= len(block)
+                    self._spill_inflight += 1
+                try:
+                    if self._spill_out is None:
+                        self._spill_out = open(self._spill_path, "wb", buffering=0)
+                    pcm16 = np.clip(block * 32767.0, -32768, 32767).astype(np.int16)
+                    self._spill_out.write(pcm16.tobytes())
+                except OSError as e:
+                    with self._spill_lock:
+                        self._overflow.appendleft(block)
+                        self._overflow_samples += len(block)
+                        self._spill_inflight -= 1
+                        self.spill_errors += 1
+                    print(f"[bigfile] Kunne ikke skrive overløpsfil: {e}; holder lyden i minnet")
+                    time.sleep(0.5)
+                    break
+                with self._spill_lock:
+                    self._spill_written += pcm16.nbytes
+                    self.spilled_bytes += pcm16.nbytes
+                    self._spill_inflight -= 1
+
+    def stats(self) -> dict:
+        with self._spill_lock:
+            backlog = self._overflow_samples * 2 + self._spill_written - self._spill_read
+        return {
+            "format": self.fmt,
+            "bytes_written": self.bytes_written,
+            "writes": self.writes,
+            "queue": self.q.qsize(),
+            "queue_high_water": self.queue_high_water,
+            "spilling": self._spilling,
+            "spill_events": self.spill_events,
+            "spilled_bytes": self.spilled_bytes,
+            "spill_backlog_seconds": round(backlog / 2 / self.sr, 1),
+            "spill_errors": self.spill_errors,
+            "dropped_blocks": self.dropped_blocks,
+        }
 
 class SpeechToTextEngine:
-    def __init__(self, lang_code: str, session_id: str):
+    """
+    Opptaksdelen av live-motoren: lydstrøm, storfil og ringbuffer. Selve
+    dekodingen gjøres av en LiveDecoder, enten i en tråd i denne prosessen
+    eller (LIVE_ASR_PROCESS=1) i en egen ASR-prosess som leser den samme
+    ringbufferen fra delt minne.
+    """
+
+    def __init__(self, lang_code: str, session_id: str, out_q):
         self.lang_code = "no" if lang_code == "nb" else lang_code
         self.session_id = session_id
         self.rec_dir, self.txt_dir = session_paths(session_id)
         self.sample_rate = settings.sample_rate
         self.chunk_seconds = settings.chunk_seconds
-        self.overlap_seconds = settings.overlap_seconds
         self.stream: Optional[sd.InputStream] = None
-        self.seg_q: "queue.Queue[np.ndarray]" = queue.Queue()
-        self.out_q: "queue.Queue[LiveResult]" = queue.Queue()
-        self._stop = threading.Event()
+        ring_len = live_ring_length(self.sample_rate)
+        self.asr_process = None
+        self.decoder: Optional[LiveDecoder] = None
+        if settings.live_asr_process:
+            from .asr_process import ASRProcess
+            self.asr_process = ASRProcess(self.lang_code, session_id, ring_len, out_q)
+            self.ring = self.asr_process.ring
+        else:
+            self.ring = AudioRingBuffer(ring_len)
+            self.decoder = LiveDecoder(self.lang_code, session_id, self.ring, out_q)
+        # Mottaker av LiveResult; put() kalles fra dekodertråden eller ASR-prosessens lesetråd
+        self.out_q = out_q
         self._worker_thr: Optional[threading.Thread] = None
-        self.big_writer = BigFileWriter(self.rec_dir, self.sample_rate, BIGFILE_ROTATE_MIN)
+        self.big_writer = BigFileWriter(self.rec_dir, self.sample_rate, BIGFILE_ROTATE_MIN,
+                                        BIGFILE_FORMAT, BIGFILE_FLUSH_SECONDS)
         self.big_writer.start()
 
-        # Modernisert ASR-oppsett
-        device = pick_device()
-        self.device = device
-        print(f"[live_engine] Laster modell '{settings.asr_model}' til enhet '{device}'...")
-        self.processor = WhisperProcessor.from_pretrained(settings.asr_model)
-        self.model = WhisperForConditionalGeneration.from_pretrained(settings.asr_model).to(device)
-        self.model.config.forced_decoder_ids = None # Anbefalt for ren transkribering
-        print("[live_engine] Modell lastet.")
-        
         self._last_level_log = time.time()
 
     def _audio_callback(self, indata, frames, time_info, status):
         if status: pass
-        mono = indata.mean(axis=1) if indata.ndim > 1 else indata
+        if indata.ndim > 1:
+            # Én kanal: bruk kolonnen som view i stedet for å allokere via mean()
+            mono = indata[:, 0] if indata.shape[1] == 1 else indata.mean(axis=1)
+        else:
+            mono = indata
         self.big_writer.enqueue_float(mono)
-        try:
-            self.seg_q.put_nowait(mono.copy())
-        except queue.Full:
-            pass
+        self.ring.write(mono)
         now = time.time()
         if now - self._last_level_log > 2.0:
             rms = float(np.sqrt(np.mean(np.square(mono))) + 1e-12)
@@ -161,65 +437,66 @@ class SpeechToTextEngine:
             self._last_level_log = now
 
     def start(self, device: Optional[int] = None):
+        if self.asr_process is not None:
+            # Modellen lastes i ASR-prosessen; lyden samles i ringen imens
+            self.asr_process.start()
         blocksize = int(self.sample_rate * 0.5)
         self.stream = sd.InputStream(
             samplerate=self.sample_rate, channels=1, dtype="float32",
             callback=self._audio_callback, blocksize=blocksize, device=device
         )
         self.stream.start()
-        self._worker_thr = threading.Thread(target=self._worker, daemon=True)
-        self._worker_thr.start()
+        if self.decoder is not None:
+            self._worker_thr = threading.Thread(target=self.decoder.run, daemon=True)
+            self._worker_thr.start()
 
     def stop(self):
-        self._stop.set()
         if self.stream:
             try:
                 self.stream.stop()
                 self.stream.close()
             except Exception as e:
                 print(f"Feil ved stopping av lydstrøm: {e}")
-        if self._worker_thr and self._worker_thr.is_alive():
-            self._worker_thr.join(timeout=2)
+        if self.decoder is not None:
+            self.decoder.stop()
+            if self._worker_thr and self._worker_thr.is_alive():
+                self._worker_thr.join(timeout=2)
+            self.decoder.release()
+        if self.asr_process is not None:
+            self.asr_process.stop()
         self.big_writer.stop()
 
-    def _worker(self):
-        chunk_len = int(self.sample_rate * self.chunk_seconds)
-        overlap_len = int(self.sample_rate * self.overlap_seconds)
-        if overlap_len >= chunk_len:
-            overlap_len = max(0, chunk_len // 4)
+    def restart_asr(self) -> bool:
+        """Starter ASR-prosessen på nytt. Lyden som ikke er dekodet, ligger igjen i ringen."""
+        if self.asr_process is None:
+            return False
+        self.asr_process.restart()
+        return True
 
-        buf = np.zeros(0, dtype=np.float32)
-        segment_id = 0
+    def live_busy(self) -> bool:
+        """True når live-ASR har mer enn ett vindu i kø; bakgrunnsarbeid bør da vente."""
+        # Et voksende vindu (VAD/strømming) ligger normalt i ringen; først et steg til betyr kø
+        step = settings.stream_step_seconds if settings.live_streaming else self.chunk_seconds
+        return self.ring.fill() > int(self.sample_rate * (live_window_seconds() + step))
 
-        while not self._stop.is_set():
-            try:
-                inblock = self.seg_q.get(timeout=0.2)
-            except queue.Empty:
-                continue
+    def stats(self) -> dict:
+        stats = self.asr_process.stats() if self.asr_process is not None else self.decoder.stats()
+        stats["recording"] = self.big_writer.stats()
+        return stats
 
-            buf = np.concatenate([buf, inblock])
 
-            while len(buf) >= chunk_len:
-                segment = buf[:chunk_len]
-                buf = buf[chunk_len - overlap_len:]
+def live_window_seconds() -> float:
+    """Lengste vindu live-ASR dekoder: CHUNK_SECONDS, eller VAD_MAX_CHUNK_SECONDS med VAD."""
+    if settings.vad_enabled:
+        return max(settings.chunk_seconds, settings.vad_max_chunk_seconds)
+    return settings.chunk_seconds
 
-                if SAVE_SEGMENTS:
-                    wav_path = self.rec_dir / f"seg_{segment_id:06d}.wav"
-                    pcm16 = np.clip(segment * 32767.0, -32768, 32767).astype(np.int16)
-                    wav_write(wav_path.as_posix(), self.sample_rate, pcm16)
 
-                text = ""
-                try:
-                    # Modernisert ASR-kall
-                    input_features = self.processor(
-                        segment, sampling_rate=self.sample_rate, return_tensors="pt"
-                    ).input_features.to(self.device)
-                    
-                    predicted_ids = self.model.generate(input_features, language=self.lang_code, task="transcribe")
-                    text = self.processor.batch_decode(predicted_ids, skip_special_tokens=True)[0].strip()
-                
-                except Exception as e:
-                    print(f"[asr] feilet segment {segment_id}: {e}")
-                
-                self.out_q.put(LiveResult(text=text, is_final=True, segment_id=segment_id))
-                segment_id += 1
\ No newline at end of file
+def live_ring_length(sample_rate: int) -> int:
+    max_chunk = live_window_seconds()
+    ring_seconds = settings.live_ring_seconds
+    if settings.live_asr_process:
+        # Lyden må vente i ringen mens en ny ASR-prosess laster modellen
+        ring_seconds = max(ring_seconds, settings.asr_process_ring_seconds)
+    # Ringbufferen må romme minst to hele vinduer, ellers kan ikke arbeideren henge etter i det hele tatt
+    return max(int(sample_rate * ring_seconds), 2 * int(sample_rate * max_chunk))
@@ -0,0 +1,124 @@
+# app/thread_budget.py
+"""
+Trådbudsjett og CPU-tilhørighet per arbeidslast.
+
+torch bruker som standard alle kjerner i hver operasjon. Kjører offline-
+dekoding og live-ASR på samme maskin, blir CPU-en overbooket, og lydtrådene
+(sounddevice-callbacken og opptaksskriveren) får ikke kjøre i tide.
+
+- LIVE_THREADS: torch-tråder for live-dekoding. Standard er alle kjerner
+  minus én, som holdes fri til lydtrådene.
+- OFFLINE_THREADS: tråder for offline-dekoding totalt. I serverprosessen
+  gjelder det hvert offline-vindu, men aldri flere enn LIVE_CPUS når
+  serverprosessen er låst dit; prosesspoolen fordeler det på arbeiderne.
+  Standard er halve maskinen.
+- LIVE_CPUS / OFFLINE_CPUS (f.eks. "0-3,6"): valgfri låsing til bestemte
+  kjerner. Serverprosessen låses til LIVE_CPUS, arbeiderne i prosesspoolen
+  til OFFLINE_CPUS.
+
+Med LIVE_ASR_PROCESS=1 dekoder ASR-prosessen samtidig med serverprosessen i
+stedet for i tur og orden. Da får live det som er igjen etter offline
+(kjerner minus OFFLINE_THREADS), ASR-prosessen låses til LIVE_CPUS og
+serverprosessen, som da bare har offline-arbeid, til OFFLINE_CPUS.
+
+I serverprosessen går all dekoding gjennom inferenskøen, én batch om
+gangen, så trådantallet settes før hver batch etter hvilken arbeidslast den
+tilhører.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from typing import Optional, Set
+
+import torch
+
+from .config import settings
+
+# Kjernene prosessen hadde tilgang til ved oppstart, før eventuell låsing
+try:
+    _CORES = len(os.sched_getaffinity(0))
+except AttributeError:
+    _CORES = os.cpu_count() or 1
+
+_current: Optional[int] = None
+_lock = threading.Lock()
+
+
+def parse_cpus(spec: str) -> Optional[Set[int]]:
+    """'0-3,6' -> {0, 1, 2, 3, 6}. Tom streng gir None (ingen låsing)."""
+    cpus: Set[int] = set()
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            lo, hi = part.split("-", 1)
+            cpus.update(range(int(lo), int(hi) + 1))
+        else:
+            cpus.add(int(part))
+    return cpus or None
+
+
+def live_threads() -> int:
+    if settings.live_threads > 0:
+        return settings.live_threads
+    cpus = parse_cpus(settings.live_cpus)
+    if cpus:
+        return len(cpus)
+    if settings.live_asr_process:
+        # ASR-prosessen dekoder samtidig med offline-arbeidet i serverprosessen; del kjernene
+        return max(1, _CORES - offline_threads())
+    return max(1, _CORES - 1)
+
+
+def offline_threads() -> int:
+    if settings.offline_threads > 0:
+        return settings.offline_threads
+    cpus = parse_cpus(settings.offline_cpus)
+    return len(cpus) if cpus else max(1, _CORES // 2)
+
+
+def inprocess_offline_threads() -> int:
+    """
+    Tråder for offline- og raffineringsbatcher i serverprosessen. Uten
+    ASR-prosess er serverprosessen låst til LIVE_CPUS, så flere tråder enn
+    de kjernene gir bare overbooking av live-kjernene.
+    """
+    n = offline_threads()
+    cpus = parse_cpus(settings.live_cpus)
+    if cpus and not settings.live_asr_process:
+        n = min(n, len(cpus))
+    return n
+
+
+def use_threads(n: int):
+    """Setter torch sitt trådantall, bare når det faktisk endres."""
+    global _current
+    with _lock:
+        if n != _current:
+            torch.set_num_threads(n)
+            _current = n
+
+
+def pin(cpus: Optional[Set[int]], label: str):
+    """Låser den kallende tråden, og tråder den starter senere, til `cpus`."""
+    if not cpus:
+        return
+    try:
+        os.sched_setaffinity(0, cpus)
+        print(f"[threads] {label} låst til kjerne {sorted(cpus)}")
+    except (AttributeError, OSError, ValueError) as e:
+        print(f"[threads] Kunne ikke låse {label} til kjerner {sorted(cpus)}: {e}")
+
+
+def summary() -> dict:
+    return {
+        "cores": _CORES,
+        "live_threads": live_threads(),
+        "offline_threads": offline_threads(),
+        "inprocess_offline_threads": inprocess_offline_threads(),
+        "live_cpus": sorted(parse_cpus(settings.live_cpus) or []),
+        "offline_cpus": sorted(parse_cpus(settings.offline_cpus) or []),
+        "torch_threads": _current,
+    }
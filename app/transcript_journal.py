@@ -0,0 +1,111 @@
+# app/transcript_journal.py
+"""
+Løpende journal over de endelige live-segmentene.
+
+Hvert segment skrives som én JSON-linje til live_segments.jsonl i det
+øyeblikket det kommer, i stedet for at hele listen holdes i minnet og
+skrives ut ved /stop. Linjene går til operativsystemet med en gang, mens
+fsync samles og gjøres høyst hvert JOURNAL_FSYNC_SECONDS av en egen tråd,
+så et krasj mister høyst det siste intervallet og event-loopen aldri venter
+på disken.
+
+I minnet ligger bare de siste JOURNAL_TAIL_SEGMENTS segmentene, til seere
+som kobler seg på midt i økten. live.txt bygges ved å strømme gjennom
+journalen.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+JOURNAL_NAME = "live_segments.jsonl"
+
+
+class TranscriptJournal:
+    def __init__(self, path: Path, tail_size: int = 200, fsync_seconds: float = 1.0):
+        self.path = Path(path)
+        self.fsync_seconds = fsync_seconds
+        self._fh = open(self.path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._tail: "deque[dict]" = deque(maxlen=max(1, tail_size))
+        self._dirty = False
+        self._closed = threading.Event()
+        self.segments = 0
+        self.bytes = 0
+        self.syncs = 0
+        self._thr = threading.Thread(target=self._sync_loop, daemon=True, name="journal-sync")
+        self._thr.start()
+
+    def append(self, segment: dict):
+        line = json.dumps(segment, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._fh.closed:
+                return
+            self._fh.write(line)
+            # Til operativsystemet med en gang; fsync tar synk-tråden
+            self._fh.flush()
+            self._dirty = True
+            self._tail.append(segment)
+            self.segments += 1
+            self.bytes += len(line.encode("utf-8"))
+
+    def tail(self) -> List[dict]:
+        with self._lock:
+            return list(self._tail)
+
+    def sync(self):
+        with self._lock:
+            if not self._dirty or self._fh.closed:
+                return
+            self._dirty = False
+            fd = self._fh.fileno()
+            # fsync kan ta tid; ikke hold låsen imens, append() skal ikke vente
+            fd = os.dup(fd)
+        try:
+            os.fsync(fd)
+            self.syncs += 1
+        except OSError as e:
+            print(f"[journal] fsync feilet: {e}")
+        finally:
+            os.close(fd)
+
+    def _sync_loop(self):
+        while not self._closed.wait(self.fsync_seconds):
+            self.sync()
+
+    def close(self):
+        self._closed.set()
+        self._thr.join(timeout=2)
+        self.sync()
+        with self._lock:
+            self._fh.close()
+
+    def stats(self) -> dict:
+        return {"segments": self.segments, "bytes": self.bytes, "syncs": self.syncs, "tail": len(self._tail)}
+
+
+def iter_segments(path: Path) -> Iterator[dict]:
+    """Segmentene i journalen, i rekkefølge. En avkuttet siste linje (krasj) hoppes over."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def write_live_text(journal_path: Path, out_path: Path) -> Optional[Path]:
+    """Bygger live.txt fra journalen uten å lese hele journalen inn i minnet."""
+    if not Path(journal_path).exists():
+        return None
+    with open(out_path, "w", encoding="utf-8") as out:
+        # Live-tekst skjøtes sammen uten linjeskift for en kontinuerlig strøm
+        for i, seg in enumerate(iter_segments(journal_path)):
+            if i:
+                out.write(" ")
+            out.write(seg.get("text", "").strip())
+    return Path(out_path)
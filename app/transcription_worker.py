@@ -1,12 +1,65 @@
 # transcription_worker.py
 from __future__ import annotations
-import json
+import asyncio
 from pathlib import Path
-from typing import Optional, List
+from typing import Awaitable, Callable, Optional, List
 
-from .stt_engine import SpeechToTextEngine, LiveResult
-from .utils import session_paths
+from .live_decoder import LiveResult
+from .stt_engine import SpeechToTextEngine
+from .utils import recording_files, session_paths
 from .offline_asr import transcribe_many
+from .config import settings
+from .refiner import SessionRefiner, refiner_for
+from .transcript_journal import JOURNAL_NAME, TranscriptJournal, write_live_text
+
+
+class LiveResultQueue:
+    """
+    Mottaker av live-resultatene (motorens out_q).
+
+    put() kalles fra dekodertråden eller ASR-prosessens lesetråd. Endelige
+    segmenter journalføres der og da, og resultatet legges i en asyncio-kø
+    med call_soon_threadsafe, så event-loopen vekkes bare når det faktisk
+    kommer noe.
+    """
+
+    _CLOSED = object()
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, journal: TranscriptJournal):
+        self._loop = loop
+        self._q: "asyncio.Queue" = asyncio.Queue()
+        self._journal = journal
+        self._closed = False
+
+    def put(self, result: LiveResult):
+        # Foreløpige hypoteser vises, men bare endelige segmenter lagres
+        if result.is_final:
+            self._journal.append({"id": result.segment_id, "text": result.text})
+        self._post(result)
+
+    def close(self):
+        """Etter at motoren er stoppet: next_batch() gir det som gjenstår, og så None."""
+        self._post(self._CLOSED)
+
+    def _post(self, item):
+        try:
+            self._loop.call_soon_threadsafe(self._q.put_nowait, item)
+        except RuntimeError:
+            pass  # event-loopen er lukket (serveren avslutter)
+
+    async def next_batch(self) -> Optional[List[LiveResult]]:
+        """Venter på neste resultat og tar med alt som kom samtidig. None når køen er lukket."""
+        if self._closed:
+            return None
+        batch: List[LiveResult] = []
+        item = await self._q.get()
+        while item is not self._CLOSED:
+            batch.append(item)
+            if self._q.empty():
+                return batch
+            item = self._q.get_nowait()
+        self._closed = True
+        return batch or None
 
 
 class TranscriptionSession:
@@ -15,54 +68,82 @@ class TranscriptionSession:
         self.session_id = session_id
         self.rec_dir, self.txt_dir = session_paths(session_id)
         self.engine: Optional[SpeechToTextEngine] = None
-        self.live_buffer: list[dict] = []
+        self.journal = TranscriptJournal(Path(self.txt_dir) / JOURNAL_NAME, settings.journal_tail_segments,
+                                         settings.journal_fsync_seconds)
+        self.refiner: Optional[SessionRefiner] = None
+        self.results: Optional[LiveResultQueue] = None
 
-    def start(self, device: Optional[int] = None):
-        self.engine = SpeechToTextEngine(self.lang, self.session_id)
+    def start(self, loop: asyncio.AbstractEventLoop, device: Optional[int] = None):
+        self.results = LiveResultQueue(loop, self.journal)
+        self.engine = SpeechToTextEngine(self.lang, self.session_id, self.results)
+        if settings.live_refiner:
+            self.refiner = SessionRefiner(self.session_id, self.lang, self.txt_dir,
+                                          self.engine.sample_rate, self.engine.live_busy)
+            self.refiner.start()
+            self.engine.big_writer.tap = self.refiner.feed
         self.engine.start(device=device)
 
     def stop(self):
-        if self.engine:
-            self.engine.stop()
-            self._persist_live()
+        try:
+            if self.engine:
+                self.engine.stop()
+                self._persist_live()
+        finally:
+            # Kringkasteren skal avslutte selv om stoppingen feilet
+            if self.results:
+                self.results.close()
+            if self.refiner:
+                # De siste vinduene dekodes i bakgrunnen; /after venter på dem
+                self.refiner.finish()
 
-    def poll(self) -> list[LiveResult]:
-        results: list[LiveResult] = []
+    def restart_asr(self) -> bool:
+        return bool(self.engine) and self.engine.restart_asr()
+
+    async def stream_results(self, send: Callable[[List[LiveResult]], Awaitable[None]]):
+        """Sender resultatene videre etter hvert som de kommer, til økten er stoppet og køen tømt."""
+        while True:
+            batch = await self.results.next_batch()
+            if batch is None:
+                return
+            await send(batch)
+
+    def stats(self) -> dict:
         if not self.engine:
-            return results
-        while not self.engine.out_q.empty():
-            r = self.engine.out_q.get()
-            self.live_buffer.append({"id": r.segment_id, "text": r.text})
-            results.append(r)
-        return results
+            return {}
+        stats = self.engine.stats()
+        stats["journal"] = self.journal.stats()
+        if self.refiner:
+            stats["refiner"] = self.refiner.stats()
+        return stats
 
     def _persist_live(self):
-        """Lagrer den kontinuerlige live-teksten."""
-        out_json = Path(self.txt_dir) / "live_segments.json"
-        out_txt = Path(self.txt_dir) / "live.txt"
-        out_json.write_text(json.dumps(self.live_buffer, ensure_ascii=False, indent=2), encoding="utf-8")
-        # Live-tekst skjøtes sammen uten linjeskift for en kontinuerlig strøm
-        out_txt.write_text(" ".join(s.get("text", "").strip() for s in self.live_buffer), encoding="utf-8")
+        """Lukker journalen og bygger den kontinuerlige live-teksten fra den."""
+        self.journal.close()
+        write_live_text(self.journal.path, Path(self.txt_dir) / "live.txt")
 
     def after_the_fact(self) -> Path:
         """
-        Transkriberer storfila (session.wav eller part_*.wav) med offline-ASR
+        Transkriberer storfila (session.* eller part_*.*) med offline-ASR
         for høyere nøyaktighet, og skriver resultatet til final.txt.
         """
         final_path = Path(self.txt_dir) / "final.txt"
 
+        refiner = refiner_for(self.session_id)
+        if refiner is not None:
+            refiner.wait()
+            if refiner.complete:
+                return refiner.final_path
+
         # Finn storfil(er)
-        audio_files: List[Path] = []
-        session_wav = self.rec_dir / "session.wav"
-        if session_wav.exists():
-            audio_files = [session_wav]
-        else:
-            audio_files = sorted(self.rec_dir.glob("part_*.wav"))
+        audio_files: List[Path] = recording_files(self.rec_dir)
 
         if not audio_files:
             # Fallback: kopier live.txt slik at knappen fortsatt gir noe
             print("[worker] Ingen stor lydfil funnet. Kopierer live.txt til final.txt som fallback.")
             live_path = Path(self.txt_dir) / "live.txt"
+            if not live_path.exists():
+                # Økten krasjet før /stop; journalen har det som ble sagt
+                write_live_text(Path(self.txt_dir) / JOURNAL_NAME, live_path)
             final_text = live_path.read_text(encoding="utf-8") if live_path.exists() else ""
             final_path.write_text(final_text, encoding="utf-8")
             return final_path
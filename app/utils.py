@@ -1,10 +1,14 @@
 from pathlib import Path
+from typing import List
 from datetime import datetime
 
 BASE = Path("data")
 RECS = BASE / "recordings"
 TXTS = BASE / "transcripts"
 
+# Opptaksformat (BIGFILE_FORMAT) -> filendelse
+RECORDING_EXTS = {"wav": ".wav", "flac": ".flac", "opus": ".opus"}
+
 for p in (BASE, RECS, TXTS):
     p.mkdir(parents=True, exist_ok=True)
 
@@ -18,4 +22,14 @@ def session_paths(stamp: str):
     txt_dir = TXTS / stamp
     rec_dir.mkdir(parents=True, exist_ok=True)
     txt_dir.mkdir(parents=True, exist_ok=True)
-    return rec_dir, txt_dir
\ No newline at end of file
+    return rec_dir, txt_dir
+
+
+def recording_files(rec_dir: Path) -> List[Path]:
+    """Storfila for en økt (session.*), eller delene (part_*.*) i rekkefølge."""
+    exts = set(RECORDING_EXTS.values())
+    for ext in exts:
+        session = rec_dir / f"session{ext}"
+        if session.exists():
+            return [session]
+    return sorted(p for p in rec_dir.glob("part_*") if p.suffix in exts)
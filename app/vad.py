@@ -0,0 +1,118 @@
+# app/vad.py
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from .config import settings
+
+FRAME_MS = 30
+
+
+@dataclass
+class VadCut:
+    end: int          # antall samples fra starten av vinduet som utgjør segmentet
+    speech: bool      # False = bare stillhet, trenger ikke dekodes
+    at_pause: bool    # True = kuttet ligger i en pause (ingen overlapp nødvendig)
+
+
+class EnergyVAD:
+    """
+    Enkel energibasert taledeteksjon med adaptivt støygulv.
+
+    Lyden deles i rammer på 30 ms. En ramme regnes som tale når nivået ligger
+    over det høyeste av den faste terskelen og støygulvet pluss en margin.
+    Støygulvet estimeres fra de stilleste rammene i lyd som er ferdig
+    behandlet (commit()), så et vindu som planlegges flere ganger mens det
+    vokser, ikke teller med mer enn én gang.
+    """
+
+    def __init__(self, sample_rate: int, threshold_db: Optional[float] = None,
+                 min_speech_ms: Optional[int] = None):
+        self.sample_rate = sample_rate
+        self.frame_len = max(1, int(sample_rate * FRAME_MS / 1000))
+        self.threshold_db = settings.vad_threshold_db if threshold_db is None else threshold_db
+        self.margin_db = settings.vad_margin_db
+        self.min_silence_frames = max(1, int(settings.vad_min_silence_ms / FRAME_MS))
+        if min_speech_ms is None:
+            min_speech_ms = settings.vad_min_speech_ms
+        self.min_speech_frames = max(1, int(min_speech_ms / FRAME_MS))
+        self.noise_db: Optional[float] = None
+
+    def frame_db(self, samples: np.ndarray) -> np.ndarray:
+        n = len(samples) // self.frame_len
+        if n == 0:
+            return np.zeros(0, dtype=np.float32)
+        frames = samples[:n * self.frame_len].reshape(n, self.frame_len)
+        power = np.einsum("ij,ij->i", frames, frames) / self.frame_len
+        return 10.0 * np.log10(power + 1e-12)
+
+    def _floor(self, db: np.ndarray) -> float:
+        # Kan aldri klatre opp i taleområdet
+        return min(float(np.percentile(db, 10)), -30.0)
+
+    def speech_mask(self, samples: np.ndarray) -> np.ndarray:
+        """Talerammene i `samples`. Endrer ikke støygulvet."""
+        db = self.frame_db(samples)
+        if len(db) == 0:
+            return np.zeros(0, dtype=bool)
+        # Før noe er behandlet brukes gulvet i dette vinduet
+        noise = self.noise_db if self.noise_db is not None else self._floor(db)
+        return db > max(self.threshold_db, noise + self.margin_db)
+
+    def commit(self, samples: np.ndarray):
+        """Oppdaterer støygulvet fra lyd som er ferdig behandlet og ikke planlegges igjen."""
+        db = self.frame_db(samples)
+        if len(db) == 0:
+            return
+        floor = self._floor(db)
+        # Følger sakte etter
+        self.noise_db = floor if self.noise_db is None else 0.9 * self.noise_db + 0.1 * floor
+
+    def has_speech(self, mask: np.ndarray) -> bool:
+        return int(mask.sum()) >= self.min_speech_frames
+
+    def plan(self, window: np.ndarray, min_len: int, max_len: int) -> Optional[VadCut]:
+        """
+        Velger neste segmentgrense i `window`.
+
+        Foretrekker pausen nærmest `min_len` (regnet fra halve `min_len` og
+        utover). Er det ingen pause før `max_len`, kuttes det hardt der.
+        Returnerer None når det trengs mer lyd før en grense kan velges.
+        """
+        if len(window) < min_len:
+            return None
+        mask = self.speech_mask(window[:max_len])
+        fl = self.frame_len
+
+        head = mask[: min_len // fl]
+        if not self.has_speech(head):
+            # Bare stillhet: hopp over, men behold halen som kan være starten på et ord
+            keep = self.min_silence_frames * fl
+            return VadCut(end=max(fl, min_len - keep), speech=False, at_pause=True)
+
+        # Finn sammenhengende stille partier (i rammer)
+        silent = np.concatenate(([False], ~mask, [False])).astype(np.int8)
+        edges = np.diff(silent)
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+
+        search_from = (min_len // 2) // fl
+        best: Optional[int] = None
+        for s, e in zip(starts, ends):
+            if e - s < self.min_silence_frames:
+                continue
+            # Midt i pausen, eller like etter talen hvis pausen er halen av vinduet
+            mid = (s + e) // 2 if e < len(mask) else s + self.min_silence_frames // 2
+            if mid < search_from:
+                continue
+            if best is None or abs(mid * fl - min_len) < abs(best - min_len):
+                best = int(mid) * fl
+        if best is not None:
+            return VadCut(end=best, speech=self.has_speech(mask[: best // fl]), at_pause=True)
+
+        if len(window) >= max_len:
+            return VadCut(end=max_len, speech=True, at_pause=False)
+        return None
@@ -0,0 +1,112 @@
+# app/warmup.py
+from __future__ import annotations
+
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from .config import settings
+from .model_registry import ModelKey, registry, pick_device
+from .fast_decode import live_token_budget
+from .asr_backends import DecodeOptions
+from .scheduler import Priority, scheduler_for
+
+
+class WarmupState:
+    """Tilstanden til ASR-oppvarmingen, slik den rapporteres i /health."""
+
+    def __init__(self):
+        self.state = "idle"  # idle | disabled | process | loading | warming | ready | unloaded | error
+        self.key: Optional[ModelKey] = None  # live-modellen som holdes varm
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+        self._since = time.monotonic()
+
+    def set(self, state: str):
+        self.state = state
+        self._since = time.monotonic()
+
+    @property
+    def ready(self) -> bool:
+        return self.state in {"ready", "disabled", "process"}
+
+    def as_dict(self) -> dict:
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "state_seconds": round(time.monotonic() - self._since, 1),
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "error": self.error,
+        }
+
+
+warmup_state = WarmupState()
+
+
+def warm_backend(backend, lang: str):
+    """Første generate() er treg (kjernevalg, allokator); ta den kostnaden med en dekoding av stillhet."""
+    silence = np.zeros(int(settings.sample_rate * settings.chunk_seconds), dtype=np.float32)
+    if settings.live_fast_decode and hasattr(backend, "enable_fast_decode"):
+        # Kompilerer den statiske dekoderen nå, med samme form som live-vinduene
+        backend.enable_fast_decode(live_token_budget())
+    # Gjennom inferenskøen: den kompilerte dekoderen tåler ikke at første live-dekoding kjører samtidig
+    options = DecodeOptions(lang, max_new_tokens=8, fast=settings.live_fast_decode)
+    scheduler_for(backend.device).run(backend, [silence], options, Priority.LIVE)
+
+
+def run_warmup():
+    """Laster live-modellen og kjører en dummy-dekoding på stillhet. Blokkerer."""
+    if not settings.asr_preload:
+        warmup_state.set("disabled")
+        return
+    if settings.live_asr_process:
+        # Live-modellen lastes og varmes opp i ASR-prosessen ved /start; en kopi her ville bare tatt plass
+        warmup_state.set("process")
+        print("[warmup] LIVE_ASR_PROCESS=1: live-modellen lastes i ASR-prosessen ved /start.")
+        return
+    try:
+        warmup_state.set("loading")
+        t0 = time.perf_counter()
+        lease = registry.acquire(settings.asr_model, pick_device(), settings.asr_precision, settings.asr_backend)
+        try:
+            warmup_state.load_seconds = round(time.perf_counter() - t0, 2)
+
+            warmup_state.set("warming")
+            t0 = time.perf_counter()
+            warm_backend(lease.backend, "no" if settings.default_lang == "nb" else settings.default_lang)
+            warmup_state.warmup_seconds = round(time.perf_counter() - t0, 2)
+            # Unntatt fra idle-TTL-en; kastes den likevel for å gi plass (LRU), varmer ensure_warm() den opp igjen
+            registry.keep_warm(lease.key)
+            warmup_state.key = lease.key
+        finally:
+            lease.release()
+        warmup_state.set("ready")
+        print(f"[warmup] ASR klar (lasting {warmup_state.load_seconds} s, oppvarming {warmup_state.warmup_seconds} s).")
+    except Exception as e:
+        warmup_state.error = str(e)
+        warmup_state.set("error")
+        print(f"[warmup] Oppvarming feilet: {e}")
+
+
+def ensure_warm():
+    """
+    Oppdaterer oppvarmingstilstanden fra registeret. Er live-modellen kastet
+    for å gi plass til en annen modell, rapporteres den som "unloaded", og
+    den lastes og varmes opp igjen i bakgrunnen så snart ingen andre modeller
+    er i bruk. Blokkerer ikke.
+    """
+    key = warmup_state.key
+    if key is None or warmup_state.state not in {"ready", "unloaded"} or registry.loaded(key):
+        return
+    if warmup_state.state == "ready":
+        print("[warmup] Live-modellen er lastet ut; varmes opp igjen når den får plass.")
+        warmup_state.set("unloaded")
+    if registry.in_use():
+        return
+    # Settes før tråden starter, så to kall ikke starter hver sin oppvarming
+    warmup_state.set("loading")
+    threading.Thread(target=run_warmup, daemon=True, name="warmup").start()
@@ -0,0 +1,184 @@
+# app/ws_fanout.py
+"""
+WebSocket-utsending til mange seere samtidig.
+
+Hver tilkobling har sin egen begrensede utkø og sin egen skriveoppgave, så
+en treg klient (OBS-maskin, mobil på dårlig wifi) bare forsinker seg selv.
+broadcast_text() legger den ferdig kodede teksten i alle køene og venter
+ikke på noen av dem; JSON-kodingen skjer én gang hos den som sender.
+
+Regler når en klient henger etter:
+
+1. Meldinger med en `coalesce`-nøkkel (foreløpige hypoteser, statuslinjer)
+   erstatter en eldre melding med samme nøkkel som ennå ikke er sendt. Den
+   gamle fjernes og den nye legges sist, så rekkefølgen mot endelige
+   segmenter holder. Klienten trenger bare den siste.
+2. Er køen full (WS_QUEUE_MAX), kastes den eldste meldingen med nøkkel.
+3. Er det ingen slik melding å kaste, ligger klienten bare endelige
+   segmenter etter. Har skriveoppgaven fått sendt noe det siste sekundet,
+   får køen vokse videre (opp til det dobbelte), så en rask serie
+   sendinger ikke kobler fra friske klienter. Ellers kobles klienten fra.
+   control.js kobler til igjen med
+   siste viste segment-id og får de nyere segmentene fra journalen; id-er
+   den allerede viser, hoppes over, så ingenting vises to ganger.
+4. En sending som står lenger enn WS_SEND_TIMEOUT, kobler også klienten fra.
+
+Forsinkelse (fra meldingen ble lagt i køen til den var sendt), antall
+sendte, slått sammen og kastede meldinger rapporteres per klient i stats().
+"""
+from __future__ import annotations
+
+import asyncio
+import itertools
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from fastapi import WebSocket
+
+# En klient som har fått sendt noe så nylig (sekunder), kobles ikke fra for full kø
+PROGRESS_GRACE = 1.0
+
+# (tekst, sammenslåingsnøkkel, tidspunkt lagt i kø)
+_Message = Tuple[str, Optional[str], float]
+
+
+class _Client:
+    def __init__(self, client_id: int, ws: WebSocket):
+        self.id = client_id
+        self.ws = ws
+        self.path = ws.url.path
+        self.connected_at = time.time()
+        self.queue: Deque[_Message] = deque()
+        self.wake = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        # Sist skriveoppgaven kom videre (tilkoblet eller fullført sending)
+        self.progress_at = time.perf_counter()
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+
+    def stats(self) -> dict:
+        oldest = self.queue[0][2] if self.queue else None
+        return {
+            "id": self.id,
+            "path": self.path,
+            "connected_seconds": round(time.time() - self.connected_at, 1),
+            "queued": len(self.queue),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "lag_ms": round(self.last_lag_ms, 1),
+            "max_lag_ms": round(self.max_lag_ms, 1),
+            "oldest_queued_ms": round((time.perf_counter() - oldest) * 1000, 1) if oldest else None,
+        }
+
+
+class WSFanout:
+    def __init__(self, max_queue: int = 64, send_timeout: float = 10.0):
+        self.max_queue = max(1, max_queue)
+        self.send_timeout = send_timeout
+        self._clients: Dict[WebSocket, _Client] = {}
+        self._ids = itertools.count(1)
+        self.disconnected_slow = 0
+        self._dropped_gone = 0  # kastet hos klienter som er koblet fra
+
+    async def connect(self, ws: WebSocket):
+        await ws.accept()
+        client = _Client(next(self._ids), ws)
+        client.task = asyncio.create_task(self._writer(client))
+        self._clients[ws] = client
+
+    def disconnect(self, ws: WebSocket):
+        client = self._clients.pop(ws, None)
+        if client is not None:
+            self._dropped_gone += client.dropped
+        if client is not None and client.task is not None and client.task is not asyncio.current_task():
+            client.task.cancel()
+
+    def send(self, ws: WebSocket, text: str, coalesce: Optional[str] = None):
+        """Legger en melding i køen til én klient."""
+        client = self._clients.get(ws)
+        if client is not None:
+            self._enqueue(client, text, coalesce)
+
+    async def broadcast_text(self, text: str, coalesce: Optional[str] = None):
+        """Legger meldingen i køen til alle klienter. Venter ikke på sendingen."""
+        for client in list(self._clients.values()):
+            self._enqueue(client, text, coalesce)
+        # Slipp til skriveoppgavene, så en rask serie sendinger ikke fyller køene
+        # før noen har fått sendt, og friske klienter kobles fra som trege
+        await asyncio.sleep(0)
+
+    def _enqueue(self, client: _Client, text: str, coalesce: Optional[str]):
+        q = client.queue
+        if coalesce is not None:
+            for i, (_, key, _) in enumerate(q):
+                if key == coalesce:
+                    del q[i]
+                    client.coalesced += 1
+                    break
+        if len(q) >= self.max_queue:
+            for i, (_, key, _) in enumerate(q):
+                if key is not None:
+                    del q[i]
+                    client.dropped += 1
+                    break
+            else:
+                if len(q) < 2 * self.max_queue and time.perf_counter() - client.progress_at < PROGRESS_GRACE:
+                    # Skriveren kommer videre; klienten er ikke hengt opp
+                    q.append((text, coalesce, time.perf_counter()))
+                    client.wake.set()
+                    return
+                # Bare endelige segmenter i køen; koble fra og la klienten ta igjen via journalen
+                client.dropped += len(q) + 1
+                self.disconnected_slow += 1
+                print(f"[ws] Klient {client.id} ({client.path}) henger {len(q)} meldinger etter; kobler fra")
+                self._drop_client(client)
+                return
+        q.append((text, coalesce, time.perf_counter()))
+        client.wake.set()
+
+    def _drop_client(self, client: _Client):
+        self.disconnect(client.ws)
+        asyncio.create_task(self._close(client.ws))
+
+    async def _close(self, ws: WebSocket):
+        try:
+            await ws.close(code=1013)  # "try again later"
+        except Exception:
+            pass
+
+    async def _writer(self, client: _Client):
+        try:
+            while True:
+                await client.wake.wait()
+                client.wake.clear()
+                while client.queue:
+                    text, _, queued_at = client.queue.popleft()
+                    await asyncio.wait_for(client.ws.send_text(text), timeout=self.send_timeout)
+                    client.sent += 1
+                    client.progress_at = time.perf_counter()
+                    client.last_lag_ms = (time.perf_counter() - queued_at) * 1000.0
+                    client.max_lag_ms = max(client.max_lag_ms, client.last_lag_ms)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            print(f"[ws] Sending til klient {client.id} ({client.path}) tok over {self.send_timeout:.0f} s; kobler fra")
+            self.disconnected_slow += 1
+            self._drop_client(client)
+        except Exception:
+            self.disconnect(client.ws)
+
+    def stats(self) -> dict:
+        clients = [c.stats() for c in self._clients.values()]
+        return {
+            "clients": len(clients),
+            "max_queue": self.max_queue,
+            "disconnected_slow": self.disconnected_slow,
+            "dropped": self._dropped_gone + sum(c["dropped"] for c in clients),
+            "max_lag_ms": max((c["max_lag_ms"] for c in clients), default=None),
+            "per_client": clients,
+        }